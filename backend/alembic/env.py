@@ -0,0 +1,51 @@
+# about env.py file:
+# alembic runs this for every migration command.
+# it migrates the database in app.core.db (DATABASE_URL), or the connection a
+# caller hands over in config.attributes["connection"] (scripts/db/migrate.py, tests).
+# target_metadata is the models, so `alembic revision --autogenerate` diffs them.
+
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.core.db import Base, engine
+import app.models.models  # noqa: F401  (registers the tables)
+
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    # `alembic upgrade head --sql`: print the sql instead of running it
+    context.configure(
+        url=str(engine.url),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,51 @@
+"""function_matches: cross-file function matches of a run
+
+create_tables.py kept running create_all while this landed, so a database
+may already have the table; it is then left alone.
+
+Revision ID: 01374baf6f16
+Revises: 6c1f0e2a9b41
+Create Date: 2026-10-19 09:10:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "01374baf6f16"
+down_revision: Union[str, None] = "6c1f0e2a9b41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def uuid_fk(name: str, target: str) -> sa.Column:
+    return sa.Column(name, postgresql.UUID(as_uuid=True), sa.ForeignKey(target, ondelete="CASCADE"), nullable=False)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "function_matches",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        uuid_fk("run_id", "runs.id"),
+        uuid_fk("file_a_id", "files.id"),
+        uuid_fk("file_b_id", "files.id"),
+        sa.Column("a_name", sa.Text(), nullable=False),
+        sa.Column("a_start", sa.Integer(), nullable=False),
+        sa.Column("a_end", sa.Integer(), nullable=False),
+        sa.Column("b_name", sa.Text(), nullable=False),
+        sa.Column("b_start", sa.Integer(), nullable=False),
+        sa.Column("b_end", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.Column("kind", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_function_matches_run_a_b", "function_matches", ["run_id", "file_a_id", "file_b_id"], if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("function_matches")
@@ -0,0 +1,41 @@
+"""run_artifacts: files produced by a run, such as its profiles
+
+create_tables.py kept running create_all while this landed, so a database
+may already have the table; it is then left alone.
+
+Revision ID: 100d88de1562
+Revises: 919266077724
+Create Date: 2026-10-19 09:36:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "100d88de1562"
+down_revision: Union[str, None] = "919266077724"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "run_artifacts",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column(
+            "run_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("runs.id", ondelete="CASCADE"), nullable=False
+        ),
+        sa.Column("kind", sa.Text(), nullable=False),
+        sa.Column("name", sa.Text(), nullable=False),
+        sa.Column("content", sa.LargeBinary(), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.UniqueConstraint("run_id", "kind", "name", name="uq_run_artifacts_run_kind_name"),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("run_artifacts")
@@ -0,0 +1,42 @@
+"""run_warnings: per-file warnings of a run, paged by seq
+
+create_tables.py kept running create_all while this landed, so a database
+may already have the table; it is then left alone.
+
+Revision ID: 1c040c743549
+Revises: 01374baf6f16
+Create Date: 2026-10-19 09:12:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "1c040c743549"
+down_revision: Union[str, None] = "01374baf6f16"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "run_warnings",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column(
+            "run_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("runs.id", ondelete="CASCADE"), nullable=False
+        ),
+        sa.Column("seq", sa.Integer(), nullable=False),
+        sa.Column("stage", sa.Text(), nullable=False),
+        sa.Column("path", sa.Text(), nullable=True),
+        sa.Column("reason", sa.Text(), nullable=False),
+        sa.Column("details", postgresql.JSONB(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        if_not_exists=True,
+    )
+    op.create_index("ix_run_warnings_run_seq", "run_warnings", ["run_id", "seq"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_table("run_warnings")
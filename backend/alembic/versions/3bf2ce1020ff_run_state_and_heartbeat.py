@@ -0,0 +1,44 @@
+"""runs.state_json and heartbeat_at, run_shards.started_at: resumable runs
+
+Pipeline state (checkpoints, progress) moves out of config_json into
+state_json; heartbeat_at and run_shards.started_at tell a live run from one
+whose worker was lost. create_tables.py kept running create_all while these
+landed, so a column may already exist; it is then left alone.
+
+Revision ID: 3bf2ce1020ff
+Revises: ef935ab46543
+Create Date: 2026-10-19 09:16:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "3bf2ce1020ff"
+down_revision: Union[str, None] = "ef935ab46543"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def add_column(table: str, column: sa.Column) -> None:
+    # ADD COLUMN IF NOT EXISTS is postgres-only; check the catalog instead
+    existing = {item["name"] for item in sa.inspect(op.get_bind()).get_columns(table)}
+    if column.name not in existing:
+        op.add_column(table, column)
+
+
+def upgrade() -> None:
+    # existing runs have no pipeline state yet
+    add_column("runs", sa.Column("state_json", postgresql.JSONB(), server_default=sa.text("'{}'"), nullable=False))
+    add_column("runs", sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True))
+    add_column("run_shards", sa.Column("started_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("run_shards") as batch:
+        batch.drop_column("started_at")
+    with op.batch_alter_table("runs") as batch:
+        batch.drop_column("heartbeat_at")
+        batch.drop_column("state_json")
@@ -0,0 +1,174 @@
+"""baseline: the tables scripts/db/create_tables.py created before migrations
+
+Databases created that way have no alembic_version table; scripts/db/migrate.py
+stamps them at this revision before upgrading.
+
+Revision ID: 6c1f0e2a9b41
+Revises:
+Create Date: 2026-10-19 09:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "6c1f0e2a9b41"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def uuid_pk() -> sa.Column:
+    return sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True)
+
+
+def uuid_fk(name: str, target: str) -> sa.Column:
+    return sa.Column(name, postgresql.UUID(as_uuid=True), sa.ForeignKey(target, ondelete="CASCADE"), nullable=False)
+
+
+def created_at(name: str = "created_at") -> sa.Column:
+    return sa.Column(name, sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "collections",
+        uuid_pk(),
+        sa.Column("owner_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("name", sa.Text(), nullable=False),
+        created_at(),
+        sa.UniqueConstraint("owner_id", "name", name="uq_collections_owner_name"),
+    )
+    op.create_table(
+        "datasets",
+        uuid_pk(),
+        uuid_fk("collection_id", "collections.id"),
+        sa.Column("name", sa.Text(), nullable=False),
+        created_at(),
+        sa.UniqueConstraint("collection_id", "name", name="uq_datasets_collection_name"),
+    )
+    op.create_index("ix_datasets_collection_id", "datasets", ["collection_id"])
+    op.create_table(
+        "submissions",
+        uuid_pk(),
+        uuid_fk("dataset_id", "datasets.id"),
+        sa.Column("student_label", sa.Text(), nullable=False),
+        created_at(),
+        sa.UniqueConstraint("dataset_id", "student_label", name="uq_submissions_dataset_student"),
+    )
+    op.create_index("ix_submissions_dataset_id", "submissions", ["dataset_id"])
+    op.create_table(
+        "files",
+        uuid_pk(),
+        uuid_fk("submission_id", "submissions.id"),
+        sa.Column("path", sa.Text(), nullable=False),
+        sa.Column("language", sa.Text(), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("content_hash", sa.Text(), nullable=False),
+        sa.Column("storage_key", sa.Text(), nullable=False),
+        sa.Column("content", sa.LargeBinary(), nullable=True),
+        created_at(),
+        sa.UniqueConstraint("submission_id", "path", name="uq_files_submission_path"),
+    )
+    op.create_index("ix_files_submission_id", "files", ["submission_id"])
+    op.create_index("ix_files_content_hash", "files", ["content_hash"])
+    op.create_table(
+        "runs",
+        uuid_pk(),
+        uuid_fk("dataset_id", "datasets.id"),
+        sa.Column("status", sa.Text(), nullable=False),
+        sa.Column("stage", sa.Text(), nullable=False),
+        sa.Column("progress_pct", sa.Integer(), nullable=False),
+        sa.Column("config_json", postgresql.JSONB(), nullable=False),
+        sa.Column("error_message", sa.Text(), nullable=True),
+        created_at(),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_runs_dataset_created_at", "runs", ["dataset_id", "created_at"])
+    op.create_index("ix_runs_dataset_id", "runs", ["dataset_id"])
+    op.create_table(
+        "file_fingerprints",
+        uuid_pk(),
+        uuid_fk("run_id", "runs.id"),
+        uuid_fk("file_id", "files.id"),
+        sa.Column("k", sa.Integer(), nullable=False),
+        sa.Column("w", sa.Integer(), nullable=False),
+        sa.Column("algo_version", sa.Text(), nullable=False),
+        sa.Column("fingerprint_blob", sa.LargeBinary(), nullable=False),
+        sa.Column("fingerprint_count", sa.Integer(), nullable=False),
+        created_at(),
+        sa.UniqueConstraint("run_id", "file_id", name="uq_file_fingerprints_run_file"),
+    )
+    op.create_index("ix_file_fingerprints_file_id", "file_fingerprints", ["file_id"])
+    op.create_index("ix_file_fingerprints_run_id", "file_fingerprints", ["run_id"])
+    op.create_table(
+        "candidate_pairs",
+        uuid_pk(),
+        uuid_fk("run_id", "runs.id"),
+        uuid_fk("file_a_id", "files.id"),
+        uuid_fk("file_b_id", "files.id"),
+        sa.Column("overlap_count", sa.Integer(), nullable=False),
+        sa.Column("fingerprint_score", sa.Float(), nullable=False),
+        created_at(),
+        sa.UniqueConstraint("run_id", "file_a_id", "file_b_id", name="uq_candidate_pairs_run_a_b"),
+    )
+    op.create_index("ix_candidate_pairs_run_id", "candidate_pairs", ["run_id"])
+    op.create_index("ix_candidate_pairs_run_score", "candidate_pairs", ["run_id", "fingerprint_score"])
+    op.create_table(
+        "pair_results",
+        uuid_pk(),
+        uuid_fk("run_id", "runs.id"),
+        uuid_fk("file_a_id", "files.id"),
+        uuid_fk("file_b_id", "files.id"),
+        sa.Column("final_score", sa.Float(), nullable=False),
+        sa.Column("fingerprint_score", sa.Float(), nullable=False),
+        sa.Column("ast_score", sa.Float(), nullable=False),
+        created_at(),
+        sa.UniqueConstraint("run_id", "file_a_id", "file_b_id", name="uq_pair_results_run_a_b"),
+    )
+    op.create_index("ix_pair_results_run_id", "pair_results", ["run_id"])
+    op.create_index("ix_pair_results_run_final_score", "pair_results", ["run_id", "final_score"])
+    op.create_table(
+        "match_evidence",
+        uuid_pk(),
+        uuid_fk("run_id", "runs.id"),
+        uuid_fk("file_a_id", "files.id"),
+        uuid_fk("file_b_id", "files.id"),
+        sa.Column("a_start", sa.Integer(), nullable=False),
+        sa.Column("a_end", sa.Integer(), nullable=False),
+        sa.Column("b_start", sa.Integer(), nullable=False),
+        sa.Column("b_end", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.Text(), nullable=False),
+        sa.Column("weight", sa.Float(), nullable=False),
+        created_at(),
+    )
+    op.create_index("ix_match_evidence_run_a_b", "match_evidence", ["run_id", "file_a_id", "file_b_id"])
+    op.create_table(
+        "run_reports",
+        uuid_pk(),
+        uuid_fk("run_id", "runs.id"),
+        sa.Column("csv_storage_key", sa.Text(), nullable=True),
+        sa.Column("pdf_storage_key", sa.Text(), nullable=True),
+        created_at("generated_at"),
+        sa.UniqueConstraint("run_id", name="uq_run_reports_run_id"),
+    )
+    op.create_index("ix_run_reports_run_id", "run_reports", ["run_id"])
+
+
+def downgrade() -> None:
+    for table in (
+        "run_reports",
+        "match_evidence",
+        "pair_results",
+        "candidate_pairs",
+        "file_fingerprints",
+        "runs",
+        "files",
+        "submissions",
+        "datasets",
+        "collections",
+    ):
+        op.drop_table(table)
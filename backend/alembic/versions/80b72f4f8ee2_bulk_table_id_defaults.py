@@ -0,0 +1,40 @@
+"""gen_random_uuid() id defaults for the tables written in bulk
+
+The pipeline writes file_fingerprints, candidate_pairs, pair_results,
+function_matches and match_evidence through chunked Core inserts. The models
+still give every row a Python-side uuid4 (SQLite has no uuid function), but
+on Postgres the columns now default to gen_random_uuid() as well, so loads
+that bypass the models (COPY, SQL scripts) can leave the id out.
+gen_random_uuid() is built in from Postgres 13.
+
+Revision ID: 80b72f4f8ee2
+Revises: e248d4bec524
+Create Date: 2026-10-19 09:42:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "80b72f4f8ee2"
+down_revision: Union[str, None] = "e248d4bec524"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BULK_TABLES = ("file_fingerprints", "candidate_pairs", "pair_results", "function_matches", "match_evidence")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for table in BULK_TABLES:
+        op.alter_column(table, "id", server_default=sa.text("gen_random_uuid()"))
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for table in BULK_TABLES:
+        op.alter_column(table, "id", server_default=None)
@@ -0,0 +1,53 @@
+"""run_score_bins and run_shards.score_bins: histogram of every compared pair
+
+Only pairs above the result floor are stored, so the score histogram over
+all compared pairs is kept per run (and per shard until the run finishes).
+create_tables.py kept running create_all while these landed, so a database
+may already have them; anything that exists is left alone.
+
+Revision ID: 885993f15bb4
+Revises: b47d93e15c08
+Create Date: 2026-10-19 09:32:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "885993f15bb4"
+down_revision: Union[str, None] = "b47d93e15c08"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def add_column(table: str, column: sa.Column) -> None:
+    # ADD COLUMN IF NOT EXISTS is postgres-only; check the catalog instead
+    existing = {item["name"] for item in sa.inspect(op.get_bind()).get_columns(table)}
+    if column.name not in existing:
+        op.add_column(table, column)
+
+
+def upgrade() -> None:
+    add_column("run_shards", sa.Column("score_bins", postgresql.JSONB(), nullable=True))
+    op.create_table(
+        "run_score_bins",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column(
+            "run_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("runs.id", ondelete="CASCADE"), nullable=False
+        ),
+        sa.Column("bin", sa.Integer(), nullable=False),
+        sa.Column("lower", sa.Float(), nullable=False),
+        sa.Column("upper", sa.Float(), nullable=False),
+        sa.Column("pair_count", sa.Integer(), nullable=False),
+        sa.Column("stored_count", sa.Integer(), nullable=False),
+        sa.UniqueConstraint("run_id", "bin", name="uq_run_score_bins_run_bin"),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("run_score_bins")
+    with op.batch_alter_table("run_shards") as batch:
+        batch.drop_column("score_bins")
@@ -0,0 +1,60 @@
+"""run_metrics: timing and throughput of each pipeline step of a run
+
+create_tables.py kept running create_all while this landed, so a database
+may already have the table, possibly from before it had a seq column; the
+table is then left alone and only the missing column is added.
+
+Revision ID: 919266077724
+Revises: 885993f15bb4
+Create Date: 2026-10-19 09:34:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "919266077724"
+down_revision: Union[str, None] = "885993f15bb4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def add_column(table: str, column: sa.Column) -> None:
+    # ADD COLUMN IF NOT EXISTS is postgres-only; check the catalog instead
+    existing = {item["name"] for item in sa.inspect(op.get_bind()).get_columns(table)}
+    if column.name not in existing:
+        op.add_column(table, column)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "run_metrics",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column(
+            "run_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("runs.id", ondelete="CASCADE"), nullable=False
+        ),
+        sa.Column("stage", sa.Text(), nullable=False),
+        sa.Column("step", sa.Text(), nullable=False),
+        sa.Column("seq", sa.Integer(), nullable=True),
+        sa.Column("wall_ms", sa.Float(), nullable=False),
+        sa.Column("cpu_ms", sa.Float(), nullable=False),
+        sa.Column("files", sa.Integer(), nullable=False),
+        sa.Column("pairs_considered", sa.BigInteger(), nullable=False),
+        sa.Column("pairs_scored", sa.BigInteger(), nullable=False),
+        sa.Column("pairs_persisted", sa.BigInteger(), nullable=False),
+        sa.Column("rows_written", sa.BigInteger(), nullable=False),
+        sa.Column("evidence_rows", sa.BigInteger(), nullable=False),
+        sa.Column("bytes_written", sa.BigInteger(), nullable=False),
+        sa.Column("details", postgresql.JSONB(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        if_not_exists=True,
+    )
+    # shard numbers moved out of details into their own column
+    add_column("run_metrics", sa.Column("seq", sa.Integer(), nullable=True))
+    op.create_index("ix_run_metrics_run_created_at", "run_metrics", ["run_id", "created_at"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_table("run_metrics")
@@ -0,0 +1,38 @@
+"""runs.priority: interactive runs are scheduled ahead of batch runs
+
+create_tables.py kept running create_all while this landed, so a database
+may already have the column and index; they are then left alone.
+
+Revision ID: b47d93e15c08
+Revises: 3bf2ce1020ff
+Create Date: 2026-10-19 09:30:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "b47d93e15c08"
+down_revision: Union[str, None] = "3bf2ce1020ff"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def add_column(table: str, column: sa.Column) -> None:
+    # ADD COLUMN IF NOT EXISTS is postgres-only; check the catalog instead
+    existing = {item["name"] for item in sa.inspect(op.get_bind()).get_columns(table)}
+    if column.name not in existing:
+        op.add_column(table, column)
+
+
+def upgrade() -> None:
+    # existing runs are batch runs
+    add_column("runs", sa.Column("priority", sa.Integer(), server_default="1", nullable=False))
+    op.create_index("ix_runs_status_priority", "runs", ["status", "priority", "created_at"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_runs_status_priority", table_name="runs")
+    with op.batch_alter_table("runs") as batch:
+        batch.drop_column("priority")
@@ -0,0 +1,38 @@
+"""run_metrics.db_queries and db_ms: SQL statements per step
+
+create_tables.py kept running create_all while these landed, so a column
+may already exist; it is then left alone.
+
+Revision ID: e248d4bec524
+Revises: e80e506ea3c8
+Create Date: 2026-10-19 09:40:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "e248d4bec524"
+down_revision: Union[str, None] = "e80e506ea3c8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def add_column(table: str, column: sa.Column) -> None:
+    # ADD COLUMN IF NOT EXISTS is postgres-only; check the catalog instead
+    existing = {item["name"] for item in sa.inspect(op.get_bind()).get_columns(table)}
+    if column.name not in existing:
+        op.add_column(table, column)
+
+
+def upgrade() -> None:
+    # rows recorded before this were not counted
+    add_column("run_metrics", sa.Column("db_queries", sa.Integer(), server_default="0", nullable=False))
+    add_column("run_metrics", sa.Column("db_ms", sa.Float(), server_default="0", nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("run_metrics") as batch:
+        batch.drop_column("db_ms")
+        batch.drop_column("db_queries")
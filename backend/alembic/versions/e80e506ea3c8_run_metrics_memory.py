@@ -0,0 +1,37 @@
+"""run_metrics.peak_rss_mb and traced_peak_mb: per-step memory
+
+create_tables.py kept running create_all while these landed, so a column
+may already exist; it is then left alone.
+
+Revision ID: e80e506ea3c8
+Revises: 100d88de1562
+Create Date: 2026-10-19 09:38:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "e80e506ea3c8"
+down_revision: Union[str, None] = "100d88de1562"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def add_column(table: str, column: sa.Column) -> None:
+    # ADD COLUMN IF NOT EXISTS is postgres-only; check the catalog instead
+    existing = {item["name"] for item in sa.inspect(op.get_bind()).get_columns(table)}
+    if column.name not in existing:
+        op.add_column(table, column)
+
+
+def upgrade() -> None:
+    add_column("run_metrics", sa.Column("peak_rss_mb", sa.Float(), nullable=True))
+    add_column("run_metrics", sa.Column("traced_peak_mb", sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("run_metrics") as batch:
+        batch.drop_column("traced_peak_mb")
+        batch.drop_column("peak_rss_mb")
@@ -0,0 +1,72 @@
+"""run_shards and file_ast_features: sharded pair comparison
+
+run_shards holds the blocks of the pair matrix compared by separate
+workers; file_ast_features keeps each file's AST features so shards don't
+re-parse. create_tables.py kept running create_all while these landed, so
+a database may already have them; anything that exists is left alone.
+
+Revision ID: ef935ab46543
+Revises: 1c040c743549
+Create Date: 2026-10-19 09:14:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "ef935ab46543"
+down_revision: Union[str, None] = "1c040c743549"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def uuid_pk() -> sa.Column:
+    return sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True)
+
+
+def uuid_fk(name: str, target: str) -> sa.Column:
+    return sa.Column(name, postgresql.UUID(as_uuid=True), sa.ForeignKey(target, ondelete="CASCADE"), nullable=False)
+
+
+def created_at() -> sa.Column:
+    return sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "run_shards",
+        uuid_pk(),
+        uuid_fk("run_id", "runs.id"),
+        sa.Column("seq", sa.Integer(), nullable=False),
+        sa.Column("language", sa.Text(), nullable=False),
+        sa.Column("row_file_ids", postgresql.JSONB(), nullable=False),
+        sa.Column("col_file_ids", postgresql.JSONB(), nullable=False),
+        sa.Column("status", sa.Text(), nullable=False),
+        sa.Column("pair_count", sa.Integer(), nullable=False),
+        created_at(),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.UniqueConstraint("run_id", "seq", name="uq_run_shards_run_seq"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_run_shards_run_status", "run_shards", ["run_id", "status"], if_not_exists=True)
+
+    op.create_table(
+        "file_ast_features",
+        uuid_pk(),
+        uuid_fk("run_id", "runs.id"),
+        uuid_fk("file_id", "files.id"),
+        sa.Column("algo_version", sa.Text(), nullable=False),
+        sa.Column("feature_blob", sa.LargeBinary(), nullable=False),
+        sa.Column("token_count", sa.Integer(), nullable=False),
+        created_at(),
+        sa.UniqueConstraint("run_id", "file_id", name="uq_file_ast_features_run_file"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_file_ast_features_run_id", "file_ast_features", ["run_id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_table("file_ast_features")
+    op.drop_table("run_shards")
@@ -15,21 +15,21 @@ from sqlalchemy.orm import Session
 # uuid is for generating and handling unique ids,
 
 import uuid
-# zipfile and io are for handling the uploaded zip files,
+# zipfile is for handling the uploaded zip files,
 import zipfile
-import io
-import hashlib
 # time to get the current timestamp
 import time
 import os
 from collections import Counter
+from contextlib import closing
 
 # this is a function that opens the database connection
 from app.core.db import get_db
 # these are like tables classes. each one of this classes maps to a table in postgreSQL
 from app.models.models import Collection, Dataset, Submission, File as FileModel
 from app.pipeline.ast.run_stage import infer_language_from_path
-from app.pipeline.upload.zip_utils import group_zip_files, zip_entry_skip_reason
+from app.pipeline.persist import bulk_insert
+from app.pipeline.upload.zip_utils import ZipTooLarge, read_zip_entries, scan_zip
 # the schemas are used to shape the data going in and out of API
 from app.schemas.collections import CollectionCreate, CollectionOut
 
@@ -38,9 +38,13 @@ router = APIRouter(prefix="/api/collections", tags=["collections"])
 
 # placeholder owner until real auth is added if we decided to do login and sign up
 PLACEHOLDER_OWNER = uuid.UUID("00000000-0000-0000-0000-000000000001")
-MAX_ZIP_BYTES = int(os.getenv("MAX_UPLOAD_ZIP_BYTES", str(25 * 1024 * 1024)))
+MAX_ZIP_BYTES = int(os.getenv("MAX_UPLOAD_ZIP_BYTES", str(200 * 1024 * 1024)))
 MAX_SOURCE_FILES = int(os.getenv("MAX_UPLOAD_SOURCE_FILES", "250"))
 MAX_SOURCE_FILE_BYTES = int(os.getenv("MAX_UPLOAD_SOURCE_FILE_BYTES", str(1 * 1024 * 1024)))
+# total uncompressed size of the source files read from one ZIP, so a small archive can't inflate without bound
+MAX_UNZIPPED_BYTES = int(os.getenv("MAX_UPLOAD_UNZIPPED_BYTES", str(100 * 1024 * 1024)))
+# file rows carry their content, so they are inserted in smaller batches than pipeline rows
+UPLOAD_INSERT_BATCH_SIZE = int(os.getenv("UPLOAD_INSERT_BATCH_SIZE", "100"))
 
 # this function is reusable mini function. it ask the database to find collection with this id, if nothing is found 404 error
 
@@ -50,13 +54,6 @@ def get_or_404(db: Session, collection_id: uuid.UUID) -> Collection:
     if not obj:
         raise HTTPException(status_code=404, detail="Collection not found")
     return obj
-def collect_zip_skip_summary(z: zipfile.ZipFile) -> list[dict[str, str]]:
-    skipped: list[dict[str, str]] = []
-    for path in z.namelist():
-        reason = zip_entry_skip_reason(path)
-        if reason and reason != "directory":
-            skipped.append({"path": path, "reason": reason})
-    return skipped
 
 
 def build_upload_warnings(
@@ -78,9 +75,11 @@ def build_upload_warnings(
 
 # this is also a helper function it takes the grouped files and saves them to the database note not the zip files but the files in the zip files
 def save_zip_to_db(db: Session, dataset_id: uuid.UUID, z: zipfile.ZipFile) -> dict:
-    """Create Submission + File rows from an open ZIP."""
-    skipped = collect_zip_skip_summary(z)
-    groups = group_zip_files(z.namelist())
+    """Create Submission + File rows from an open ZIP, without committing."""
+    try:
+        groups, skipped = scan_zip(z, max_entry_bytes=MAX_SOURCE_FILE_BYTES, max_total_bytes=MAX_UNZIPPED_BYTES)
+    except ZipTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
     source_paths = [path for paths in groups.values() for path in paths]
     if not source_paths:
         raise HTTPException(
@@ -98,29 +97,46 @@ def save_zip_to_db(db: Session, dataset_id: uuid.UUID, z: zipfile.ZipFile) -> di
             detail=f"Too many supported source files. Limit is {MAX_SOURCE_FILES}.",
         )
 
+    # ids are generated here so every row goes out in batched INSERTs; nothing is
+    # committed until the whole upload is in (see upload_zip)
+    submission_ids = {student: uuid.uuid4() for student in groups}
+    bulk_insert(
+        db,
+        Submission,
+        (
+            {"id": submission_id, "dataset_id": dataset_id, "student_label": student if student != "root" else "default"}
+            for student, submission_id in submission_ids.items()
+        ),
+        commit=False,
+    )
+
     stored_count = 0
     language_counts: Counter = Counter()
-    for student, paths in group_zip_files(z.namelist()).items():
-        sub = Submission(dataset_id=dataset_id, student_label=student if student != "root" else "default")
-        db.add(sub)
-        db.commit()
-        db.refresh(sub)
-        for fpath in paths:
-            data = z.read(fpath)
-            if len(data) > MAX_SOURCE_FILE_BYTES:
-                skipped.append({"path": fpath, "reason": f"file too large; limit is {MAX_SOURCE_FILE_BYTES} bytes"})
-                continue
-            rel = fpath if student == "root" else '/'.join(fpath.split('/')[1:])
-            language = infer_language_from_path(rel) or ""
-            db.add(FileModel(
-                submission_id=sub.id, path=rel, language=language,
-                size_bytes=len(data), content_hash=hashlib.sha256(data).hexdigest(),
-                storage_key=fpath, content=data,
-            ))
-            stored_count += 1
-            if language:
-                language_counts[language] += 1
-        db.commit()
+
+    def file_rows(entries):
+        nonlocal stored_count
+        for student, paths in groups.items():
+            for fpath in paths:
+                entry = next(entries)
+                data = entry.data
+                if data is None:
+                    skipped.append({"path": fpath, "reason": f"file too large; limit is {MAX_SOURCE_FILE_BYTES} bytes"})
+                    continue
+                rel = fpath if student == "root" else '/'.join(fpath.split('/')[1:])
+                language = infer_language_from_path(rel) or ""
+                yield {
+                    "id": uuid.uuid4(), "submission_id": submission_ids[student], "path": rel, "language": language,
+                    "size_bytes": len(data), "content_hash": entry.content_hash,
+                    "storage_key": fpath, "content": data,
+                }
+                stored_count += 1
+                if language:
+                    language_counts[language] += 1
+
+    # entries are decompressed and hashed ahead of us on a small thread pool, in source_paths order;
+    # closing() stops the pool as soon as anything below fails
+    with closing(read_zip_entries(z, source_paths, MAX_SOURCE_FILE_BYTES)) as entries:
+        bulk_insert(db, FileModel, file_rows(entries), batch_size=UPLOAD_INSERT_BATCH_SIZE, commit=False)
 
     if stored_count == 0:
         raise HTTPException(
@@ -199,28 +215,28 @@ def upload_zip(collection_id: uuid.UUID, file: UploadFile = File(...), db: Sessi
         raise HTTPException(status_code=400, detail="Only ZIP files allowed")
     base_name = os.path.splitext(file.filename)[0] or "dataset"
     dataset_name = f"{base_name}-{int(time.time())}"
-    dataset = Dataset(collection_id=collection_id, name=dataset_name)
-    db.add(dataset)
-    db.commit()
-    db.refresh(dataset)
+    # the dataset, its submissions and files are written in one transaction, so a failed upload leaves nothing behind
+    dataset_id = uuid.uuid4()
     try:
-        zip_bytes = file.file.read()
-        if len(zip_bytes) == 0:
+        # the upload is already spooled to a temp file, so read the zip from there instead of copying it into memory
+        zip_size = file.file.seek(0, os.SEEK_END)
+        file.file.seek(0)
+        if zip_size == 0:
             raise HTTPException(status_code=400, detail="Uploaded ZIP file is empty.")
-        if len(zip_bytes) > MAX_ZIP_BYTES:
+        if zip_size > MAX_ZIP_BYTES:
             raise HTTPException(status_code=400, detail=f"ZIP file is too large. Limit is {MAX_ZIP_BYTES} bytes.")
-        z = zipfile.ZipFile(io.BytesIO(zip_bytes))
-        summary = save_zip_to_db(db, dataset.id, z)
-        return {"message": "ZIP uploaded successfully", "dataset_id": dataset.id, **summary}
-    except zipfile.BadZipFile:
-        db.delete(dataset)
+        db.add(Dataset(id=dataset_id, collection_id=collection_id, name=dataset_name))
+        db.flush()
+        with zipfile.ZipFile(file.file) as z:
+            summary = save_zip_to_db(db, dataset_id, z)
         db.commit()
+        return {"message": "ZIP uploaded successfully", "dataset_id": dataset_id, **summary}
+    except zipfile.BadZipFile:
+        db.rollback()
         raise HTTPException(status_code=400, detail="Invalid or corrupted ZIP file.")
     except HTTPException:
-        db.delete(dataset)
-        db.commit()
+        db.rollback()
         raise
     except Exception as e:
-        db.delete(dataset)
-        db.commit()
+        db.rollback()
         raise HTTPException(status_code=400, detail=f"Upload failed: {str(e)}")
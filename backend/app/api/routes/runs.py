@@ -14,43 +14,59 @@
 
 
 import io
-import os
-import threading
 from collections import Counter
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import Response, StreamingResponse
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-from sqlalchemy.orm import Session
+from sqlalchemy import update
+from sqlalchemy.orm import Session, undefer
 
 from app.core.db import get_db
-from app.models.models import File, MatchEvidence, PairResult, Run, Submission
-from app.schemas.runs import MatchEvidenceOut, RunCreate, RunOut, SimilarityResultOut
-from app.tasks import run_pipeline
+from app.models.models import (
+    File,
+    FunctionMatch,
+    MatchEvidence,
+    PairResult,
+    Run,
+    RunArtifact,
+    RunMetric,
+    RunScoreBin,
+    RunWarning,
+    Submission,
+)
+from app.pipeline.histogram import resolve_result_floor
+from app.pipeline.profiling import COLLAPSED_KIND, PSTATS_KIND, merge_collapsed, merge_pstats
+from app.pipeline.status import RUN_STATE_KEYS
+from app.schemas.runs import (
+    FunctionMatchOut,
+    MatchEvidenceOut,
+    RunCreate,
+    RunMetricOut,
+    RunOut,
+    RunWarningOut,
+    ScoreBinOut,
+    ScoreHistogramOut,
+    SimilarityResultOut,
+)
+from app.scheduler import (
+    ACTIVE_RUN_STATUSES,
+    FINISHED_RUN_STATUSES,
+    RUN_DISPATCH_TIMEOUT_SECONDS,
+    cancel_is_pending,
+    cancel_runs,
+    heartbeat_is_stale,
+    run_priority,
+    schedule_runs,
+    shards_in_flight,
+)
 
 router = APIRouter(prefix="/api/runs", tags=["runs"])
 
 
-def start_run_job(run_id: str) -> None:
-    # In container/prod, queue with Celery + Redis.
-    # For local dev fallback, run directly in a background thread.
-    if os.getenv("USE_REDIS", "0") == "1":
-        try:
-            run_pipeline.delay(run_id)
-            return
-        except Exception:
-            pass
-
-    threading.Thread(
-        target=run_pipeline.run,
-        args=(run_id,),
-        daemon=True,
-    ).start()
-
-
 def get_risk_label(score: float) -> str:
     # map score to risk level
     if score >= 0.7:
@@ -71,6 +87,28 @@ def get_file_path_map(db: Session, pairs: List[PairResult]) -> dict[str, str]:
     return {str(file.id): file.path for file in files}
 
 
+def get_score_histogram(db: Session, run: Run) -> ScoreHistogramOut:
+    # every compared pair is counted here, including those below the floor
+    bins = db.query(RunScoreBin).filter(RunScoreBin.run_id == run.id).order_by(RunScoreBin.bin.asc()).all()
+    return ScoreHistogramOut(
+        floor=resolve_result_floor(run.config_json),
+        pairs_compared=sum(row.pair_count for row in bins),
+        pairs_stored=sum(row.stored_count for row in bins),
+        bins=[ScoreBinOut.model_validate(row) for row in bins],
+    )
+
+
+def risk_band_counts(histogram: ScoreHistogramOut, pairs: List[PairResult]) -> Counter:
+    # every compared pair, from the score histogram; the 0.05-wide bins line up
+    # with the risk cut-offs. Runs from before the histogram only have their stored pairs.
+    if not histogram.bins:
+        return Counter(get_risk_label(pair.final_score) for pair in pairs)
+    counts: Counter = Counter()
+    for score_bin in histogram.bins:
+        counts[get_risk_label(score_bin.lower)] += score_bin.pair_count
+    return counts
+
+
 def build_result_rows(pairs: List[PairResult], file_map: dict[str, str]) -> List[SimilarityResultOut]:
     # build api rows
     rows: List[SimilarityResultOut] = []
@@ -125,28 +163,32 @@ def validate_dataset_can_run(db: Session, dataset_id: UUID) -> None:
 
 @router.post("/", response_model=RunOut, status_code=status.HTTP_201_CREATED)
 def create_run(payload: RunCreate, db: Session = Depends(get_db)):
-    """Create a Run record and enqueue a background job."""
+    """Create a Run record and queue it; the scheduler starts it when a slot is free."""
     validate_dataset_can_run(db, payload.dataset_id)
+    if payload.supersede:
+        # the new run replaces whatever is still queued or running on the dataset
+        superseded = db.query(Run.id).filter(
+            Run.dataset_id == payload.dataset_id,
+            Run.status.notin_(FINISHED_RUN_STATUSES),
+        )
+        cancel_runs(db, [run_id for (run_id,) in superseded])
+
+    # pipeline state lives in state_json; a client can't seed it through the config
+    config = {key: value for key, value in (payload.config_json or {}).items() if key not in RUN_STATE_KEYS}
     run = Run(
         dataset_id=payload.dataset_id,
         status="QUEUED",
         stage="INGEST",
         progress_pct=0,
-        config_json=payload.config_json or {},
+        priority=run_priority(db, payload.dataset_id, config),
+        config_json=config,
     )
     db.add(run)
     db.commit()
-    db.refresh(run)
-
-    try:
-        # start analysis job
-        start_run_job(str(run.id))
-    except Exception as exc:
-        # save startup error
-        run.status = "FAILED"
-        run.error_message = f"Failed to start pipeline: {exc}"
-        db.commit()
 
+    # start analysis job if the caps allow it
+    schedule_runs(db)
+    db.refresh(run)
     return run
 
 
@@ -154,17 +196,157 @@ def create_run(payload: RunCreate, db: Session = Depends(get_db)):
 def get_run(run_id: UUID, db: Session = Depends(get_db)):
     """Return job status for a run."""
     # get run status
+    run = db.query(Run).options(undefer(Run.warning_count)).filter(Run.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+
+@router.post("/{run_id}/resume", response_model=RunOut)
+def resume_run(run_id: UUID, force: bool = False, db: Session = Depends(get_db)):
+    """
+    Re-queue a failed or cancelled run. Checkpointed steps and finished
+    shards are skipped; `force` also resumes a run stuck in SCHEDULED or
+    RUNNING, but only once its heartbeat is stale (its worker was lost). A
+    SCHEDULED run is still waiting in the worker queue, so it only counts as
+    lost after RUN_DISPATCH_TIMEOUT_SECONDS.
+    """
+    run = db.query(Run).filter(Run.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.status in ACTIVE_RUN_STATUSES:
+        if not force:
+            raise HTTPException(status_code=409, detail=f"Run cannot be resumed from {run.status}")
+        if run.status == "SCHEDULED":
+            if not heartbeat_is_stale(run.heartbeat_at, timeout_seconds=RUN_DISPATCH_TIMEOUT_SECONDS):
+                raise HTTPException(status_code=409, detail="Run is still waiting for a worker")
+        elif not heartbeat_is_stale(run.heartbeat_at):
+            raise HTTPException(status_code=409, detail="Run is still active; its worker wrote a heartbeat recently")
+        if shards_in_flight(db, run.id):
+            # resuming would send these shards again while they are still running
+            raise HTTPException(status_code=409, detail="Run still has comparison shards in progress")
+    elif run.status not in ("FAILED", "CANCELLED"):
+        raise HTTPException(status_code=409, detail=f"Run cannot be resumed from {run.status}")
+    elif cancel_is_pending(run.status, run.finished_at, run.heartbeat_at):
+        # its worker would carry on writing to the re-queued run
+        raise HTTPException(status_code=409, detail="Run is still stopping; its worker has not confirmed the cancel")
+
+    # only re-queue the state that was checked; a worker writing meanwhile wins
+    heartbeat = Run.heartbeat_at.is_(None) if run.heartbeat_at is None else Run.heartbeat_at == run.heartbeat_at
+    requeued = db.execute(
+        update(Run)
+        .where(Run.id == run.id, Run.status == run.status, heartbeat)
+        .values(status="QUEUED", error_message=None, finished_at=None)
+    )
+    db.commit()
+    if requeued.rowcount != 1:
+        raise HTTPException(status_code=409, detail="Run changed while it was being resumed")
+
+    schedule_runs(db)
+    db.refresh(run)
+    return run
+
+
+@router.post("/{run_id}/cancel", response_model=RunOut)
+def cancel_run(run_id: UUID, db: Session = Depends(get_db)):
+    """
+    Cancel a queued or running run. A running pipeline stops at its next
+    status write and then sets finished_at; results written so far are kept
+    and the run can be resumed.
+    """
     run = db.query(Run).filter(Run.id == run_id).first()
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
+    if run.status in FINISHED_RUN_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Run is already {run.status}")
+
+    cancel_runs(db, [run.id])
+    db.refresh(run)
     return run
 
 
+@router.get("/{run_id}/warnings", response_model=List[RunWarningOut])
+def get_run_warnings(
+    run_id: UUID,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    stage: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Return one page of the warnings recorded for a run, in the order they were raised."""
+    run = db.query(Run).filter(Run.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    query = db.query(RunWarning).filter(RunWarning.run_id == run_id)
+    if stage:
+        query = query.filter(RunWarning.stage == stage.upper())
+    return query.order_by(RunWarning.seq.asc()).offset(offset).limit(limit).all()
+
+
+@router.get("/{run_id}/metrics", response_model=List[RunMetricOut])
+def get_run_metrics(run_id: UUID, db: Session = Depends(get_db)):
+    """Return the timing and throughput of each pipeline step of a run, in the order they finished."""
+    run = db.query(Run).filter(Run.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    rows = db.query(RunMetric).filter(RunMetric.run_id == run_id).order_by(RunMetric.created_at.asc()).all()
+    metrics: List[RunMetricOut] = []
+    for row in rows:
+        seconds = row.wall_ms / 1000
+        metric = RunMetricOut.model_validate(row)
+        if seconds > 0:
+            metric.files_per_sec = round(row.files / seconds, 2) if row.files else None
+            metric.pairs_per_sec = round(row.pairs_scored / seconds, 2) if row.pairs_scored else None
+        metrics.append(metric)
+    return metrics
+
+
+@router.get("/{run_id}/profile")
+def download_run_profile(
+    run_id: UUID,
+    format: str = Query("pstats", pattern="^(pstats|collapsed)$"),
+    db: Session = Depends(get_db),
+):
+    """
+    Download the profile of a run created with config_json["profile"].
+    `pstats` opens with `python -m pstats` or snakeviz; `collapsed` is one
+    stack per line for flamegraph.pl or speedscope. The pipeline task and
+    every compare shard are merged into one file.
+    """
+    run = db.query(Run).filter(Run.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    kind = PSTATS_KIND if format == "pstats" else COLLAPSED_KIND
+    artifacts = (
+        db.query(RunArtifact)
+        .filter(RunArtifact.run_id == run_id, RunArtifact.kind == kind)
+        .order_by(RunArtifact.name.asc())
+        .all()
+    )
+    if not artifacts:
+        raise HTTPException(status_code=404, detail="Run has no profile")
+
+    blobs = [artifact.content for artifact in artifacts]
+    if format == "pstats":
+        content, media_type, filename = merge_pstats(blobs), "application/octet-stream", f"run-{run_id}.pstats"
+    else:
+        content, media_type, filename = merge_collapsed(blobs), "text/plain", f"run-{run_id}.collapsed.txt"
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
 @router.get("/dataset/{dataset_id}/history", response_model=List[RunOut])
 def get_dataset_run_history(dataset_id: UUID, db: Session = Depends(get_db)):
     """Return all runs for a dataset, sorted by created_at descending."""
     runs = (
         db.query(Run)
+        .options(undefer(Run.warning_count))
         .filter(Run.dataset_id == dataset_id)
         .order_by(Run.created_at.desc())
         .all()
@@ -177,6 +359,8 @@ def get_run_results(run_id: UUID, db: Session = Depends(get_db)):
     """
     Return similarity results for a completed run.
     Each row represents one file pair with a similarity score and risk label.
+    Only pairs at or above the run's result floor are stored; the rest are
+    counted in /results/histogram.
     """
     # check run
     run = db.query(Run).filter(Run.id == run_id).first()
@@ -195,6 +379,18 @@ def get_run_results(run_id: UUID, db: Session = Depends(get_db)):
     return build_result_rows(pairs, file_map)
 
 
+@router.get("/{run_id}/results/histogram", response_model=ScoreHistogramOut)
+def get_run_histogram(run_id: UUID, db: Session = Depends(get_db)):
+    """Return the final-score histogram over every compared pair of a finished run."""
+    run = db.query(Run).filter(Run.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.status not in ("DONE", "FAILED"):
+        raise HTTPException(status_code=409, detail="Run is not finished yet")
+
+    return get_score_histogram(db, run)
+
+
 @router.get("/{run_id}/results/{pair_id}/evidence", response_model=List[MatchEvidenceOut])
 def get_pair_evidence(run_id: UUID, pair_id: UUID, db: Session = Depends(get_db)):
     """Return saved evidence rows for one result pair."""
@@ -212,7 +408,7 @@ def get_pair_evidence(run_id: UUID, pair_id: UUID, db: Session = Depends(get_db)
             MatchEvidence.run_id == run_id,
             MatchEvidence.file_a_id == pair.file_a_id,
             MatchEvidence.file_b_id == pair.file_b_id,
-            MatchEvidence.kind == "AST",
+            MatchEvidence.kind.in_(("AST", "CLONE")),
         )
         .order_by(MatchEvidence.kind.asc(), MatchEvidence.weight.desc(), MatchEvidence.created_at.asc())
         .all()
@@ -220,6 +416,29 @@ def get_pair_evidence(run_id: UUID, pair_id: UUID, db: Session = Depends(get_db)
     return evidence_rows
 
 
+@router.get("/{run_id}/results/{pair_id}/functions", response_model=List[FunctionMatchOut])
+def get_pair_function_matches(run_id: UUID, pair_id: UUID, db: Session = Depends(get_db)):
+    """Return function-to-function matches for one result pair."""
+    run = db.query(Run).filter(Run.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    pair = db.query(PairResult).filter(PairResult.id == pair_id, PairResult.run_id == run_id).first()
+    if not pair:
+        raise HTTPException(status_code=404, detail="Pair result not found")
+
+    return (
+        db.query(FunctionMatch)
+        .filter(
+            FunctionMatch.run_id == run_id,
+            FunctionMatch.file_a_id == pair.file_a_id,
+            FunctionMatch.file_b_id == pair.file_b_id,
+        )
+        .order_by(FunctionMatch.score.desc(), FunctionMatch.a_start.asc())
+        .all()
+    )
+
+
 @router.get("/{run_id}/export-pdf")
 def export_run_report_pdf(run_id: UUID, db: Session = Depends(get_db)):
     """Return a PDF summary report for a completed run."""
@@ -231,6 +450,7 @@ def export_run_report_pdf(run_id: UUID, db: Session = Depends(get_db)):
 
     pairs = db.query(PairResult).filter(PairResult.run_id == run_id).all()
     file_map = get_file_path_map(db, pairs)
+    histogram = get_score_histogram(db, run)
 
     buffer = io.BytesIO()
     pdf = canvas.Canvas(buffer, pagesize=letter)
@@ -253,19 +473,42 @@ def export_run_report_pdf(run_id: UUID, db: Session = Depends(get_db)):
     y -= 30
 
     total_pairs = len(pairs)
-    high_count = sum(1 for pair in pairs if pair.final_score >= 0.7)
-    medium_count = sum(1 for pair in pairs if 0.4 <= pair.final_score < 0.7)
-    low_count = total_pairs - high_count - medium_count
+    bands = risk_band_counts(histogram, pairs)
 
     pdf.setFont("Helvetica-Bold", 12)
-    pdf.drawString(margin, y, f"Total pairs: {total_pairs}")
+    pdf.drawString(margin, y, f"Total pairs: {sum(bands.values())}")
     y -= 18
     pdf.setFont("Helvetica", 11)
-    pdf.drawString(margin, y, f"High risk: {high_count}")
-    pdf.drawString(width / 2, y, f"Medium risk: {medium_count}")
-    pdf.drawString(width - 150, y, f"Low risk: {low_count}")
+    pdf.drawString(margin, y, f"High risk: {bands['HIGH']}")
+    pdf.drawString(width / 2, y, f"Medium risk: {bands['MEDIUM']}")
+    pdf.drawString(width - 150, y, f"Low risk: {bands['LOW']}")
     y -= 30
 
+    # pairs below the floor are not listed, only counted
+    pdf.setFont("Helvetica-Bold", 12)
+    pdf.drawString(margin, y, "Score distribution")
+    y -= 18
+    pdf.setFont("Helvetica", 10)
+    pdf.drawString(
+        margin,
+        y,
+        f"Pairs compared: {histogram.pairs_compared}    "
+        f"Listed (score >= {histogram.floor * 100:.0f}%): {histogram.pairs_stored}",
+    )
+    y -= 16
+    for score_bin in histogram.bins:
+        if not score_bin.pair_count:
+            continue
+        if y < margin + 40:
+            pdf.showPage()
+            y = height - margin
+            pdf.setFont("Helvetica", 10)
+        pdf.drawString(margin, y, f"{score_bin.lower * 100:.0f}% - {score_bin.upper * 100:.0f}%")
+        pdf.drawString(margin + 120, y, f"{score_bin.pair_count} pairs")
+        pdf.drawString(margin + 220, y, f"{score_bin.stored_count} listed")
+        y -= 14
+    y -= 16
+
     if total_pairs == 0:
         pdf.drawString(margin, y, "No similarity pairs were generated for this run.")
     else:
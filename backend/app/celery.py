@@ -12,8 +12,17 @@ from celery import Celery
 # Use in-memory broker for local development (no Redis needed).
 # Set USE_REDIS=1 to enable Redis if available.
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-BROKER = REDIS_URL if os.getenv("USE_REDIS", "0") == "1" else "memory://"
-BACKEND = REDIS_URL if os.getenv("USE_REDIS", "0") == "1" else "cache+memory://"
+USE_REDIS = os.getenv("USE_REDIS", "0") == "1"
+BROKER = REDIS_URL if USE_REDIS else "memory://"
+BACKEND = REDIS_URL if USE_REDIS else "cache+memory://"
+
+# One queue per kind of work so preparation, shard comparison and run
+# finalisation can be given their own workers and concurrency. Small runs
+# are sent to the interactive queue instead of prepare (see scheduler.py).
+INTERACTIVE_QUEUE = os.getenv("CELERY_INTERACTIVE_QUEUE", "interactive")
+PREPARE_QUEUE = os.getenv("CELERY_PREPARE_QUEUE", "prepare")
+COMPARE_QUEUE = os.getenv("CELERY_COMPARE_QUEUE", "compare")
+PERSIST_QUEUE = os.getenv("CELERY_PERSIST_QUEUE", "persist")
 
 celery_app = Celery(
     "plagiarism_jobs",
@@ -29,4 +38,11 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
+    task_default_queue=PREPARE_QUEUE,
+    task_routes={
+        "run_pipeline": {"queue": PREPARE_QUEUE},
+        "compare_shard": {"queue": COMPARE_QUEUE},
+        "finalize_run": {"queue": PERSIST_QUEUE},
+        "fail_run": {"queue": PERSIST_QUEUE},
+    },
 )
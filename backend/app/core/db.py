@@ -4,11 +4,22 @@
 # It also loads the database url, so tha app can connect to Neoo or SQlite
 # ALmost all backend files relies/ depens on this file.
 # without this file collections, datasets, files, runs apis will not work because they all need to connect to the database to store and retrieve data.
+# It also counts and times every sql statement (engine events below) for the
+# http request or pipeline step that runs it, see track_queries.
 
 
+import heapq
 import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 load_dotenv()
@@ -17,12 +28,120 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     DATABASE_URL = "sqlite:///./test.db"  # fallback for testing
 
+# Slowest statements kept per request / step.
+SQL_SLOWEST_STATEMENTS = int(os.getenv("SQL_SLOWEST_STATEMENTS", "5"))
+# A statement run this many times in one request / step is flagged (N+1).
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "10"))
+# Execution option for statements that repeat by design (throttled status
+# writes): they are still counted and timed, but never reported as N+1.
+REPEATS_EXPECTED = "repeats_expected"
+# Dev mode: add X-DB-* query stats headers to every api response.
+SQL_STATS_HEADERS = os.getenv("SQL_STATS_HEADERS", "0") == "1"
+
 engine = create_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|\$\d+|(?<!:):\w+|\?")
+_PLACEHOLDER_LIST = re.compile(r"\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))*")
+
+
+def normalize_statement(statement: str) -> str:
+    # one shape per statement: IN lists and multi-row VALUES of any length look the same
+    statement = " ".join(_PLACEHOLDER.sub("?", statement).split())
+    return _PLACEHOLDER_LIST.sub("(?)", statement)
+
+
+@dataclass
+class QueryStats:
+    """SQL statements run inside one track_queries block."""
+
+    count: int = 0
+    total_ms: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+    expected_repeats: set = field(default_factory=set)
+    _slowest: list = field(default_factory=list)
+
+    def record(self, statement: str, elapsed_ms: float, repeats_expected: bool = False) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        shape = normalize_statement(statement)
+        self.statements[shape] += 1
+        if repeats_expected:
+            self.expected_repeats.add(shape)
+        entry = (elapsed_ms, self.count, shape)
+        if len(self._slowest) < SQL_SLOWEST_STATEMENTS:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    def slowest(self) -> list[dict]:
+        return [
+            {"ms": round(elapsed_ms, 3), "statement": shape[:500]}
+            for elapsed_ms, _, shape in sorted(self._slowest, reverse=True)
+        ]
+
+    def repeated(self, threshold: int = SQL_REPEAT_THRESHOLD) -> list[dict]:
+        """
+        Statements run `threshold` or more times, usually a query inside a
+        loop. Batched INSERTs and statements run with the REPEATS_EXPECTED
+        execution option repeat by design and are left out.
+        """
+        return [
+            {"count": count, "statement": shape[:500]}
+            for shape, count in self.statements.most_common()
+            if count >= threshold
+            and shape not in self.expected_repeats
+            and not shape.upper().startswith("INSERT")
+        ]
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Attribute the statements run inside the block (same thread or task) to one QueryStats."""
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["statement_started"].pop()
+    stats = _query_stats.get()
+    if stats is not None:
+        expected = context is not None and context.execution_options.get(REPEATS_EXPECTED, False)
+        stats.record(statement, (time.perf_counter() - started) * 1000, repeats_expected=expected)
+
+
+def _drop_statement_timer(context):
+    # a failed statement never reaches after_cursor_execute
+    started = context.connection.info.get("statement_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(target) -> None:
+    """Report every statement run on `target` to the active track_queries block."""
+    event.listen(target, "before_cursor_execute", _start_statement_timer)
+    event.listen(target, "after_cursor_execute", _record_statement)
+    event.listen(target, "handle_error", _drop_statement_timer)
+
+
+instrument_engine(engine)
+
+
 def get_db():
     db = SessionLocal()
     try:
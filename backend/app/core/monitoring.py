@@ -0,0 +1,152 @@
+# about monitoring.py file:
+# this file defines the prometheus metrics served at /api/metrics.
+# the api records request latency, the celery workers record parse times,
+# pair comparisons, evidence rows and step durations (see pipeline/metrics.py).
+# api and workers are separate processes (and containers), so with
+# PROMETHEUS_MULTIPROC_DIR set every process writes its samples to files in that
+# directory. each container gets its own directory under a shared volume
+# (PROMETHEUS_METRICS_ROOT) because pids repeat across containers (each main
+# process is pid 1); the api merges every directory when it is scraped.
+# run queue gauges are read from the database at scrape time.
+
+import glob
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models.models import Run
+
+
+# This container's directory for multi-process collection; must be set before
+# the first metric is created, in the api and in every worker, and emptied when
+# the container starts (start.sh, worker.sh).
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+# Shared volume holding one PROMETHEUS_MULTIPROC_DIR per container; the api
+# reads all of them. Unset, only this container's directory is read.
+PROMETHEUS_METRICS_ROOT = os.getenv("PROMETHEUS_METRICS_ROOT", "")
+
+RUN_STATUSES = ("QUEUED", "SCHEDULED", "RUNNING", "DONE", "FAILED", "CANCELLED")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "API request latency by route template",
+    ["method", "route", "status"],
+)
+PARSE_SECONDS = Histogram(
+    "pipeline_parse_seconds",
+    "Time to parse one file and build its AST features",
+    ["language"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Wall time of one pipeline step",
+    ["stage", "step"],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+PAIRS_SCORED = Counter(
+    "pipeline_pair_comparisons_total",
+    "File pairs scored, after candidate filtering",
+    ["step"],
+)
+EVIDENCE_ROWS = Counter(
+    "pipeline_evidence_rows_total",
+    "match_evidence rows written",
+    ["step"],
+)
+# worker utilisation = sum(celery_worker_busy) / sum(celery_worker_processes)
+WORKER_PROCESSES = Gauge(
+    "celery_worker_processes",
+    "Celery worker processes alive",
+    multiprocess_mode="livesum",
+)
+WORKER_BUSY = Gauge(
+    "celery_worker_busy",
+    "Celery worker processes currently running a task",
+    ["task"],
+    multiprocess_mode="livesum",
+)
+
+
+def observe_stage(metric) -> None:
+    """Export a finished pipeline step (a pipeline.metrics.StageMetric)."""
+    STAGE_SECONDS.labels(metric.stage, metric.step).observe(metric.wall_ms / 1000)
+    if metric.pairs_scored:
+        PAIRS_SCORED.labels(metric.step).inc(metric.pairs_scored)
+    if metric.evidence_rows:
+        EVIDENCE_ROWS.labels(metric.step).inc(metric.evidence_rows)
+
+
+@contextmanager
+def time_parse(language: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        PARSE_SECONDS.labels(language or "unknown").observe(time.perf_counter() - started)
+
+
+class RunQueueCollector:
+    """Runs per status, read from the database when /api/metrics is scraped."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def collect(self):
+        counts = dict(self.db.execute(select(Run.status, func.count(Run.id)).group_by(Run.status)).all())
+        family = GaugeMetricFamily("plagiarism_runs", "Runs by status", labels=["status"])
+        for run_status in RUN_STATUSES:
+            family.add_metric([run_status], counts.get(run_status, 0))
+        yield family
+
+
+class ContainerMetricsCollector:
+    """Samples of every process in every container, merged as one multiprocess directory."""
+
+    def __init__(self, root: str, own_dir: str):
+        self.root = root
+        self.own_dir = own_dir
+
+    def files(self) -> list[str]:
+        if self.root:
+            return sorted(glob.glob(os.path.join(self.root, "*", "*.db")))
+        return sorted(glob.glob(os.path.join(self.own_dir, "*.db")))
+
+    def collect(self):
+        from prometheus_client import multiprocess
+
+        return multiprocess.MultiProcessCollector.merge(self.files(), accumulate=True)
+
+
+def render_metrics(db: Session) -> tuple[bytes, str]:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        registry.register(ContainerMetricsCollector(PROMETHEUS_METRICS_ROOT, PROMETHEUS_MULTIPROC_DIR))
+    else:
+        registry = REGISTRY
+    queue_registry = CollectorRegistry()
+    queue_registry.register(RunQueueCollector(db))
+    return generate_latest(registry) + generate_latest(queue_registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_process_dead(pid: int) -> None:
+    # drop the live gauges of a worker process that exited; pids are only
+    # unique within a container, so this touches this container's directory only
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
@@ -7,14 +7,20 @@
 # without this code file routes files will exists but the app would not expoase them to the frontend
 
 
-from fastapi import FastAPI, Depends
+import logging
+import time
+
+from fastapi import FastAPI, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
-from app.core.db import get_db
+from app.core.db import SQL_STATS_HEADERS, get_db, track_queries
+from app.core.monitoring import REQUEST_LATENCY, render_metrics
 from app.api import router as api_router
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Explainable Code Plagiarism Detection",
     description="Backend API for code plagiarism detection",
@@ -31,6 +37,36 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # label by route template (/api/runs/{run_id}), not by the concrete path
+    route = request.scope.get("route")
+    REQUEST_LATENCY.labels(
+        request.method,
+        getattr(route, "path", "unmatched"),
+        str(response.status_code),
+    ).observe(time.perf_counter() - started)
+    return response
+
+
+@app.middleware("http")
+async def record_request_queries(request: Request, call_next):
+    # sql statements run while handling the request, see app.core.db
+    with track_queries() as stats:
+        response = await call_next(request)
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    logger.debug("%s %s: %d queries, %.1f ms", request.method, route, stats.count, stats.total_ms)
+    for repeated in stats.repeated():
+        logger.warning("%s %s ran %dx: %s", request.method, route, repeated["count"], repeated["statement"])
+    if SQL_STATS_HEADERS:
+        response.headers["X-DB-Query-Count"] = str(stats.count)
+        response.headers["X-DB-Time-Ms"] = f"{stats.total_ms:.1f}"
+        response.headers["X-DB-Repeated-Statements"] = str(len(stats.repeated()))
+    return response
+
+
 @app.get("/api/health")
 def health():
     """Health check endpoint"""
@@ -44,6 +80,13 @@ def db_test(db: Session = Depends(get_db)):
     return {"db": result.scalar()}
 
 
+@app.get("/api/metrics", include_in_schema=False)
+def metrics(db: Session = Depends(get_db)):
+    """Prometheus metrics for the api, the workers and the run queue"""
+    body, content_type = render_metrics(db)
+    return Response(content=body, media_type=content_type)
+
+
 # Include all API routers
 app.include_router(api_router)
 
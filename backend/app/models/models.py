@@ -9,9 +9,11 @@
 import uuid
 from sqlalchemy import (
     Column, String, Integer, Float, Text, ForeignKey,
-    DateTime, UniqueConstraint, Index, LargeBinary
+    DateTime, UniqueConstraint, Index, LargeBinary, BigInteger
 )
+from sqlalchemy import select
 from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.orm import column_property
 from sqlalchemy.sql import func
 from app.core.db import Base
 
@@ -94,22 +96,31 @@ class Run(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     dataset_id = Column(UUID(as_uuid=True), ForeignKey("datasets.id", ondelete="CASCADE"), nullable=False)
-    status = Column(Text, nullable=False)  # QUEUED, RUNNING, DONE, FAILED
+    status = Column(Text, nullable=False)  # QUEUED, SCHEDULED, RUNNING, DONE, FAILED, CANCELLED
     stage = Column(Text, nullable=False)   # INGEST, TOKENS, AST, REPORT
     progress_pct = Column(Integer, nullable=False, default=0)
+    priority = Column(Integer, nullable=False, default=1)  # 0 interactive, 1 batch
     config_json = Column(JSONB, nullable=False, default=dict)
+    # written by the pipeline only: checkpoints, checkpoint_warnings, progress, undecoded_files
+    state_json = Column(JSONB, nullable=False, default=dict)
     error_message = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     started_at = Column(DateTime(timezone=True), nullable=True)
     finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # scheduled, then every status write
 
     @property
     def completed_at(self):
         return self.finished_at
 
+    @property
+    def progress(self):
+        return (self.state_json or {}).get("progress")
+
     __table_args__ = (
         Index("ix_runs_dataset_created_at", "dataset_id", "created_at"),
         Index("ix_runs_dataset_id", "dataset_id"),
+        Index("ix_runs_status_priority", "status", "priority", "created_at"),
     )
 
 
@@ -185,7 +196,7 @@ class MatchEvidence(Base):
     a_end = Column(Integer, nullable=False)
     b_start = Column(Integer, nullable=False)
     b_end = Column(Integer, nullable=False)
-    kind = Column(Text, nullable=False)  # TOKEN, AST
+    kind = Column(Text, nullable=False)  # TOKEN, AST, CLONE
     weight = Column(Float, nullable=False, default=1.0)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
@@ -210,6 +221,163 @@ class RunReport(Base):
     )
 
 
+# 11) function_matches (function/method units matched across files)
+class FunctionMatch(Base):
+    __tablename__ = "function_matches"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    run_id = Column(UUID(as_uuid=True), ForeignKey("runs.id", ondelete="CASCADE"), nullable=False)
+    file_a_id = Column(UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    file_b_id = Column(UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    a_name = Column(Text, nullable=False)
+    a_start = Column(Integer, nullable=False)
+    a_end = Column(Integer, nullable=False)
+    b_name = Column(Text, nullable=False)
+    b_start = Column(Integer, nullable=False)
+    b_end = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    kind = Column(Text, nullable=False)  # EXACT, NGRAM
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_function_matches_run_a_b", "run_id", "file_a_id", "file_b_id"),
+    )
+
+
+# 12) run_warnings (per-file problems recorded while a run is processed)
+class RunWarning(Base):
+    __tablename__ = "run_warnings"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    run_id = Column(UUID(as_uuid=True), ForeignKey("runs.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)  # order within the run
+    stage = Column(Text, nullable=False)   # INGEST, TOKENS, AST
+    path = Column(Text, nullable=True)
+    reason = Column(Text, nullable=False)
+    details = Column(JSONB, nullable=True)  # e.g. parse budget kind/limit/observed
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_run_warnings_run_seq", "run_id", "seq"),
+    )
+
+
+# 13) run_shards (row/column blocks of the pair matrix compared by separate workers)
+class RunShard(Base):
+    __tablename__ = "run_shards"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    run_id = Column(UUID(as_uuid=True), ForeignKey("runs.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    language = Column(Text, nullable=False)
+    row_file_ids = Column(JSONB, nullable=False)  # list of file id strings
+    col_file_ids = Column(JSONB, nullable=False)
+    status = Column(Text, nullable=False, default="PENDING")  # PENDING, DONE
+    pair_count = Column(Integer, nullable=False, default=0)  # pairs compared
+    score_bins = Column(JSONB, nullable=True)  # per-bin counts of pairs below the result floor
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)  # set each time a worker picks it up
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("run_id", "seq", name="uq_run_shards_run_seq"),
+        Index("ix_run_shards_run_status", "run_id", "status"),
+    )
+
+
+# 14) run_score_bins (final score histogram over every compared pair, stored or not)
+class RunScoreBin(Base):
+    __tablename__ = "run_score_bins"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    run_id = Column(UUID(as_uuid=True), ForeignKey("runs.id", ondelete="CASCADE"), nullable=False)
+    bin = Column(Integer, nullable=False)
+    lower = Column(Float, nullable=False)
+    upper = Column(Float, nullable=False)
+    pair_count = Column(Integer, nullable=False, default=0)    # pairs compared
+    stored_count = Column(Integer, nullable=False, default=0)  # of those, kept as pair_results
+
+    __table_args__ = (
+        UniqueConstraint("run_id", "bin", name="uq_run_score_bins_run_bin"),
+    )
+
+
+# 15) run_metrics (timing and throughput of each pipeline step of a run)
+class RunMetric(Base):
+    __tablename__ = "run_metrics"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    run_id = Column(UUID(as_uuid=True), ForeignKey("runs.id", ondelete="CASCADE"), nullable=False)
+    stage = Column(Text, nullable=False)  # INGEST, TOKENS, AST, REPORT
+    step = Column(Text, nullable=False)   # prepare, compare, compare_shard, report
+    seq = Column(Integer, nullable=True)  # shard number of a compare_shard step
+    wall_ms = Column(Float, nullable=False)
+    cpu_ms = Column(Float, nullable=False)
+    files = Column(Integer, nullable=False, default=0)
+    pairs_considered = Column(BigInteger, nullable=False, default=0)
+    pairs_scored = Column(BigInteger, nullable=False, default=0)
+    pairs_persisted = Column(BigInteger, nullable=False, default=0)
+    rows_written = Column(BigInteger, nullable=False, default=0)
+    evidence_rows = Column(BigInteger, nullable=False, default=0)
+    bytes_written = Column(BigInteger, nullable=False, default=0)
+    db_queries = Column(Integer, nullable=False, default=0)
+    db_ms = Column(Float, nullable=False, default=0)
+    peak_rss_mb = Column(Float, nullable=True)
+    traced_peak_mb = Column(Float, nullable=True)  # only with config_json["memory"]
+    details = Column(JSONB, nullable=True)  # e.g. top_allocations, slowest_statements
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_run_metrics_run_created_at", "run_id", "created_at"),
+    )
+
+
+# 16) run_artifacts (files produced for a run, e.g. profiles; one per kind and task)
+class RunArtifact(Base):
+    __tablename__ = "run_artifacts"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    run_id = Column(UUID(as_uuid=True), ForeignKey("runs.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(Text, nullable=False)  # profile_pstats, profile_collapsed
+    name = Column(Text, nullable=False)  # task that produced it: pipeline, shard-0003
+    content = Column(LargeBinary, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("run_id", "kind", "name", name="uq_run_artifacts_run_kind_name"),
+    )
+
+
+# 17) file_ast_features (compacted AST handoff per file, read back by shards and resumed runs)
+class FileAstFeature(Base):
+    __tablename__ = "file_ast_features"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    run_id = Column(UUID(as_uuid=True), ForeignKey("runs.id", ondelete="CASCADE"), nullable=False)
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    algo_version = Column(Text, nullable=False)
+    feature_blob = Column(LargeBinary, nullable=False)  # zlib-compressed JSON
+    token_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("run_id", "file_id", name="uq_file_ast_features_run_file"),
+        Index("ix_file_ast_features_run_id", "run_id"),
+    )
+
+
+# warning totals without loading the warnings themselves; deferred so only
+# queries that ask for it (undefer) pay for the count
+Run.warning_count = column_property(
+    select(func.count(RunWarning.id))
+    .where(RunWarning.run_id == Run.id)
+    .correlate_except(RunWarning)
+    .scalar_subquery(),
+    deferred=True,
+)
+
+
 #About models.py file:
 #  this file is the backbone of the database structure
 # It contains the table models for collections,datasets,submissions,files,runs,results
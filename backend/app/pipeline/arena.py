@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import AbstractSet, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+
+# Worker processes used for pair scoring. 1 keeps comparison in-process.
+# Only takes effect outside Celery prefork children (daemonic processes may
+# not start pools), which is why docker-compose runs the pipeline worker with
+# the threads pool.
+COMPARE_PROCESSES = int(os.getenv("COMPARE_PROCESSES", "1"))
+# Approximate number of pairs handed to a worker per task.
+COMPARE_PAIRS_PER_TASK = int(os.getenv("COMPARE_PAIRS_PER_TASK", "2000"))
+MAX_EVIDENCE_POSITIONS = 3
+
+_ITEM_SIZE = 8
+
+
+def stable_hash64(parts: Sequence[str]) -> int:
+    """64-bit hash of a feature (e.g. an n-gram) that is stable across processes."""
+    digest = hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def language_buckets(languages: Sequence[str]) -> Tuple[List[int], List[Tuple[int, int]]]:
+    """
+    Return (order, bounds): `order` lists input indexes grouped by language
+    (stable, so i < j within a bucket keeps the original pair orientation) and
+    `bounds` holds the [start, end) slice of `order` for each language.
+    """
+    order = sorted(range(len(languages)), key=lambda idx: languages[idx])
+    bounds: List[Tuple[int, int]] = []
+    start = 0
+    for pos in range(1, len(order) + 1):
+        if pos == len(order) or languages[order[pos]] != languages[order[start]]:
+            bounds.append((start, pos))
+            start = pos
+    return order, bounds
+
+
+def same_language_pair_count(languages: Sequence[str]) -> int:
+    _, bounds = language_buckets(languages)
+    return sum((end - start) * (end - start - 1) // 2 for start, end in bounds)
+
+
+# progress(done, total) callback used by the pair-scoring loops
+ProgressCallback = Callable[[int, int], None]
+
+
+@dataclass(frozen=True)
+class ArenaLayout:
+    """Where each section lives inside the shared buffer (all int64/uint64)."""
+
+    name: str
+    file_count: int
+    entry_count: int
+
+    @property
+    def offsets_start(self) -> int:
+        return 0
+
+    @property
+    def hashes_start(self) -> int:
+        return (self.file_count + 1) * _ITEM_SIZE
+
+    @property
+    def spans_start(self) -> int:
+        return self.hashes_start + self.entry_count * _ITEM_SIZE
+
+    @property
+    def size(self) -> int:
+        return self.spans_start + 2 * self.entry_count * _ITEM_SIZE
+
+
+class FeatureArena:
+    """
+    Run-scoped, read-only feature store in one `multiprocessing.shared_memory`
+    buffer.
+
+    Layout:
+    - offsets: int64[file_count + 1], entries of file i are [offsets[i], offsets[i + 1])
+    - hashes:  uint64[entry_count], one 64-bit feature hash per entry
+    - spans:   int64[2 * entry_count], (start, end) per entry
+
+    The owning process builds it with `FeatureArena.create`; workers call
+    `FeatureArena.attach(layout)` and read it zero-copy.
+    """
+
+    def __init__(self, shm: SharedMemory, layout: ArenaLayout, owner: bool):
+        self._shm = shm
+        self.layout = layout
+        self._owner = owner
+        buf = shm.buf
+        self.offsets = buf[layout.offsets_start : layout.hashes_start].cast("q")
+        self.hashes = buf[layout.hashes_start : layout.spans_start].cast("Q")
+        self.spans = buf[layout.spans_start : layout.size].cast("q")
+
+    @classmethod
+    def create(
+        cls,
+        hash_arrays: Sequence[Sequence[int]],
+        span_arrays: Sequence[Sequence[Tuple[int, int]]],
+    ) -> "FeatureArena":
+        if len(hash_arrays) != len(span_arrays):
+            raise ValueError("hash_arrays and span_arrays must have the same length")
+
+        offsets = array("q", [0])
+        for hashes in hash_arrays:
+            offsets.append(offsets[-1] + len(hashes))
+        entry_count = offsets[-1]
+
+        # SharedMemory rejects size 0, so always reserve at least one slot.
+        size = max(ArenaLayout("", len(hash_arrays), entry_count).size, _ITEM_SIZE)
+        shm = SharedMemory(create=True, size=size)
+        layout = ArenaLayout(shm.name, len(hash_arrays), entry_count)
+        arena = cls(shm, layout, owner=True)
+
+        arena.offsets[:] = offsets
+        for idx, (hashes, spans) in enumerate(zip(hash_arrays, span_arrays)):
+            start, end = offsets[idx], offsets[idx + 1]
+            if len(spans) != end - start:
+                raise ValueError(f"file {idx}: expected {end - start} spans, got {len(spans)}")
+            arena.hashes[start:end] = array("Q", hashes)
+            arena.spans[2 * start : 2 * end] = array("q", [value for span in spans for value in span])
+        return arena
+
+    @classmethod
+    def attach(cls, layout: ArenaLayout) -> "FeatureArena":
+        # Pool workers share the owner's resource tracker, so attaching here
+        # does not take over responsibility for unlinking the segment.
+        return cls(SharedMemory(name=layout.name), layout, owner=False)
+
+    def file_hashes(self, index: int) -> memoryview:
+        return self.hashes[self.offsets[index] : self.offsets[index + 1]]
+
+    def span(self, file_index: int, position: int) -> Tuple[int, int]:
+        entry = self.offsets[file_index] + position
+        return self.spans[2 * entry], self.spans[2 * entry + 1]
+
+    def close(self) -> None:
+        for view in (self.offsets, self.hashes, self.spans):
+            view.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self) -> "FeatureArena":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+# (row, column_start, column_end): compare file `row` against files
+# column_start .. column_end - 1.
+PairRange = Tuple[int, int, int]
+# (hash, count_a, count_b, positions_a, positions_b)
+SharedFeature = Tuple[int, int, int, List[int], List[int]]
+# (index_a, index_b, shared_count, union_count)
+PairScore = Tuple[int, int, int, int]
+
+
+def index_positions(hashes: Sequence[int]) -> Dict[int, List[int]]:
+    positions: Dict[int, List[int]] = {}
+    for idx, value in enumerate(hashes):
+        positions.setdefault(value, []).append(idx)
+    return positions
+
+
+def score_distinct(distinct_a: AbstractSet[int], distinct_b: AbstractSet[int]) -> Tuple[int, int]:
+    """(shared_count, union_count) of two files' distinct feature hashes."""
+    shared_count = len(distinct_a & distinct_b)
+    return shared_count, len(distinct_a) + len(distinct_b) - shared_count
+
+
+def shared_features(index_a: Dict[int, List[int]], index_b: Dict[int, List[int]]) -> List[SharedFeature]:
+    """The features two indexed files share, with their first positions, for evidence."""
+    return [
+        (
+            value,
+            len(index_a[value]),
+            len(index_b[value]),
+            index_a[value][:MAX_EVIDENCE_POSITIONS],
+            index_b[value][:MAX_EVIDENCE_POSITIONS],
+        )
+        for value in index_a.keys() & index_b.keys()
+    ]
+
+
+def score_pair_ranges(layout: ArenaLayout, pair_ranges: Sequence[PairRange]) -> Tuple[List[PairScore], float]:
+    """
+    Worker entry point: attach to the arena and score the given pair ranges.
+    Only scores go back to the parent (evidence is built there, for the pairs
+    that need it), together with the CPU seconds this worker spent.
+    """
+    started = time.process_time()
+    arena = FeatureArena.attach(layout)
+    try:
+        distinct: Dict[int, Set[int]] = {}
+
+        def distinct_for(file_index: int) -> Set[int]:
+            if file_index not in distinct:
+                with arena.file_hashes(file_index) as hashes:
+                    distinct[file_index] = set(hashes)
+            return distinct[file_index]
+
+        results: List[PairScore] = []
+        for row, column_start, column_end in pair_ranges:
+            distinct_a = distinct_for(row)
+            for column in range(column_start, column_end):
+                results.append((row, column, *score_distinct(distinct_a, distinct_for(column))))
+        return results, time.process_time() - started
+    finally:
+        arena.close()
+
+
+def _column_runs(row: int, end: int, allowed: Optional[Set[Tuple[int, int]]]) -> Iterator[Tuple[int, int]]:
+    if allowed is None:
+        if row + 1 < end:
+            yield row + 1, end
+        return
+    run_start = None
+    for column in range(row + 1, end + 1):
+        keep = column < end and (row, column) in allowed
+        if keep and run_start is None:
+            run_start = column
+        elif not keep and run_start is not None:
+            yield run_start, column
+            run_start = None
+
+
+def build_pair_ranges(
+    bucket_bounds: Sequence[Tuple[int, int]],
+    pairs_per_task: int = COMPARE_PAIRS_PER_TASK,
+    allowed_pairs: Optional[Set[Tuple[int, int]]] = None,
+) -> List[List[PairRange]]:
+    """
+    Split the upper triangle of each [start, end) bucket into tasks of roughly
+    `pairs_per_task` pairs. When `allowed_pairs` is given, only those
+    (row, column) index pairs are scored.
+    """
+    tasks: List[List[PairRange]] = []
+    current: List[PairRange] = []
+    current_pairs = 0
+    for start, end in bucket_bounds:
+        for row in range(start, end - 1):
+            for column_start, run_end in _column_runs(row, end, allowed_pairs):
+                while column_start < run_end:
+                    column_end = min(run_end, column_start + max(1, pairs_per_task - current_pairs))
+                    current.append((row, column_start, column_end))
+                    current_pairs += column_end - column_start
+                    column_start = column_end
+                    if current_pairs >= pairs_per_task:
+                        tasks.append(current)
+                        current, current_pairs = [], 0
+    if current:
+        tasks.append(current)
+    return tasks
+
+
+def can_use_process_pool(processes: Optional[int]) -> bool:
+    # Celery prefork children are daemonic and may not start their own pools.
+    return (processes or 1) > 1 and not multiprocessing.current_process().daemon
+
+
+def pool_context():
+    # the threads-pool worker forks from a multi-threaded process; forkserver
+    # children start from a clean single-threaded server instead. Workers only
+    # need this module, everything else comes through the shared arena.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def score_in_arena(
+    arena: FeatureArena,
+    bucket_bounds: Sequence[Tuple[int, int]],
+    *,
+    processes: int,
+    pairs_per_task: int = COMPARE_PAIRS_PER_TASK,
+    allowed_pairs: Optional[Set[Tuple[int, int]]] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> Tuple[List[PairScore], float]:
+    """
+    Fan pair ranges out to a process pool; workers read features from `arena`.
+    Returns the pair scores and the CPU seconds the workers spent on them.
+    """
+    tasks = build_pair_ranges(bucket_bounds, pairs_per_task=pairs_per_task, allowed_pairs=allowed_pairs)
+    if not tasks:
+        return [], 0.0
+
+    total = sum(end - start for task in tasks for _, start, end in task)
+    results: List[PairScore] = []
+    worker_cpu = 0.0
+    with ProcessPoolExecutor(max_workers=min(processes, len(tasks)), mp_context=pool_context()) as pool:
+        for chunk, chunk_cpu in pool.map(score_pair_ranges, [arena.layout] * len(tasks), tasks):
+            results.extend(chunk)
+            worker_cpu += chunk_cpu
+            if progress is not None:
+                progress(len(results), total)
+    return results, worker_cpu
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from tree_sitter import Node, Tree
 
@@ -178,10 +178,14 @@ def canonicalize_nodes_with_spans(
     max_nodes: int = 50_000,
     include_unnamed_nodes: bool = True,
     normalize_statements: bool = False,
+    root: Optional[Node] = None,
 ) -> Tuple[List[ASTNodeInfo], Dict[str, str]]:
     """
     Walk the AST and return canonicalized node labels with original byte spans.
 
+    Pass `root` to canonicalize a single subtree (e.g. one function) with its
+    own identifier map; by default the whole tree is walked.
+
     Canonicalization rules:
     - Alpha-renaming identifiers into IDENT_1, IDENT_2, ...
     - Normalizing literals into STR_LIT / CHAR_LIT / NUM_LIT / BOOL_LIT / NULL_LIT
@@ -190,7 +194,7 @@ def canonicalize_nodes_with_spans(
     source_bytes = (code or "").encode("utf-8")
     out: List[ASTNodeInfo] = []
     identifier_map: Dict[str, str] = {}
-    root = tree.root_node
+    root = root if root is not None else tree.root_node
 
     stack: List[Tuple[Node, str | None]] = [(root, None)]  # (node, parent_label)
 
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import math
+import random
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Any, Dict, List, Sequence, Tuple
+
+
+# DECKARD-style near-miss clone detection: every statement-level subtree of
+# at least VECTOR_MIN_NODES canonical nodes becomes a node-label count vector,
+# and vectors are bucketed with p-stable (Euclidean) LSH so only vectors that
+# collide in some table are compared.
+VECTOR_MIN_NODES = 20
+LSH_TABLES = 8
+LSH_HASHES_PER_TABLE = 4
+LSH_BUCKET_WIDTH = 4.0
+LSH_SEED = 1729
+CLONE_MIN_SIMILARITY = 0.9
+CLONE_MAX_BUCKET = 64
+
+
+@dataclass(frozen=True)
+class SubtreeVector:
+    label: str
+    start_byte: int
+    end_byte: int
+    size: int
+    counts: Tuple[Tuple[str, int], ...]
+
+
+def vector_label(node_type: str) -> str:
+    # IDENT_1, IDENT_2, ... are file-local names; only "an identifier" matters here
+    return "IDENT" if node_type.startswith("IDENT_") else node_type
+
+
+def characteristic_vectors(
+    handoff: Dict[str, Any],
+    *,
+    min_nodes: int = VECTOR_MIN_NODES,
+) -> List[SubtreeVector]:
+    """
+    Build count vectors over canonical node labels for statement-level
+    subtrees of the handoff's pre-order node stream.
+
+    A node's descendants are the contiguous run of following nodes whose byte
+    spans sit inside its own.
+    """
+    spans = handoff.get("token_spans", [])
+    vectors: List[SubtreeVector] = []
+    for idx, node in enumerate(spans):
+        if not node["node_type"].startswith("STMT_"):
+            continue
+        end = idx + 1
+        while (
+            end < len(spans)
+            and spans[end]["start_byte"] >= node["start_byte"]
+            and spans[end]["end_byte"] <= node["end_byte"]
+        ):
+            end += 1
+        if end - idx < min_nodes:
+            continue
+        counts = Counter(vector_label(item["node_type"]) for item in spans[idx:end])
+        vectors.append(
+            SubtreeVector(
+                label=node["node_type"],
+                start_byte=node["start_byte"],
+                end_byte=node["end_byte"],
+                size=end - idx,
+                counts=tuple(sorted(counts.items())),
+            )
+        )
+    return vectors
+
+
+class EuclideanLSH:
+    """
+    p-stable LSH for sparse count vectors: h(v) = floor((a . v + b) / w).
+
+    Projection coefficients are drawn per label on first use from a seeded
+    generator, so the vocabulary does not need to be known up front and
+    signatures are reproducible across processes.
+    """
+
+    def __init__(
+        self,
+        *,
+        tables: int = LSH_TABLES,
+        hashes_per_table: int = LSH_HASHES_PER_TABLE,
+        bucket_width: float = LSH_BUCKET_WIDTH,
+        seed: int = LSH_SEED,
+    ):
+        self.tables = tables
+        self.hashes_per_table = hashes_per_table
+        self.bucket_width = bucket_width
+        self.seed = seed
+        offsets = random.Random(seed)
+        self._offsets = [offsets.uniform(0, bucket_width) for _ in range(tables * hashes_per_table)]
+        self._coefficients: Dict[str, List[float]] = {}
+
+    def _coefficients_for(self, label: str) -> List[float]:
+        if label not in self._coefficients:
+            rng = random.Random(f"{self.seed}:{label}")
+            self._coefficients[label] = [rng.gauss(0.0, 1.0) for _ in self._offsets]
+        return self._coefficients[label]
+
+    def signature(self, vector: SubtreeVector) -> List[Tuple[int, ...]]:
+        projections = [0.0] * len(self._offsets)
+        for label, count in vector.counts:
+            for slot, coefficient in enumerate(self._coefficients_for(label)):
+                projections[slot] += coefficient * count
+        keys = [
+            math.floor((projection + offset) / self.bucket_width)
+            for projection, offset in zip(projections, self._offsets)
+        ]
+        k = self.hashes_per_table
+        return [tuple(keys[table * k : (table + 1) * k]) for table in range(self.tables)]
+
+
+def vector_similarity(a: SubtreeVector, b: SubtreeVector) -> float:
+    """1 - L1 distance / total size: 1.0 for identical label counts."""
+    counts_a, counts_b = dict(a.counts), dict(b.counts)
+    distance = sum(abs(counts_a.get(label, 0) - counts_b.get(label, 0)) for label in counts_a.keys() | counts_b.keys())
+    return 1.0 - distance / (a.size + b.size)
+
+
+def _contained(inner: Tuple[int, int], outer: Tuple[int, int]) -> bool:
+    return outer[0] <= inner[0] and inner[1] <= outer[1]
+
+
+def find_near_miss_clones(
+    files: Sequence[Tuple[Any, str, Sequence[SubtreeVector]]],
+    *,
+    min_similarity: float = CLONE_MIN_SIMILARITY,
+    max_bucket_size: int = CLONE_MAX_BUCKET,
+    lsh: EuclideanLSH | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Find near-miss subtree clones across a cohort.
+
+    `files` is a sequence of (file_id, language, vectors). Only vectors from
+    different files of the same language that share an LSH bucket are
+    compared; matches nested inside a larger match of the same file pair are
+    dropped so each clone is reported once at its outermost subtree.
+    """
+    lsh = lsh or EuclideanLSH()
+    entries: List[Tuple[int, SubtreeVector]] = []
+    buckets: Dict[Tuple[str, int, Tuple[int, ...]], List[int]] = defaultdict(list)
+    for file_index, (_, language, vectors) in enumerate(files):
+        for vector in vectors:
+            entry_id = len(entries)
+            entries.append((file_index, vector))
+            for table, key in enumerate(lsh.signature(vector)):
+                buckets[(language, table, key)].append(entry_id)
+
+    candidates: set[Tuple[int, int]] = set()
+    for bucket in buckets.values():
+        if len(bucket) > max_bucket_size:
+            continue
+        for left, right in combinations(bucket, 2):
+            if entries[left][0] != entries[right][0]:
+                candidates.add((left, right))
+
+    scored = []
+    for left, right in candidates:
+        (file_a, vector_a), (file_b, vector_b) = entries[left], entries[right]
+        similarity = vector_similarity(vector_a, vector_b)
+        if similarity >= min_similarity:
+            scored.append((file_a, vector_a, file_b, vector_b, similarity))
+
+    # outermost (largest) clones first, then drop anything nested inside them
+    scored.sort(key=lambda item: (item[1].size + item[3].size, item[4]), reverse=True)
+    accepted: Dict[Tuple[int, int], List[Tuple[Tuple[int, int], Tuple[int, int]]]] = defaultdict(list)
+    clones: List[Dict[str, Any]] = []
+    for file_a, vector_a, file_b, vector_b, similarity in scored:
+        span_a = (vector_a.start_byte, vector_a.end_byte)
+        span_b = (vector_b.start_byte, vector_b.end_byte)
+        kept = accepted[(file_a, file_b)]
+        if any(_contained(span_a, outer_a) and _contained(span_b, outer_b) for outer_a, outer_b in kept):
+            continue
+        kept.append((span_a, span_b))
+        clones.append(
+            {
+                "file_a_id": files[file_a][0],
+                "file_b_id": files[file_b][0],
+                "a_start": span_a[0],
+                "a_end": span_a[1],
+                "b_start": span_b[0],
+                "b_end": span_b[1],
+                "label": vector_a.label,
+                "size": min(vector_a.size, vector_b.size),
+                "similarity": round(similarity, 6),
+            }
+        )
+    return clones
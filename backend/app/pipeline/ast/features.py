@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from .types import ASTNodeInfo
 
@@ -8,6 +10,47 @@ from .types import ASTNodeInfo
 FEATURE_HANDOFF_VERSION = "ast-handoff-v1"
 
 
+class SpanTable:
+    """
+    Column-oriented `token_spans` for compacted handoffs: interned node types
+    and two int64 byte-offset arrays instead of one dict per node. Indexing
+    and iteration yield the same {"node_type", "start_byte", "end_byte"}
+    dicts as the list form, so readers of the handoff need not care which
+    one they get.
+    """
+
+    __slots__ = ("node_types", "starts", "ends")
+
+    def __init__(self, node_types: List[str], starts: array, ends: array):
+        self.node_types = node_types
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_spans(cls, spans: Sequence[Dict[str, Any]]) -> "SpanTable":
+        return cls(
+            [sys.intern(span["node_type"]) for span in spans],
+            array("q", (span["start_byte"] for span in spans)),
+            array("q", (span["end_byte"] for span in spans)),
+        )
+
+    def __len__(self) -> int:
+        return len(self.node_types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SpanTable(self.node_types[index], self.starts[index], self.ends[index])
+        return {"node_type": self.node_types[index], "start_byte": self.starts[index], "end_byte": self.ends[index]}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self.node_types)):
+            yield self[index]
+
+    def window(self, start: int, n: int) -> Tuple[int, int]:
+        # byte range covered by nodes start .. start + n - 1
+        return min(self.starts[start : start + n]), max(self.ends[start : start + n])
+
+
 def _stable_node_token(node: ASTNodeInfo) -> str:
     parent = node.parent_type if node.parent_type is not None else "ROOT"
     return f"{parent}>{node.type}"
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import combinations
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from tree_sitter import Node, Query, QueryCursor, Tree
+
+from app.pipeline.arena import stable_hash64
+
+from .canonicalize import canonicalize_nodes_with_spans
+from .features import _stable_node_token
+from .languages import get_language
+
+
+# Tree-sitter queries selecting one capture per function/method unit.
+FUNCTION_QUERIES = {
+    "python": "(function_definition) @function",
+    "java": "[(method_declaration) (constructor_declaration)] @function",
+    "c": "(function_definition) @function",
+    "cpp": "(function_definition) @function",
+    "javascript": (
+        "[(function_declaration) (generator_function_declaration) (method_definition)"
+        " (function_expression) (arrow_function)] @function"
+    ),
+}
+
+# Units shorter than this many canonical tokens (getters, one-line lambdas)
+# match almost everything and are left out of the index.
+MIN_FUNCTION_TOKENS = 12
+FUNCTION_NGRAM_SIZE = 3
+FUNCTION_MATCH_MIN_SCORE = 0.6
+# Digest/n-gram buckets larger than this are treated as template code shared
+# by the whole cohort and are not expanded into pairs.
+FUNCTION_INDEX_MAX_BUCKET = 50
+
+
+@dataclass(frozen=True)
+class FunctionUnit:
+    name: str
+    start_byte: int
+    end_byte: int
+    token_count: int
+    identifier_count: int
+    digest: int
+    ngram_hashes: FrozenSet[int]
+
+
+@lru_cache(maxsize=None)
+def _function_query(language: str) -> Optional[Query]:
+    source = FUNCTION_QUERIES.get(language)
+    if source is None:
+        return None
+    return Query(get_language(language), source)
+
+
+def _function_name(node: Node, source_bytes: bytes) -> str:
+    name_node = node.child_by_field_name("name")
+    if name_node is None:
+        # C/C++: walk declarator -> function_declarator -> declarator
+        declarator = node.child_by_field_name("declarator")
+        while declarator is not None and declarator.type != "function_declarator":
+            declarator = declarator.child_by_field_name("declarator")
+        if declarator is not None:
+            name_node = declarator.child_by_field_name("declarator")
+    if name_node is None and node.parent is not None and node.parent.type == "variable_declarator":
+        # JS: const name = (...) => ...
+        name_node = node.parent.child_by_field_name("name")
+    if name_node is None:
+        return "<anonymous>"
+    return source_bytes[name_node.start_byte : name_node.end_byte].decode("utf-8", errors="ignore")
+
+
+def segment_functions(
+    tree: Tree,
+    code: str,
+    language: str,
+    *,
+    n: int = FUNCTION_NGRAM_SIZE,
+    min_tokens: int = MIN_FUNCTION_TOKENS,
+    include_unnamed_nodes: bool = False,
+    normalize_statements: bool = True,
+) -> List[FunctionUnit]:
+    """
+    Split a parsed file into function/method units.
+
+    Each unit is canonicalized on its own, so identifiers are numbered from
+    IDENT_1 inside every function and a function copied into a different file
+    hashes the same regardless of what surrounds it.
+    """
+    lang = (language or "").lower().strip()
+    query = _function_query(lang)
+    if query is None:
+        return []
+
+    source_bytes = (code or "").encode("utf-8")
+    captures = QueryCursor(query).captures(tree.root_node).get("function", [])
+    units: List[FunctionUnit] = []
+    for node in sorted(captures, key=lambda item: (item.start_byte, item.end_byte)):
+        canonical_nodes, identifier_map = canonicalize_nodes_with_spans(
+            tree=tree,
+            code=code,
+            language=lang,
+            include_unnamed_nodes=include_unnamed_nodes,
+            normalize_statements=normalize_statements,
+            root=node,
+        )
+        tokens = [_stable_node_token(item) for item in canonical_nodes]
+        if len(tokens) < min_tokens:
+            continue
+        units.append(
+            FunctionUnit(
+                name=_function_name(node, source_bytes),
+                start_byte=node.start_byte,
+                end_byte=node.end_byte,
+                token_count=len(tokens),
+                identifier_count=len(identifier_map),
+                digest=stable_hash64(tokens),
+                ngram_hashes=frozenset(
+                    stable_hash64(tokens[i : i + n]) for i in range(len(tokens) - n + 1)
+                ),
+            )
+        )
+    return units
+
+
+def _unit_payload(unit: FunctionUnit) -> Dict[str, Any]:
+    return {"name": unit.name, "start_byte": unit.start_byte, "end_byte": unit.end_byte}
+
+
+def find_function_matches(
+    files: Sequence[Tuple[Any, str, Sequence[FunctionUnit]]],
+    *,
+    min_score: float = FUNCTION_MATCH_MIN_SCORE,
+    max_bucket_size: int = FUNCTION_INDEX_MAX_BUCKET,
+) -> List[Dict[str, Any]]:
+    """
+    Find function-to-function matches across a cohort without comparing all
+    file pairs.
+
+    `files` is a sequence of (file_id, language, units). Units are indexed by
+    exact canonical digest (kind "EXACT") and by n-gram hash; only unit pairs
+    that share a non-template posting list are scored by n-gram Jaccard
+    (kind "NGRAM").
+    file_a is always the one listed first in `files`.
+    """
+    units: List[Tuple[int, FunctionUnit]] = []
+    digest_index: Dict[Tuple[str, int], List[int]] = defaultdict(list)
+    ngram_index: Dict[Tuple[str, int], List[int]] = defaultdict(list)
+    for file_index, (_, language, file_units) in enumerate(files):
+        for unit in file_units:
+            unit_id = len(units)
+            units.append((file_index, unit))
+            digest_index[(language, unit.digest)].append(unit_id)
+            for value in unit.ngram_hashes:
+                ngram_index[(language, value)].append(unit_id)
+
+    scores: Dict[Tuple[int, int], Tuple[float, str]] = {}
+    for bucket in digest_index.values():
+        if len(bucket) > max_bucket_size:
+            continue
+        for left, right in combinations(bucket, 2):
+            if units[left][0] != units[right][0]:
+                scores[(left, right)] = (1.0, "EXACT")
+
+    candidates: set[Tuple[int, int]] = set()
+    for bucket in ngram_index.values():
+        if len(bucket) > max_bucket_size:
+            continue
+        for left, right in combinations(bucket, 2):
+            if units[left][0] != units[right][0]:
+                candidates.add((left, right))
+
+    for key in candidates - scores.keys():
+        hashes_a, hashes_b = units[key[0]][1].ngram_hashes, units[key[1]][1].ngram_hashes
+        shared = len(hashes_a & hashes_b)
+        union = len(hashes_a) + len(hashes_b) - shared
+        score = shared / union if union else 0.0
+        if score >= min_score:
+            scores[key] = (score, "NGRAM")
+
+    matches: List[Dict[str, Any]] = []
+    for (left, right), (score, kind) in scores.items():
+        (file_left, unit_left), (file_right, unit_right) = units[left], units[right]
+        if file_left > file_right:
+            (file_left, unit_left), (file_right, unit_right) = (file_right, unit_right), (file_left, unit_left)
+        matches.append(
+            {
+                "file_a_id": files[file_left][0],
+                "file_b_id": files[file_right][0],
+                "unit_a": _unit_payload(unit_left),
+                "unit_b": _unit_payload(unit_right),
+                "score": round(score, 6),
+                "kind": kind,
+            }
+        )
+
+    matches.sort(key=lambda item: item["score"], reverse=True)
+    return matches
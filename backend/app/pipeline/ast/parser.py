@@ -1,21 +1,60 @@
 from __future__ import annotations
 
-from typing import List, Tuple
+import warnings
+from typing import List, Optional, Tuple
 from tree_sitter import Tree, Node
 
 from .canonicalize import canonicalize_nodes_with_spans
 from .features import build_feature_handoff_payload
+from .functions import segment_functions
 from .languages import make_parser
 from .types import ASTNodeInfo
 
 
-def parse_code(code: str, language: str) -> Tree:
+class ParseBudgetExceeded(RuntimeError):
+    """
+    Raised when a file exceeds one of its per-file parse budgets.
+
+    `budget` is one of "bytes", "time" or "nodes"; `limit` is the configured
+    ceiling and `observed` the measured value when one is known.
+    """
+
+    def __init__(self, budget: str, limit: int, observed: Optional[int] = None):
+        self.budget = budget
+        self.limit = limit
+        self.observed = observed
+        detail = f"{budget} budget exceeded (limit {limit}"
+        if observed is not None:
+            detail += f", observed {observed}"
+        super().__init__(detail + ")")
+
+
+def parse_code(code: str, language: str, timeout_micros: Optional[int] = None) -> Tree:
     """
     Parse raw source code into a Tree-sitter Tree.
     Byte offsets in nodes refer to the UTF-8 encoded bytes of `code`.
+
+    When `timeout_micros` is set, Tree-sitter cancels the parse once that much
+    time has elapsed and `ParseBudgetExceeded("time", ...)` is raised.
     """
     parser = make_parser(language)
-    return parser.parse((code or "").encode("utf-8"))
+    source_bytes = (code or "").encode("utf-8")
+    if not timeout_micros:
+        return parser.parse(source_bytes)
+
+    # `progress_callback` is the non-deprecated cancellation hook, but it is
+    # ignored for bytestrings and crashes with callable sources on
+    # tree-sitter 0.25.x, so keep using the parser-level timeout for now.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        parser.timeout_micros = timeout_micros
+    try:
+        tree = parser.parse(source_bytes)
+    except ValueError:
+        tree = None
+    if tree is None:
+        raise ParseBudgetExceeded("time", timeout_micros)
+    return tree
 
 
 def collect_nodes_with_spans(
@@ -100,6 +139,10 @@ def parse_and_collect(
     build_handoff: bool = False,
     file_path: str | None = None,
     include_tree: bool = False,
+    timeout_micros: Optional[int] = None,
+    max_source_bytes: Optional[int] = None,
+    enforce_node_budget: bool = False,
+    segment_units: bool = False,
 ) -> dict:
     """
     Convenience wrapper used by the pipeline/worker.
@@ -112,27 +155,47 @@ def parse_and_collect(
         "node_count": int,
         "include_unnamed_nodes": bool,
         "error_count": int,
+        "truncated": bool,   # node walk stopped at `max_nodes`
         # Optional (for normalization pipeline)
         "canonical_nodes": List[ASTNodeInfo],
         "canonical_node_count": int,
         "identifier_symbol_count": int,
         "normalize_statements": bool,
         "feature_handoff": dict,
+        # Optional (function-level matching)
+        "function_units": List[FunctionUnit],
         # Optional (internal use only)
         "tree": <Tree>,
       }
+
+    Budgets (all optional):
+    - `max_source_bytes`: refuse to parse larger inputs.
+    - `timeout_micros`: cancel Tree-sitter parsing after this long.
+    - `enforce_node_budget`: raise instead of silently truncating the node
+      walk when it reaches `max_nodes`.
+    Each violation raises `ParseBudgetExceeded`.
     """
     if normalize_statements and not canonicalize:
         raise ValueError("normalize_statements=True requires canonicalize=True")
     if build_handoff and not canonicalize:
         raise ValueError("build_handoff=True requires canonicalize=True")
 
-    tree = parse_code(code, language)
+    if max_source_bytes is not None:
+        source_size = len((code or "").encode("utf-8"))
+        if source_size > max_source_bytes:
+            raise ParseBudgetExceeded("bytes", max_source_bytes, source_size)
+
+    tree = parse_code(code, language, timeout_micros=timeout_micros)
+    # walk one node past the budget: a file with exactly `max_nodes` nodes is not truncated
     nodes = collect_nodes_with_spans(
         tree,
-        max_nodes=max_nodes,
+        max_nodes=max_nodes + 1,
         include_unnamed_nodes=include_unnamed_nodes,
     )
+    truncated = len(nodes) > max_nodes
+    nodes = nodes[:max_nodes]
+    if truncated and enforce_node_budget:
+        raise ParseBudgetExceeded("nodes", max_nodes)
     error_count = count_error_nodes(tree)
     result = {
         "language": (language or "").lower().strip(),
@@ -141,6 +204,7 @@ def parse_and_collect(
         "node_count": len(nodes),
         "include_unnamed_nodes": include_unnamed_nodes,
         "error_count": error_count,
+        "truncated": truncated,
     }
     if canonicalize:
         canonical_nodes, identifier_map = canonicalize_nodes_with_spans(
@@ -164,6 +228,14 @@ def parse_and_collect(
                 normalize_statements=normalize_statements,
                 file_path=file_path,
             )
+    if segment_units:
+        result["function_units"] = segment_functions(
+            tree,
+            code,
+            language,
+            include_unnamed_nodes=include_unnamed_nodes,
+            normalize_statements=normalize_statements,
+        )
     if include_tree:
         result["tree"] = tree
     return result
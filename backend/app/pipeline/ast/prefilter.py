@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import os
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .clones import vector_label
+
+
+# Same-language pairs whose node-type histograms have a cosine below this
+# floor skip the AST n-gram stage. 0 disables the prefilter.
+AST_COSINE_FLOOR = float(os.getenv("AST_COSINE_FLOOR", "0"))
+# Rows per matrix-product block; bounds the similarity block to
+# PREFILTER_BLOCK_ROWS x bucket_size float64 values.
+PREFILTER_BLOCK_ROWS = 2048
+# Rounding slack, so identical histograms clear a floor of 1.0.
+COSINE_TOLERANCE = 1e-9
+
+
+def node_type_histogram(handoff: Dict[str, Any]) -> Counter:
+    """
+    Frequencies of canonical node labels (STMT_* families, literal classes,
+    grammar node types). Identifiers are left out: they appear in every
+    file in roughly the same proportion and would dominate the cosine.
+    """
+    counts = Counter(vector_label(item["node_type"]) for item in handoff.get("token_spans", []))
+    counts.pop("IDENT", None)
+    return counts
+
+
+def histogram_matrix(histograms: Sequence[Counter]) -> np.ndarray:
+    """Stack histograms into a row-normalised (files x labels) float64 matrix."""
+    vocabulary = sorted(set().union(*histograms)) if histograms else []
+    columns = {label: idx for idx, label in enumerate(vocabulary)}
+    matrix = np.zeros((len(histograms), len(vocabulary)), dtype=np.float64)
+    for row, histogram in enumerate(histograms):
+        for label, count in histogram.items():
+            matrix[row, columns[label]] = count
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def cosine_pairs_above(
+    matrix: np.ndarray,
+    floor: float,
+    *,
+    block_rows: int = PREFILTER_BLOCK_ROWS,
+) -> List[Tuple[int, int]]:
+    """
+    Return (i, j), i < j, row pairs of a normalised matrix with cosine >= floor.
+    An all-zero row (a file without labelled nodes) has no direction to
+    compare, so its pairs are always returned and left to the n-gram stage.
+    """
+    empty = ~matrix.any(axis=1)
+    pairs: List[Tuple[int, int]] = []
+    for start in range(0, matrix.shape[0], block_rows):
+        block = matrix[start : start + block_rows] @ matrix.T
+        keep = (block >= floor - COSINE_TOLERANCE) | empty[start : start + block_rows, None] | empty[None, :]
+        rows, columns = np.nonzero(keep)
+        rows = rows + start
+        upper = columns > rows
+        pairs.extend(zip(rows[upper].tolist(), columns[upper].tolist()))
+    return pairs
+
+
+def cosine_prefilter_pairs(
+    files: Sequence[Tuple[Any, str, Dict[str, Any]]],
+    floor: float,
+) -> Set[Tuple[str, str]]:
+    """
+    `files` is a sequence of (file_id, language, handoff). Returns the
+    (file_a_id, file_b_id) keys of same-language pairs at or above `floor`,
+    oriented in input order like `compare_prepared_files`.
+    """
+    buckets: Dict[str, List[int]] = {}
+    for idx, (_, language, _) in enumerate(files):
+        buckets.setdefault(language, []).append(idx)
+
+    kept: Set[Tuple[str, str]] = set()
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        matrix = histogram_matrix([node_type_histogram(files[idx][2]) for idx in members])
+        for left, right in cosine_pairs_above(matrix, floor):
+            kept.add((str(files[members[left]][0]), str(files[members[right]][0])))
+    return kept
+
+
+def resolve_cosine_floor(config: Optional[Dict[str, Any]]) -> float:
+    return float((config or {}).get("cosine_floor", AST_COSINE_FLOOR))
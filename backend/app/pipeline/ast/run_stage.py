@@ -1,11 +1,40 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import json
+import os
+import sys
+import zlib
+from array import array
+from dataclasses import dataclass, field, replace
 from itertools import combinations
 from typing import Any, Dict, List, Optional
 
+from app.pipeline.arena import (
+    COMPARE_PROCESSES,
+    FeatureArena,
+    ProgressCallback,
+    can_use_process_pool,
+    language_buckets,
+    same_language_pair_count,
+    score_distinct,
+    score_in_arena,
+    stable_hash64,
+)
+from app.pipeline.metrics import record
+
+from .clones import SubtreeVector, characteristic_vectors, find_near_miss_clones
+from .features import SpanTable
+from .functions import FunctionUnit, find_function_matches
 from .parser import parse_and_collect
-from .similarity import compare_feature_handoffs
+from .prefilter import cosine_prefilter_pairs
+from .similarity import _window_span, compare_feature_handoffs
+
+
+# Per-file parse budgets. A file over any of them is dropped from the AST
+# stage (it still takes part in TOKENS) instead of stalling the whole run.
+AST_PARSE_TIMEOUT_MS = int(os.getenv("AST_PARSE_TIMEOUT_MS", "5000"))
+AST_MAX_SOURCE_BYTES = int(os.getenv("AST_MAX_SOURCE_BYTES", str(512 * 1024)))
+AST_MAX_NODES = int(os.getenv("AST_MAX_NODES", "50000"))
 
 
 SUPPORTED_LANGUAGE_EXTENSIONS = {
@@ -26,13 +55,107 @@ SUPPORTED_LANGUAGE_EXTENSIONS = {
 }
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ASTPreparedFile:
     file_id: Any
     path: str
     language: str
     source_code: str
     handoff: Dict[str, Any]
+    functions: List[FunctionUnit] = field(default_factory=list)
+    vectors: List[SubtreeVector] = field(default_factory=list)
+
+    def compact(self) -> "ASTPreparedFile":
+        # functions, vectors and the handoff already carry byte spans
+        return replace(self, source_code="", handoff=compact_handoff(self.handoff))
+
+    def without_index_features(self) -> "ASTPreparedFile":
+        # n-gram sets and subtree vectors only feed the run-wide function
+        # index and clone search; the function gate only asks whether a
+        # file has functions, so the units themselves are kept
+        return replace(
+            self,
+            functions=[replace(unit, ngram_hashes=frozenset()) for unit in self.functions],
+            vectors=[],
+        )
+
+
+def compact_handoff(handoff: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Slim a feature handoff for the comparison phase: spans become a
+    SpanTable holding only the node type and byte range (all that
+    comparison, the cosine prefilter and evidence read), and node labels are
+    interned so each distinct label is stored once per process.
+    """
+    return {
+        **handoff,
+        "feature_tokens": [sys.intern(token) for token in handoff.get("feature_tokens", [])],
+        "token_spans": SpanTable.from_spans(handoff.get("token_spans", [])),
+    }
+
+
+def serialize_ast_features(prepared: ASTPreparedFile) -> bytes:
+    """
+    Pack a file's comparison features (handoff and function units) for
+    `file_ast_features`. Function n-gram sets and subtree vectors only feed
+    the run-wide index and clone search, which run before this is read back,
+    so they are not stored.
+    """
+    handoff = prepared.handoff
+    spans = handoff.get("token_spans", [])
+    if not isinstance(spans, SpanTable):
+        spans = SpanTable.from_spans(spans)
+    payload = {
+        "handoff": {key: value for key, value in handoff.items() if key not in ("feature_tokens", "token_spans")},
+        "feature_tokens": list(handoff.get("feature_tokens", [])),
+        "node_types": spans.node_types,
+        "starts": spans.starts.tolist(),
+        "ends": spans.ends.tolist(),
+        "functions": [
+            [unit.name, unit.start_byte, unit.end_byte, unit.token_count, unit.identifier_count, unit.digest]
+            for unit in prepared.functions
+        ],
+    }
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def deserialize_ast_features(file_id: Any, path: str, language: str, blob: bytes) -> ASTPreparedFile:
+    # the compact, index-free form compare_prepared_files and the function gate read
+    payload = json.loads(zlib.decompress(blob).decode("utf-8"))
+    handoff = {
+        **payload["handoff"],
+        "feature_tokens": [sys.intern(token) for token in payload["feature_tokens"]],
+        "token_spans": SpanTable(
+            [sys.intern(node_type) for node_type in payload["node_types"]],
+            array("q", payload["starts"]),
+            array("q", payload["ends"]),
+        ),
+    }
+    functions = [
+        FunctionUnit(name, start, end, token_count, identifier_count, digest, frozenset())
+        for name, start, end, token_count, identifier_count, digest in payload["functions"]
+    ]
+    return ASTPreparedFile(
+        file_id=file_id, path=path, language=language, source_code="", handoff=handoff, functions=functions
+    )
+
+
+@dataclass(frozen=True)
+class ParseBudget:
+    timeout_ms: int = AST_PARSE_TIMEOUT_MS
+    max_source_bytes: int = AST_MAX_SOURCE_BYTES
+    max_nodes: int = AST_MAX_NODES
+
+
+def parse_budget_from_config(config: Optional[Dict[str, Any]]) -> ParseBudget:
+    """Build a ParseBudget from a run's `config_json["parse_budget"]` overrides."""
+    overrides = dict((config or {}).get("parse_budget") or {})
+    defaults = ParseBudget()
+    return ParseBudget(
+        timeout_ms=int(overrides.get("timeout_ms", defaults.timeout_ms)),
+        max_source_bytes=int(overrides.get("max_source_bytes", defaults.max_source_bytes)),
+        max_nodes=int(overrides.get("max_nodes", defaults.max_nodes)),
+    )
 
 
 def infer_language_from_path(path: str) -> Optional[str]:
@@ -61,14 +184,39 @@ def prepare_ast_file(
     path: str,
     content: bytes,
     language: str = "",
+    budget: Optional[ParseBudget] = None,
 ) -> Optional[ASTPreparedFile]:
-    resolved_language = (language or "").strip().lower() or infer_language_from_path(path)
-    if resolved_language not in {"python", "java", "c", "cpp", "javascript"}:
-        return None
+    """
+    Parse one stored file into an AST feature handoff.
 
+    Returns None for unsupported languages or undecodable content, and lets
+    `ParseBudgetExceeded` propagate when the file is over `budget`.
+    """
     source_code = decode_file_content(content)
     if source_code is None:
         return None
+    return prepare_ast_source(
+        file_id=file_id,
+        path=path,
+        source_code=source_code,
+        language=language,
+        budget=budget,
+    )
+
+
+def prepare_ast_source(
+    *,
+    file_id: Any,
+    path: str,
+    source_code: str,
+    language: str = "",
+    budget: Optional[ParseBudget] = None,
+) -> Optional[ASTPreparedFile]:
+    """Same as `prepare_ast_file` for content that has already been decoded."""
+    budget = budget or ParseBudget()
+    resolved_language = (language or "").strip().lower() or infer_language_from_path(path)
+    if resolved_language not in {"python", "java", "c", "cpp", "javascript"}:
+        return None
 
     parsed = parse_and_collect(
         source_code,
@@ -78,6 +226,11 @@ def prepare_ast_file(
         normalize_statements=True,
         build_handoff=True,
         file_path=path,
+        max_nodes=budget.max_nodes,
+        timeout_micros=budget.timeout_ms * 1000 if budget.timeout_ms > 0 else None,
+        max_source_bytes=budget.max_source_bytes if budget.max_source_bytes > 0 else None,
+        enforce_node_budget=True,
+        segment_units=True,
     )
 
     return ASTPreparedFile(
@@ -86,17 +239,162 @@ def prepare_ast_file(
         language=resolved_language,
         source_code=source_code,
         handoff=parsed["feature_handoff"],
+        functions=parsed["function_units"],
+        vectors=characteristic_vectors(parsed["feature_handoff"]),
     )
 
 
+def match_prepared_functions(prepared_files: List[ASTPreparedFile]) -> List[Dict[str, Any]]:
+    """Run-wide function-to-function matches found through the function index."""
+    return find_function_matches(
+        [(prepared.file_id, prepared.language, prepared.functions) for prepared in prepared_files]
+    )
+
+
+def find_prepared_clones(prepared_files: List[ASTPreparedFile]) -> List[Dict[str, Any]]:
+    """Run-wide near-miss subtree clones found through characteristic-vector LSH."""
+    return find_near_miss_clones(
+        [(prepared.file_id, prepared.language, prepared.vectors) for prepared in prepared_files]
+    )
+
+
+def gate_pairs_by_function_matches(
+    prepared_files: List[ASTPreparedFile],
+    candidate_pairs: set[tuple[str, str]],
+    function_matches: List[Dict[str, Any]],
+) -> set[tuple[str, str]]:
+    """
+    Drop candidate pairs whose files both have indexed functions but share no
+    function match. Files without functions (scripts) are never gated.
+    """
+    with_functions = {str(prepared.file_id) for prepared in prepared_files if prepared.functions}
+    matched = {(str(item["file_a_id"]), str(item["file_b_id"])) for item in function_matches}
+    return {
+        pair
+        for pair in candidate_pairs
+        if pair in matched or pair[0] not in with_functions or pair[1] not in with_functions
+    }
+
+
+def _ngram_features(handoff: Dict[str, Any], n: int) -> tuple[List[int], List[tuple[int, int]]]:
+    tokens = handoff.get("feature_tokens", [])
+    spans = handoff.get("token_spans", [])
+    hashes: List[int] = []
+    windows: List[tuple[int, int]] = []
+    for start in range(len(tokens) - n + 1):
+        window = _window_span(spans, start, n)
+        hashes.append(stable_hash64(tokens[start : start + n]))
+        windows.append((window["start_byte"], window["end_byte"]))
+    return hashes, windows
+
+
+def _ast_comparison(file_a: ASTPreparedFile, file_b: ASTPreparedFile, shared_count: int, union_count: int) -> Dict[str, Any]:
+    return {
+        "file_a_id": file_a.file_id,
+        "file_b_id": file_b.file_id,
+        "language": file_a.language,
+        "ast_score": shared_count / union_count if union_count else 1.0,
+        "matched_ngrams": shared_count,
+        "method": "ast_node_ngrams_jaccard",
+    }
+
+
+def add_ast_evidence(
+    comparisons: List[Dict[str, Any]], prepared_files: List[ASTPreparedFile], *, n: int = 3
+) -> None:
+    """
+    Fill in the `evidence` of comparisons scored with evidence=False, e.g.
+    only for the pairs that are stored.
+    """
+    files = {str(prepared.file_id): prepared for prepared in prepared_files}
+    for comparison in comparisons:
+        if "evidence" not in comparison:
+            file_a, file_b = files[str(comparison["file_a_id"])], files[str(comparison["file_b_id"])]
+            comparison["evidence"] = compare_feature_handoffs(file_a.handoff, file_b.handoff, n=n)["evidence"]
+
+
+def _compare_files_in_arena(
+    prepared_files: List[ASTPreparedFile],
+    *,
+    n: int,
+    candidate_pairs: Optional[set[tuple[str, str]]],
+    processes: int,
+    progress: Optional[ProgressCallback] = None,
+) -> List[Dict[str, Any]]:
+    order, bounds = language_buckets([prepared.language for prepared in prepared_files])
+    files = [prepared_files[idx] for idx in order]
+    allowed_pairs = None
+    if candidate_pairs is not None:
+        position = {str(prepared.file_id): idx for idx, prepared in enumerate(files)}
+        allowed_pairs = {
+            (position[a], position[b])
+            for a, b in candidate_pairs
+            if a in position and b in position and position[a] < position[b]
+        }
+
+    features = [_ngram_features(prepared.handoff, n) for prepared in files]
+    with FeatureArena.create([f[0] for f in features], [f[1] for f in features]) as arena:
+        scores, worker_cpu = score_in_arena(
+            arena, bounds, processes=processes, allowed_pairs=allowed_pairs, progress=progress
+        )
+    # the pool's CPU belongs to the step being measured, not to its thread
+    record(cpu_ms=worker_cpu * 1000)
+
+    return [
+        _ast_comparison(files[index_a], files[index_b], shared_count, union_count)
+        for index_a, index_b, shared_count, union_count in scores
+    ]
+
+
 def compare_prepared_files(
     prepared_files: List[ASTPreparedFile],
     *,
     n: int = 3,
     candidate_pairs: Optional[set[tuple[str, str]]] = None,
+    processes: Optional[int] = None,
+    cosine_floor: Optional[float] = None,
+    progress: Optional[ProgressCallback] = None,
+    evidence: bool = True,
 ) -> List[Dict[str, Any]]:
+    """
+    Score same-language pairs by AST node n-gram Jaccard.
+
+    With `cosine_floor` > 0, pairs whose node-type histograms fall below that
+    cosine are dropped before any n-gram work. With `processes` > 1 (default
+    `COMPARE_PROCESSES`) n-gram hashes and window spans are packed into a
+    shared-memory `FeatureArena` and pair ranges are scored by a process pool.
+    With evidence=False only scores are produced; pass the comparisons that
+    need evidence to `add_ast_evidence` afterwards.
+    """
+    if cosine_floor:
+        prefiltered = cosine_prefilter_pairs(
+            [(prepared.file_id, prepared.language, prepared.handoff) for prepared in prepared_files],
+            cosine_floor,
+        )
+        candidate_pairs = prefiltered if candidate_pairs is None else candidate_pairs & prefiltered
+
+    processes = COMPARE_PROCESSES if processes is None else processes
+    if can_use_process_pool(processes):
+        comparisons = _compare_files_in_arena(
+            prepared_files,
+            n=n,
+            candidate_pairs=candidate_pairs,
+            processes=processes,
+            progress=progress,
+        )
+        if evidence:
+            add_ast_evidence(comparisons, prepared_files, n=n)
+        comparisons.sort(key=lambda item: item["ast_score"], reverse=True)
+        return comparisons
+
     comparisons: List[Dict[str, Any]] = []
+    if candidate_pairs is not None:
+        prepared_ids = {str(prepared.file_id) for prepared in prepared_files}
+        total = sum(1 for a, b in candidate_pairs if a in prepared_ids and b in prepared_ids)
+    else:
+        total = same_language_pair_count([prepared.language for prepared in prepared_files])
 
+    distinct: Dict[int, set[int]] = {}
     for file_a, file_b in combinations(prepared_files, 2):
         if file_a.language != file_b.language:
             continue
@@ -104,18 +402,27 @@ def compare_prepared_files(
         if candidate_pairs is not None and pair_key not in candidate_pairs:
             continue
 
-        result = compare_feature_handoffs(file_a.handoff, file_b.handoff, n=n)
-        comparisons.append(
-            {
-                "file_a_id": file_a.file_id,
-                "file_b_id": file_b.file_id,
-                "language": file_a.language,
-                "ast_score": result["score"],
-                "evidence": result["evidence"],
-                "matched_ngrams": result["matched_ngrams"],
-                "method": result["method"],
-            }
-        )
+        if not evidence:
+            for prepared in (file_a, file_b):
+                if id(prepared) not in distinct:
+                    distinct[id(prepared)] = set(_ngram_features(prepared.handoff, n)[0])
+            shared_count, union_count = score_distinct(distinct[id(file_a)], distinct[id(file_b)])
+            comparisons.append(_ast_comparison(file_a, file_b, shared_count, union_count))
+        else:
+            result = compare_feature_handoffs(file_a.handoff, file_b.handoff, n=n)
+            comparisons.append(
+                {
+                    "file_a_id": file_a.file_id,
+                    "file_b_id": file_b.file_id,
+                    "language": file_a.language,
+                    "ast_score": result["score"],
+                    "evidence": result["evidence"],
+                    "matched_ngrams": result["matched_ngrams"],
+                    "method": result["method"],
+                }
+            )
+        if progress is not None:
+            progress(len(comparisons), total)
 
     comparisons.sort(key=lambda item: item["ast_score"], reverse=True)
     return comparisons
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 from collections import defaultdict
-from typing import Any, Dict, List, Sequence, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .features import SpanTable
 
 
 def _extract_ngrams(tokens: Sequence[str], n: int) -> List[Tuple[str, ...]]:
@@ -20,9 +22,12 @@ def _index_ngram_positions(ngrams: Sequence[Tuple[str, ...]]) -> Dict[Tuple[str,
 
 
 def _window_span(token_spans: Sequence[Dict[str, Any]], start_index: int, n: int) -> Dict[str, Any]:
-    window = token_spans[start_index : start_index + n]
-    start_byte = min(item["start_byte"] for item in window)
-    end_byte = max(item["end_byte"] for item in window)
+    if isinstance(token_spans, SpanTable):
+        start_byte, end_byte = token_spans.window(start_index, n)
+    else:
+        window = token_spans[start_index : start_index + n]
+        start_byte = min(item["start_byte"] for item in window)
+        end_byte = max(item["end_byte"] for item in window)
     return {
         "token_start_index": start_index,
         "token_end_index": start_index + n - 1,
@@ -35,6 +40,8 @@ def _window_span(token_spans: Sequence[Dict[str, Any]], start_index: int, n: int
 def _max_end_byte(token_spans: Sequence[Dict[str, Any]]) -> int:
     if not token_spans:
         return 0
+    if isinstance(token_spans, SpanTable):
+        return max(token_spans.ends)
     return max(item["end_byte"] for item in token_spans)
 
 
@@ -52,6 +59,44 @@ def _is_useful_evidence_window(
     return window["span_length"] / file_size <= max_span_ratio
 
 
+def build_evidence_item(
+    ngram: Tuple[str, ...],
+    raw_locations_a: List[Dict[str, Any]],
+    raw_locations_b: List[Dict[str, Any]],
+    *,
+    support_count: int,
+    file_size_a: int,
+    file_size_b: int,
+) -> Optional[Dict[str, Any]]:
+    """Filter matched windows for one shared n-gram; None when nothing useful is left."""
+    locations_a = [
+        loc for loc in raw_locations_a if _is_useful_evidence_window(ngram, loc, file_size=file_size_a)
+    ]
+    locations_b = [
+        loc for loc in raw_locations_b if _is_useful_evidence_window(ngram, loc, file_size=file_size_b)
+    ]
+    if not locations_a or not locations_b:
+        return None
+    return {
+        "ngram": list(ngram),
+        "support_count": support_count,
+        "locations_a": locations_a,
+        "locations_b": locations_b,
+    }
+
+
+def rank_evidence(evidence: List[Dict[str, Any]], max_evidence_items: int = 999999) -> List[Dict[str, Any]]:
+    evidence = sorted(
+        evidence,
+        key=lambda item: (
+            item["support_count"],
+            -min(loc["span_length"] for loc in item["locations_a"] + item["locations_b"]),
+        ),
+        reverse=True,
+    )
+    return evidence[:max_evidence_items]
+
+
 def compare_feature_handoffs(
     handoff_a: Dict[str, Any],
     handoff_b: Dict[str, Any],
@@ -94,42 +139,18 @@ def compare_feature_handoffs(
     for ng in sorted(shared):
         a_positions = idx_a.get(ng, [])[:max_evidence_per_ngram]
         b_positions = idx_b.get(ng, [])[:max_evidence_per_ngram]
-
-        raw_locations_a = [_window_span(spans_a, pos, n) for pos in a_positions]
-        raw_locations_b = [_window_span(spans_b, pos, n) for pos in b_positions]
-        filtered_locations_a = [
-            loc for loc in raw_locations_a if _is_useful_evidence_window(ng, loc, file_size=file_size_a)
-        ]
-        filtered_locations_b = [
-            loc for loc in raw_locations_b if _is_useful_evidence_window(ng, loc, file_size=file_size_b)
-        ]
-
-        if not filtered_locations_a or not filtered_locations_b:
-            continue
-
-        locations_a = filtered_locations_a
-        locations_b = filtered_locations_b
-
-        evidence.append(
-            {
-                "ngram": list(ng),
-                "support_count": min(len(idx_a.get(ng, [])), len(idx_b.get(ng, []))),
-                "locations_a": locations_a,
-                "locations_b": locations_b,
-            }
+        item = build_evidence_item(
+            ng,
+            [_window_span(spans_a, pos, n) for pos in a_positions],
+            [_window_span(spans_b, pos, n) for pos in b_positions],
+            support_count=min(len(idx_a.get(ng, [])), len(idx_b.get(ng, []))),
+            file_size_a=file_size_a,
+            file_size_b=file_size_b,
         )
+        if item is not None:
+            evidence.append(item)
 
-    evidence = [
-        item for item in evidence if item["locations_a"] and item["locations_b"]
-    ]
-    evidence.sort(
-        key=lambda item: (
-            item["support_count"],
-            -min(loc["span_length"] for loc in item["locations_a"] + item["locations_b"]),
-        ),
-        reverse=True,
-    )
-    evidence = evidence[:max_evidence_items]
+    evidence = rank_evidence(evidence, max_evidence_items)
 
     return {
         "method": "ast_node_ngrams_jaccard",
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from similarity.thresholds import SIMILARITY_THRESHOLD_MIN
+
+
+# Equal-width final-score bins kept per run (20 -> 0.05 wide).
+SCORE_HISTOGRAM_BINS = int(os.getenv("SCORE_HISTOGRAM_BINS", "20"))
+
+
+def resolve_result_floor(config: Optional[Dict[str, Any]]) -> float:
+    """
+    Lowest final score stored as a PairResult; pairs below it are only
+    counted in the run's score histogram. Set per run with
+    config_json["result_floor"] (0 keeps every pair).
+    """
+    return float((config or {}).get("result_floor", SIMILARITY_THRESHOLD_MIN))
+
+
+def empty_bins(bins: int = SCORE_HISTOGRAM_BINS) -> List[int]:
+    return [0] * bins
+
+
+def score_bin(score: float, bins: int = SCORE_HISTOGRAM_BINS) -> int:
+    # 1.0 belongs to the last bin
+    return min(bins - 1, max(0, int(score * bins)))
+
+
+def add_bins(total: List[int], counts: Iterable[int]) -> List[int]:
+    for index, count in enumerate(counts):
+        total[index] += count
+    return total
+
+
+def histogram_rows(run_id: Any, pair_counts: List[int], stored_counts: List[int]) -> List[Dict[str, Any]]:
+    bins = len(pair_counts)
+    return [
+        {
+            "run_id": run_id,
+            "bin": index,
+            "lower": round(index / bins, 6),
+            "upper": round((index + 1) / bins, 6),
+            "pair_count": pair_counts[index],
+            "stored_count": stored_counts[index],
+        }
+        for index in range(bins)
+    ]
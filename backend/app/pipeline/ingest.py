@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional
+
+from app.pipeline.ast.run_stage import ASTPreparedFile, decode_file_content, infer_language_from_path
+from app.pipeline.token.run_stage import TokenFile
+
+
+@dataclass(frozen=True, slots=True)
+class IngestedFile:
+    file_id: Any
+    path: str
+    language: Optional[str]
+    source_code: Optional[str]
+    decoded: bool
+
+    def without_source(self) -> "IngestedFile":
+        return replace(self, source_code=None)
+
+
+@dataclass
+class RunRegistry:
+    """
+    Per-run, in-memory hand-off between pipeline stages.
+
+    `files` holds only each file's id, path, language and whether it
+    decoded; the prepare step streams content from the database a batch at
+    a time, decodes each file once for both the token and AST features and
+    keeps only the compacted prepared files here, so no stage holds the
+    dataset's source at once.
+    """
+
+    files: List[IngestedFile] = field(default_factory=list)
+    token_files: List[TokenFile] = field(default_factory=list)
+    ast_files: List[ASTPreparedFile] = field(default_factory=list)
+    config: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def decoded_files(self) -> List[IngestedFile]:
+        return [item for item in self.files if item.decoded]
+
+
+def ingest_file(*, file_id: Any, path: str, content: Optional[bytes], language: str = "") -> IngestedFile:
+    source_code = decode_file_content(content)
+    return IngestedFile(
+        file_id=file_id,
+        path=path,
+        language=(language or "").strip().lower() or infer_language_from_path(path),
+        source_code=source_code,
+        decoded=source_code is not None,
+    )
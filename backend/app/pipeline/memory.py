@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import logging
+import os
+import resource
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# A step whose peak RSS goes over this is logged (and flagged in its run
+# metric); the step still runs to completion. 0 disables the check.
+MEMORY_SOFT_LIMIT_MB = float(os.getenv("MEMORY_SOFT_LIMIT_MB", "0"))
+# Allocation sites kept per step when tracemalloc tracing is on.
+MEMORY_TOP_ALLOCATIONS = int(os.getenv("MEMORY_TOP_ALLOCATIONS", "10"))
+
+MB = 1024 * 1024
+# allocation sites in our own code are reported relative to backend/
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@dataclass(frozen=True)
+class MemoryOptions:
+    trace: bool = False
+    top: int = MEMORY_TOP_ALLOCATIONS
+    soft_limit_mb: float = MEMORY_SOFT_LIMIT_MB
+
+
+def resolve_memory_options(config: Optional[Dict[str, Any]]) -> MemoryOptions:
+    """
+    Read `config_json["memory"]`: true turns on tracemalloc, or
+    {"trace": true, "top": 10, "soft_limit_mb": 2048} also overrides the
+    number of allocation sites kept and the soft limit.
+    """
+    value = (config or {}).get("memory")
+    if not isinstance(value, dict):
+        return MemoryOptions(trace=bool(value))
+    return MemoryOptions(
+        trace=bool(value.get("trace", True)),
+        top=int(value.get("top", MEMORY_TOP_ALLOCATIONS)),
+        soft_limit_mb=float(value.get("soft_limit_mb", MEMORY_SOFT_LIMIT_MB)),
+    )
+
+
+_options: ContextVar[MemoryOptions] = ContextVar("memory_options", default=MemoryOptions())
+
+# Tasks this process may run at once: the pool size of a threads-pool
+# worker, 1 for prefork children and outside Celery.
+_concurrent_tasks = 1
+
+
+def set_concurrent_tasks(count: int) -> None:
+    global _concurrent_tasks
+    _concurrent_tasks = max(1, count)
+
+
+def process_is_shared() -> bool:
+    """
+    True when other tasks may run in this process at the same time. Peak
+    RSS, tracemalloc and cProfile are process-wide, so they would mix the
+    runs up and are left off.
+    """
+    return _concurrent_tasks > 1
+
+
+@contextmanager
+def track_memory(config: Optional[Dict[str, Any]]) -> Iterator[MemoryOptions]:
+    """Apply a run's memory options to the measure_stage blocks inside."""
+    options = resolve_memory_options(config)
+    token = _options.set(options)
+    started = options.trace and not process_is_shared() and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield options
+    finally:
+        if started:
+            tracemalloc.stop()
+        _options.reset(token)
+
+
+def reset_peak_rss() -> bool:
+    # Linux lets a process reset its own high-water mark, so each step gets
+    # its own peak instead of the largest one since the worker started
+    try:
+        with open("/proc/self/clear_refs", "w") as handle:
+            handle.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as handle:
+            for line in handle:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def allocation_site(filename: str, lineno: int) -> str:
+    # the part of the path that names the package: app/tasks.py, sqlalchemy/orm/session.py
+    if "site-packages" in filename:
+        path = filename.rsplit("site-packages", 1)[1].lstrip("/\\")
+    elif filename.startswith(BACKEND_ROOT + os.sep):
+        path = os.path.relpath(filename, BACKEND_ROOT)
+    else:
+        path = filename
+    return f"{path.replace(os.sep, '/')}:{lineno}"
+
+
+def top_allocations(limit: int) -> List[Dict[str, Any]]:
+    """Live allocations grouped by source line, largest first."""
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        )
+    )
+    return [
+        {
+            "site": allocation_site(stat.traceback[0].filename, stat.traceback[0].lineno),
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+class StageMemory:
+    """Memory of one measured step; see measure_stage."""
+
+    def __init__(self):
+        self.options = _options.get()
+        self.shared = process_is_shared()
+        self.peak_is_per_step = not self.shared and reset_peak_rss()
+        self.tracing = self.options.trace and not self.shared and tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.reset_peak()
+
+    def finish(self, metric, run_id: Any) -> None:
+        """Fill in the memory fields of a pipeline.metrics.StageMetric."""
+        if self.shared:
+            metric.details["peak_rss_scope"] = "shared"
+            if self.options.trace:
+                metric.details["trace_skipped"] = "shared process"
+            return
+        metric.peak_rss_mb = round(peak_rss_bytes() / MB, 1)
+        if not self.peak_is_per_step:
+            metric.details["peak_rss_scope"] = "process"
+        if self.tracing:
+            metric.traced_peak_mb = round(tracemalloc.get_traced_memory()[1] / MB, 1)
+            metric.details["top_allocations"] = top_allocations(self.options.top)
+
+        limit = self.options.soft_limit_mb
+        if limit and metric.peak_rss_mb > limit:
+            metric.details["over_soft_limit_mb"] = limit
+            logger.warning(
+                "run %s step %s/%s peaked at %.1f MB RSS, over the %.0f MB soft limit",
+                run_id,
+                metric.stage,
+                metric.step,
+                metric.peak_rss_mb,
+                limit,
+            )
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from app.core.db import track_queries
+from app.core.monitoring import observe_stage
+from app.models.models import RunMetric
+from app.pipeline.memory import StageMemory
+from app.pipeline.profiling import active_profiler
+
+
+@dataclass
+class StageMetric:
+    """
+    Timing and counters for one pipeline step. `pairs_considered` is every
+    same-language pair in the step's scope, `pairs_scored` the pairs left
+    after candidate filtering, and `pairs_persisted` those stored as results.
+    """
+
+    stage: str
+    step: str
+    seq: Optional[int] = None
+    wall_ms: float = 0.0
+    cpu_ms: float = 0.0
+    files: int = 0
+    pairs_considered: int = 0
+    pairs_scored: int = 0
+    pairs_persisted: int = 0
+    rows_written: int = 0
+    evidence_rows: int = 0
+    bytes_written: int = 0
+    db_queries: int = 0
+    db_ms: float = 0.0
+    peak_rss_mb: Optional[float] = None
+    traced_peak_mb: Optional[float] = None
+    details: Dict[str, Any] = field(default_factory=dict)
+
+    def row(self, run_id: Any) -> Dict[str, Any]:
+        values = asdict(self)
+        values["details"] = self.details or None
+        return {"run_id": run_id, **values}
+
+
+logger = logging.getLogger(__name__)
+
+_active: ContextVar[Optional[StageMetric]] = ContextVar("active_stage_metric", default=None)
+
+
+def active_metric() -> Optional[StageMetric]:
+    return _active.get()
+
+
+def cpu_seconds() -> float:
+    # CPU of the calling thread only: a threads-pool worker runs several
+    # steps at once, so process-wide CPU would mix them up. Arena pools
+    # report their workers' CPU through record(cpu_ms=...).
+    return time.thread_time()
+
+
+def record(**counts: float) -> None:
+    """Add to the counters of the step being measured; a no-op outside measure_stage."""
+    metric = _active.get()
+    if metric is None:
+        return
+    for name, value in counts.items():
+        setattr(metric, name, getattr(metric, name) + value)
+
+
+def payload_bytes(row: Dict[str, Any]) -> int:
+    # approximate size of the values sent to the database
+    size = 0
+    for value in row.values():
+        if value is None:
+            continue
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            size += len(value)
+        elif isinstance(value, str):
+            size += len(value.encode("utf-8"))
+        elif isinstance(value, uuid.UUID):
+            size += 16
+        elif isinstance(value, (dict, list, tuple)):
+            size += len(json.dumps(value, default=str))
+        else:
+            size += 8
+    return size
+
+
+def record_rows(table_name: str, rows: List[Dict[str, Any]]) -> None:
+    """Called by bulk_insert for every batch it writes."""
+    metric = _active.get()
+    if metric is None:
+        return
+    metric.rows_written += len(rows)
+    metric.bytes_written += sum(payload_bytes(row) for row in rows)
+    if table_name == "match_evidence":
+        metric.evidence_rows += len(rows)
+
+
+def record_queries(metric: StageMetric, queries, run_id: Any) -> None:
+    """Copy a step's core.db.QueryStats onto its metric."""
+    metric.db_queries = queries.count
+    metric.db_ms = round(queries.total_ms, 3)
+    if queries.count:
+        metric.details["slowest_statements"] = queries.slowest()
+    repeated = queries.repeated()
+    if repeated:
+        metric.details["repeated_statements"] = repeated
+    for item in repeated:
+        logger.warning("run %s step %s ran %dx: %s", run_id, metric.step, item["count"], item["statement"])
+
+
+@contextmanager
+def measure_stage(
+    db: Session, run_id: Any, stage: str, step: str, *, seq: Optional[int] = None, **details: Any
+) -> Iterator[StageMetric]:
+    """
+    Measure a pipeline step and store it as a run_metrics row once it
+    completes (and export it to /api/metrics). Steps are named after the
+    checkpoints they produce; a step that runs again (a resumed run, a
+    redelivered shard) replaces its earlier row. Rows written through
+    bulk_insert inside the block are counted automatically; a step that
+    raises is not recorded. A run profiled with `steps` (pipeline.profiling)
+    is profiled inside the blocks of those steps. CPU is the step's own
+    thread plus its comparison pools. Peak RSS is recorded for every step,
+    tracemalloc allocation sites when the run enables them, unless the
+    worker runs several tasks in one process (pipeline.memory). SQL statements are counted and timed (core.db), and
+    repeated ones logged.
+    """
+    metric = StageMetric(stage, step, seq, details=dict(details))
+    token = _active.set(metric)
+    memory = StageMemory()
+    profiler = active_profiler()
+    profiling = profiler is not None and profiler.wants(step)
+    if profiling:
+        profiler.enable()
+    started, started_cpu = time.perf_counter(), cpu_seconds()
+    try:
+        with track_queries() as queries:
+            yield metric
+    finally:
+        metric.wall_ms = round((time.perf_counter() - started) * 1000, 3)
+        metric.cpu_ms = round(metric.cpu_ms + (cpu_seconds() - started_cpu) * 1000, 3)
+        if profiling:
+            profiler.disable()
+        memory.finish(metric, run_id)
+        record_queries(metric, queries, run_id)
+        _active.reset(token)
+
+    observe_stage(metric)
+    # written directly rather than through bulk_insert, which would count it
+    db.execute(
+        delete(RunMetric).where(
+            RunMetric.run_id == run_id,
+            RunMetric.step == step,
+            RunMetric.seq.is_(None) if seq is None else RunMetric.seq == seq,
+        )
+    )
+    db.execute(insert(RunMetric.__table__), [metric.row(run_id)])
+    db.commit()
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import os
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.pipeline.metrics import record_rows
+
+
+# Rows sent per INSERT executemany; each batch is committed on its own
+# so a run never holds one transaction over millions of evidence rows.
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "5000"))
+
+
+def chunked(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, max(1, size)))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_insert(
+    db: Session,
+    model: Any,
+    rows: Iterable[Dict[str, Any]],
+    *,
+    batch_size: int = PERSIST_BATCH_SIZE,
+    commit: bool = True,
+    after_batch: Optional[Callable[[], None]] = None,
+) -> int:
+    """
+    Insert plain dict rows through the model's Core table, `batch_size` rows
+    per executemany, committing after each batch. With commit=False every
+    batch stays in the caller's transaction instead.
+
+    `rows` may be a generator; at most one batch is materialised at a time.
+    Column defaults (ids, weights) are applied by SQLAlchemy as usual: ids
+    are Python-side uuid4s so the same rows insert on SQLite. On Postgres the
+    bulk-written tables also default their ids to gen_random_uuid()
+    (migration 80b72f4f8ee2) for loads that bypass the models.
+    Rows and bytes are counted towards the pipeline step being measured.
+    `after_batch` is called once each batch is written (e.g. a heartbeat).
+    """
+    table = model.__table__
+    written = 0
+    for chunk in chunked(rows, batch_size):
+        db.execute(insert(table), chunk)
+        if commit:
+            db.commit()
+        record_rows(table.name, chunk)
+        written += len(chunk)
+        if after_batch is not None:
+            after_batch()
+    return written
+
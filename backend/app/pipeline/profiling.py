@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import cProfile
+import marshal
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from app.models.models import RunArtifact
+from app.pipeline.memory import process_is_shared
+
+
+# How often the sampler records the worker thread's stack.
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "10"))
+
+PSTATS_KIND = "profile_pstats"
+COLLAPSED_KIND = "profile_collapsed"
+
+
+@dataclass(frozen=True)
+class ProfileOptions:
+    steps: Optional[frozenset[str]] = None  # None profiles the whole task
+    interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS
+
+
+def resolve_profile_options(config: Optional[Dict[str, Any]]) -> Optional[ProfileOptions]:
+    """
+    Read `config_json["profile"]`: true profiles every step, or
+    {"steps": ["compare", ...], "interval_ms": 5} limits it to those
+    measured steps (see pipeline.metrics) and sets the sampling interval.
+    """
+    value = (config or {}).get("profile")
+    if not value:
+        return None
+    if not isinstance(value, dict):
+        return ProfileOptions()
+    steps = value.get("steps")
+    return ProfileOptions(
+        steps=frozenset(steps) if steps else None,
+        interval_ms=float(value.get("interval_ms", PROFILE_SAMPLE_INTERVAL_MS)),
+    )
+
+
+def frame_label(code) -> str:
+    # function (package/module.py:line); ";" separates frames in collapsed stacks
+    path = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """Samples one thread's stack on a timer into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, interval_ms: float):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.counts: Counter = Counter()
+        self._active = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="run-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def resume(self) -> None:
+        self._active.set()
+
+    def pause(self) -> None:
+        self._active.clear()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if not self._active.is_set():
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> bytes:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items())).encode("utf-8")
+
+
+class RunProfiler:
+    """
+    cProfile (for pstats) and a stack sampler (for flame graphs) over the
+    calling thread. Work done in the comparison process pools shows up as
+    time spent waiting on the pool. cProfile sees every thread of the
+    process, so in a worker running several tasks at once only the sampler
+    is used.
+    """
+
+    def __init__(self, options: ProfileOptions):
+        self.options = options
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), options.interval_ms)
+        self.deterministic = not process_is_shared()
+        self._depth = 0
+
+    def wants(self, step: str) -> bool:
+        return self.options.steps is None or step in self.options.steps
+
+    def enable(self) -> None:
+        self._depth += 1
+        if self._depth == 1:
+            if self.deterministic:
+                try:
+                    self.profile.enable()
+                except ValueError:
+                    # Python 3.12+ allows one cProfile per process (two
+                    # profiled runs in the thread fallback); keep sampling
+                    self.deterministic = False
+            self.sampler.resume()
+
+    def disable(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            if self.deterministic:
+                self.profile.disable()
+            self.sampler.pause()
+
+    def pstats(self) -> bytes:
+        # the format pstats.Stats / snakeviz read from a .pstats file
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+
+_active: ContextVar[Optional[RunProfiler]] = ContextVar("active_run_profiler", default=None)
+
+
+def active_profiler() -> Optional[RunProfiler]:
+    return _active.get()
+
+
+@contextmanager
+def profile_run(db: Session, run_id: Any, config: Optional[Dict[str, Any]], name: str) -> Iterator[Optional[RunProfiler]]:
+    """
+    Profile the block when the run's config asks for it and store the result
+    as run artifacts named `name`, also when the block raises. With
+    `steps` set only those measure_stage blocks are profiled.
+    """
+    options = resolve_profile_options(config)
+    if options is None:
+        yield None
+        return
+
+    profiler = RunProfiler(options)
+    token = _active.set(profiler)
+    profiler.sampler.start()
+    if options.steps is None:
+        profiler.enable()
+    try:
+        yield profiler
+    except BaseException:
+        # the failed transaction would also take the profile down with it
+        db.rollback()
+        raise
+    finally:
+        if options.steps is None:
+            profiler.disable()
+        profiler.sampler.stop()
+        _active.reset(token)
+        save_profile(db, run_id, name, profiler)
+
+
+def save_profile(db: Session, run_id: Any, name: str, profiler: RunProfiler) -> None:
+    # a resumed run or retried shard replaces its earlier profile
+    db.execute(delete(RunArtifact).where(RunArtifact.run_id == run_id, RunArtifact.name == name))
+    rows = [
+        {"run_id": run_id, "kind": kind, "name": name, "content": content, "size_bytes": len(content)}
+        for kind, content in ((PSTATS_KIND, profiler.pstats()), (COLLAPSED_KIND, profiler.sampler.collapsed()))
+    ]
+    db.execute(insert(RunArtifact.__table__), rows)
+    db.commit()
+
+
+class _LoadedStats:
+    # lets pstats.Stats load a marshalled stats dict without a file
+    def __init__(self, blob: bytes):
+        self.stats = marshal.loads(blob)
+
+    def create_stats(self) -> None:
+        pass
+
+
+def merge_pstats(blobs: Iterable[bytes]) -> bytes:
+    """Combine the pstats of several tasks (pipeline and shards) into one."""
+    merged: Optional[pstats.Stats] = None
+    for blob in blobs:
+        if merged is None:
+            merged = pstats.Stats(_LoadedStats(blob))
+        else:
+            merged.add(_LoadedStats(blob))
+    return marshal.dumps(merged.stats if merged is not None else {})
+
+
+def merge_collapsed(blobs: Iterable[bytes]) -> bytes:
+    counts: Counter = Counter()
+    for blob in blobs:
+        for line in blob.decode("utf-8").splitlines():
+            stack, _, count = line.rpartition(" ")
+            if stack:
+                counts[stack] += int(count)
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items())).encode("utf-8")
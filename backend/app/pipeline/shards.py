@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Any, List, Sequence, Set, Tuple
+
+
+# Files per row/column block of a comparison shard. 0 keeps comparison inside
+# the run_pipeline task; a positive value fans it out as a Celery chord.
+COMPARE_SHARD_FILES = int(os.getenv("COMPARE_SHARD_FILES", "0"))
+
+
+@dataclass(frozen=True)
+class CompareShard:
+    """
+    One block of the same-language pair matrix: every row file is compared
+    with every column file. Diagonal shards (rows == cols) cover the upper
+    triangle of their block only.
+    """
+
+    language: str
+    row_file_ids: Tuple[str, ...]
+    col_file_ids: Tuple[str, ...]
+
+    @property
+    def diagonal(self) -> bool:
+        return self.row_file_ids == self.col_file_ids
+
+    @property
+    def file_ids(self) -> List[str]:
+        return sorted(set(self.row_file_ids) | set(self.col_file_ids))
+
+    def pair_keys(self) -> Set[Tuple[str, str]]:
+        # (smaller id, larger id), the orientation INGEST's File.id ordering gives
+        if self.diagonal:
+            ids = self.row_file_ids
+            return {(ids[i], ids[j]) for i in range(len(ids)) for j in range(i + 1, len(ids))}
+        return {(min(a, b), max(a, b)) for a in self.row_file_ids for b in self.col_file_ids}
+
+
+def plan_compare_shards(files: Sequence[Tuple[Any, str]], shard_files: int) -> List[CompareShard]:
+    """
+    Split the same-language pairs of `files` ((file_id, language) tuples)
+    into row/column blocks of `shard_files` files each.
+    """
+    by_language: dict[str, List[str]] = {}
+    for file_id, language in files:
+        by_language.setdefault(language, []).append(str(file_id))
+
+    shards: List[CompareShard] = []
+    for language in sorted(by_language):
+        ids = sorted(by_language[language])
+        if len(ids) < 2:
+            continue
+        blocks = [tuple(ids[start : start + shard_files]) for start in range(0, len(ids), max(1, shard_files))]
+        for row in range(len(blocks)):
+            for col in range(row, len(blocks)):
+                if row == col and len(blocks[row]) < 2:
+                    continue
+                shards.append(CompareShard(language, blocks[row], blocks[col]))
+    return shards
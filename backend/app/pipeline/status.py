@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.db import REPEATS_EXPECTED
+from app.models.models import Run, RunWarning
+from app.pipeline.persist import bulk_insert
+
+
+# Minimum time between two status writes while a stage reports progress.
+# Status and stage changes are always written straight away.
+STATUS_FLUSH_INTERVAL_MS = int(os.getenv("STATUS_FLUSH_INTERVAL_MS", "1000"))
+
+_RUN_FIELDS = ("status", "stage", "progress_pct", "error_message", "started_at", "finished_at")
+# Keys of runs.state_json. They are never read from config_json, and
+# create_run drops them from client-supplied configs.
+RUN_STATE_KEYS = ("checkpoints", "checkpoint_warnings", "progress", "undecoded_files")
+# shards and the chord callback leave runs in these states alone
+STOPPED_RUN_STATUSES = ("CANCELLED", "FAILED")
+
+
+class RunCancelled(Exception):
+    """
+    Raised inside a pipeline when its run was cancelled through the API, or
+    inside a shard once its run has been cancelled or has failed elsewhere.
+    """
+
+
+@dataclass
+class ProgressStep:
+    stage: str
+    unit: str
+    start_pct: int
+    end_pct: int
+    total: int
+    started: float
+    done: int = 0
+
+
+class RunStatusWriter:
+    """
+    In-memory copy of one run's status fields.
+
+    The run row is read once. `update` and `progress` change the in-memory
+    copy and `warn` buffers RunWarning rows; both are written back (one
+    UPDATE plus a bulk insert) at most every `flush_interval_ms`, or
+    immediately on a status/stage change. Detailed progress (done/total,
+    rate, ETA) is kept in `state_json["progress"]` and completed pipeline
+    steps in `state_json["checkpoints"]`; `config_json` is only read. Every
+    write also refreshes `heartbeat_at`, which tells a live run from one
+    whose worker was lost.
+
+    Writes never overwrite a CANCELLED status: a flush that finds the run
+    cancelled raises RunCancelled instead, which is how the preparation and
+    comparison loops notice a cancel request.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        run_id: str,
+        *,
+        flush_interval_ms: int = STATUS_FLUSH_INTERVAL_MS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.db = db
+        self.run_id = run_id
+        self.flush_interval = flush_interval_ms / 1000
+        self.clock = clock
+
+        run = db.query(Run).filter(Run.id == run_id).first()
+        self.exists = run is not None
+        self.fields: Dict[str, Any] = {name: getattr(run, name) for name in _RUN_FIELDS} if run else {}
+        self.config: Dict[str, Any] = dict(run.config_json or {}) if run else {}
+        self.state: Dict[str, Any] = dict(run.state_json or {}) if run else {}
+        self.step: Optional[ProgressStep] = None
+        self.warning_count = (
+            db.query(func.count(RunWarning.id)).filter(RunWarning.run_id == run_id).scalar() if run else 0
+        )
+        self._warnings: List[Dict[str, Any]] = []
+        self._dirty: Dict[str, Any] = {}
+        self._state_dirty = False
+        self._last_flush = float("-inf")
+        self._muted = False
+
+    def update(self, **fields: Any) -> None:
+        force = False
+        for name, value in fields.items():
+            if value is None or self.fields.get(name) == value:
+                continue
+            force = force or name in ("status", "stage")
+            self.fields[name] = value
+            self._dirty[name] = value
+        self._maybe_flush(force)
+
+    def warn(self, warning: dict) -> None:
+        if self._muted:
+            return
+        # stage/path/reason get their own columns; anything else goes to details
+        details = {key: value for key, value in warning.items() if key not in ("stage", "path", "reason")}
+        self._warnings.append(
+            {
+                "run_id": self.run_id,
+                "seq": self.warning_count,
+                "stage": warning.get("stage") or self.fields.get("stage"),
+                "path": warning.get("path"),
+                "reason": warning.get("reason", ""),
+                "details": details or None,
+            }
+        )
+        self.warning_count += 1
+        self._maybe_flush(False)
+
+    @contextmanager
+    def muted(self) -> Iterator[None]:
+        """Drop warnings raised inside the block (work replayed on resume)."""
+        self._muted = True
+        try:
+            yield
+        finally:
+            self._muted = False
+
+    def completed(self, checkpoint: str) -> bool:
+        return checkpoint in self.state.get("checkpoints", [])
+
+    def checkpoint(self, checkpoint: str) -> None:
+        """Record that a pipeline step's outputs are durable; written immediately."""
+        if self.completed(checkpoint):
+            return
+        self.state["checkpoints"] = [*self.state.get("checkpoints", []), checkpoint]
+        self.state["checkpoint_warnings"] = self.warning_count
+        self._state_dirty = True
+        self.flush()
+
+    def set_state(self, key: str, value: Any) -> None:
+        """Keep `value` in state_json[key]; written with the next flush or checkpoint."""
+        self.state[key] = value
+        self._state_dirty = True
+
+    def rewind(self) -> None:
+        """Drop warnings raised after the last checkpoint; that work runs again on resume."""
+        kept = self.state.get("checkpoint_warnings", 0)
+        if self.warning_count <= kept:
+            return
+        self.db.execute(delete(RunWarning).where(RunWarning.run_id == self.run_id, RunWarning.seq >= kept))
+        self.db.commit()
+        self.warning_count = kept
+
+    def begin_step(self, stage: str, unit: str, *, start_pct: int, end_pct: int, total: int = 0) -> None:
+        """Map `total` units of work in `stage` onto progress_pct start_pct..end_pct."""
+        self.step = ProgressStep(stage, unit, start_pct, end_pct, total, self.clock())
+        self._record_progress()
+        self.update(stage=stage, progress_pct=start_pct)
+
+    def progress(self, done: int, total: Optional[int] = None) -> None:
+        step = self.step
+        if step is None:
+            return
+        if total is not None:
+            step.total = total
+        step.done = done
+        self._record_progress()
+        span = step.end_pct - step.start_pct
+        fraction = min(1.0, step.done / step.total) if step.total else 0.0
+        self.update(progress_pct=step.start_pct + int(span * fraction))
+
+    def advance(self, count: int = 1) -> None:
+        if self.step is not None:
+            self.progress(self.step.done + count)
+
+    def heartbeat(self) -> None:
+        """
+        Refresh heartbeat_at during long work that reports no progress (the
+        function index, bulk inserts); throttled like progress writes.
+        """
+        if self.clock() - self._last_flush >= self.flush_interval:
+            self.flush(heartbeat=True)
+
+    def flush(self, heartbeat: bool = False) -> None:
+        if not self.exists or not (heartbeat or self._dirty or self._state_dirty or self._warnings):
+            return
+        values = {**self._dirty, "heartbeat_at": datetime.utcnow()}
+        if self._state_dirty:
+            values["state_json"] = dict(self.state)
+        # one write per flush interval for the whole step: not an N+1
+        result = self.db.execute(
+            update(Run)
+            .where(Run.id == self.run_id, Run.status != "CANCELLED")
+            .values(**values)
+            .execution_options(**{REPEATS_EXPECTED: True})
+        )
+        self.db.commit()
+        if result.rowcount == 0:
+            self._cancel()
+        bulk_insert(self.db, RunWarning, self._warnings)
+        self._warnings = []
+        self._dirty = {}
+        self._state_dirty = False
+        self._last_flush = self.clock()
+
+    def confirm_cancel(self) -> None:
+        """Record that this run's worker has stopped; the scheduler then frees its slot."""
+        self.db.execute(
+            update(Run)
+            .where(Run.id == self.run_id, Run.status == "CANCELLED", Run.finished_at.is_(None))
+            .values(finished_at=datetime.utcnow())
+        )
+        self.db.commit()
+
+    def raise_if_cancelled(self) -> None:
+        status = self.db.execute(select(Run.status).where(Run.id == self.run_id)).scalar_one_or_none()
+        self.db.commit()
+        if status == "CANCELLED":
+            self._cancel()
+
+    def _cancel(self) -> None:
+        self._warnings = []
+        self._dirty = {}
+        self._state_dirty = False
+        self.fields["status"] = "CANCELLED"
+        raise RunCancelled(self.run_id)
+
+    def _maybe_flush(self, force: bool) -> None:
+        if force or self.clock() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _record_progress(self) -> None:
+        step = self.step
+        elapsed = self.clock() - step.started
+        rate = step.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, step.total - step.done)
+        self.state["progress"] = {
+            "stage": step.stage,
+            "unit": step.unit,
+            "done": step.done,
+            "total": step.total,
+            "rate_per_sec": round(rate, 2),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 else None,
+        }
+        self._state_dirty = True
+
+
+class RunHeartbeat:
+    """
+    Keeps runs.heartbeat_at fresh from work that has no RunStatusWriter
+    (comparison shards), so a sharded run never looks abandoned while its
+    shards are busy. Calls are throttled to one UPDATE per `flush_interval_ms`;
+    the instance can be passed as a progress(done, total) callback. Each beat
+    also checks the run is still live and raises RunCancelled once it has been
+    cancelled or failed, so a shard stops between chunks instead of at its end.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        run_id: str,
+        *,
+        flush_interval_ms: int = STATUS_FLUSH_INTERVAL_MS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.db = db
+        self.run_id = run_id
+        self.flush_interval = flush_interval_ms / 1000
+        self.clock = clock
+        self._last_beat = float("-inf")
+
+    def __call__(self, *_progress: Any) -> None:
+        if self.clock() - self._last_beat >= self.flush_interval:
+            self.beat()
+
+    def beat(self) -> None:
+        result = self.db.execute(
+            update(Run)
+            .where(Run.id == self.run_id, Run.status.notin_(STOPPED_RUN_STATUSES))
+            .values(heartbeat_at=datetime.utcnow())
+            .execution_options(**{REPEATS_EXPECTED: True})
+        )
+        self.db.commit()
+        self._last_beat = self.clock()
+        if result.rowcount == 0:
+            raise RunCancelled(self.run_id)
@@ -2,17 +2,33 @@ from __future__ import annotations
 
 import json
 import re
+from array import array
 from dataclasses import dataclass
 from itertools import combinations
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Union
 
+from app.pipeline.arena import (
+    COMPARE_PROCESSES,
+    FeatureArena,
+    ProgressCallback,
+    can_use_process_pool,
+    index_positions,
+    language_buckets,
+    same_language_pair_count,
+    score_distinct,
+    score_in_arena,
+    shared_features,
+)
 from app.pipeline.ast.run_stage import decode_file_content, infer_language_from_path
+from app.pipeline.metrics import record
 from similarity.fingerprint import generate_fingerprints
 from similarity.kgram import generate_kgrams
-from similarity.similarity import compute_jaccard_similarity
 from similarity.thresholds import K_GRAM_SIZE
 from similarity.tokenizer import tokenize
 
+# fingerprints are SHA-256 digests
+DIGEST_BYTES = 32
+
 PYTHON_KEYWORDS = {
     "false", "none", "true", "and", "as", "assert", "async", "await", "break",
     "class", "continue", "def", "del", "elif", "else", "except", "finally", "for",
@@ -71,7 +87,7 @@ LANGUAGE_KEYWORDS = {
 }
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TokenPreparedFile:
     file_id: Any
     path: str
@@ -81,6 +97,42 @@ class TokenPreparedFile:
     kgrams: List[tuple[str, ...]]
     fingerprints: List[str]
 
+    @property
+    def fingerprint_hashes(self) -> array:
+        return fingerprint_hash_array(self.fingerprints)
+
+    def fingerprint(self, position: int) -> str:
+        return self.fingerprints[position]
+
+    def compact(self) -> "CompactTokenFile":
+        # comparison only reads fingerprints; keep them as 64-bit hashes plus raw digests
+        return CompactTokenFile(
+            self.file_id, self.path, self.language, self.fingerprint_hashes, fingerprint_digests(self.fingerprints)
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class CompactTokenFile:
+    """
+    What comparison and evidence need once a file is prepared: its
+    fingerprint hashes in k-gram order (index i covers tokens i..i+k-1),
+    which are scored, and the raw SHA-256 digests (32 bytes each, same
+    order), which evidence reports. Evidence otherwise only records
+    positions, so no source or token text is kept.
+    """
+
+    file_id: Any
+    path: str
+    language: str
+    fingerprint_hashes: array
+    fingerprint_digests: bytes
+
+    def fingerprint(self, position: int) -> str:
+        return self.fingerprint_digests[position * DIGEST_BYTES : (position + 1) * DIGEST_BYTES].hex()
+
+
+TokenFile = Union[TokenPreparedFile, CompactTokenFile]
+
 
 def _normalized_tokens(tokens: List[str], language: str) -> List[str]:
     keywords = LANGUAGE_KEYWORDS.get(language, set())
@@ -107,13 +159,24 @@ def prepare_token_file(
     language: str = "",
     k: int = K_GRAM_SIZE,
 ) -> Optional[TokenPreparedFile]:
-    resolved_language = (language or "").strip().lower() or infer_language_from_path(path)
-    if resolved_language not in LANGUAGE_KEYWORDS:
-        return None
-
     source_code = decode_file_content(content)
     if source_code is None:
         return None
+    return prepare_token_source(file_id=file_id, path=path, source_code=source_code, language=language, k=k)
+
+
+def prepare_token_source(
+    *,
+    file_id: Any,
+    path: str,
+    source_code: str,
+    language: str = "",
+    k: int = K_GRAM_SIZE,
+) -> Optional[TokenPreparedFile]:
+    """Same as `prepare_token_file` for content that has already been decoded."""
+    resolved_language = (language or "").strip().lower() or infer_language_from_path(path)
+    if resolved_language not in LANGUAGE_KEYWORDS:
+        return None
 
     tokens = _normalized_tokens(tokenize(source_code), resolved_language)
     kgrams = generate_kgrams(tokens, k=k)
@@ -134,48 +197,166 @@ def serialize_fingerprints(fingerprints: List[str]) -> bytes:
     return json.dumps(fingerprints).encode("utf-8")
 
 
+def deserialize_fingerprints(blob: bytes) -> List[str]:
+    return json.loads(blob.decode("utf-8"))
+
+
+def fingerprint_hash64(fingerprint: str) -> int:
+    # fingerprints are SHA-256 hex digests; the leading 64 bits are plenty
+    return int(fingerprint[:16], 16)
+
+
+def fingerprint_hash_array(fingerprints: Sequence[str]) -> array:
+    return array("Q", (fingerprint_hash64(fingerprint) for fingerprint in fingerprints))
+
+
+def fingerprint_digests(fingerprints: Sequence[str]) -> bytes:
+    # the hex digests as raw bytes: a quarter of the size of the strings
+    return bytes.fromhex("".join(fingerprints))
+
+
+def _token_evidence(file_a: TokenFile, features: List[tuple]) -> Dict[str, Any]:
+    # fingerprints are reported as full SHA-256 hex digests
+    shared_fingerprints: set[str] = set()
+    evidence = []
+    for _, count_a, count_b, positions_a, positions_b in features:
+        fingerprint = file_a.fingerprint(positions_a[0])
+        shared_fingerprints.add(fingerprint)
+        evidence.append(
+            {
+                "fingerprint": fingerprint,
+                "support_count": min(count_a, count_b),
+                "locations_a": positions_a,
+                "locations_b": positions_b,
+            }
+        )
+    return {"matching_fingerprints": sorted(shared_fingerprints), "evidence": evidence}
+
+
+def _token_comparison(file_a: TokenFile, file_b: TokenFile, shared_count: int, union_count: int) -> Dict[str, Any]:
+    score = round(shared_count / union_count, 4) if union_count else 0.0
+    return {
+        "file_a_id": file_a.file_id,
+        "file_b_id": file_b.file_id,
+        "language": file_a.language,
+        "fingerprint_score": score,
+        "overlap_count": shared_count,
+        "method": "token_fingerprint_jaccard",
+    }
+
+
+def add_token_evidence(comparisons: List[Dict[str, Any]], prepared_files: List[TokenFile]) -> None:
+    """
+    Fill in `matching_fingerprints` and `evidence` of comparisons scored with
+    evidence=False, e.g. only for the pairs that are stored. Each file's
+    position index is built once.
+    """
+    files = {str(prepared.file_id): prepared for prepared in prepared_files}
+    indexes: Dict[str, Dict[int, List[int]]] = {}
+
+    def index_for(file_id: Any) -> Dict[int, List[int]]:
+        key = str(file_id)
+        if key not in indexes:
+            indexes[key] = index_positions(files[key].fingerprint_hashes)
+        return indexes[key]
+
+    for comparison in comparisons:
+        if "evidence" not in comparison:
+            features = shared_features(index_for(comparison["file_a_id"]), index_for(comparison["file_b_id"]))
+            comparison.update(_token_evidence(files[str(comparison["file_a_id"])], features))
+
+
+def _compare_token_files_in_arena(
+    prepared_files: List[TokenFile],
+    *,
+    k: int,
+    processes: int,
+    candidate_pairs: Optional[set[tuple[str, str]]] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> List[Dict[str, Any]]:
+    order, bounds = language_buckets([prepared.language for prepared in prepared_files])
+    files = [prepared_files[idx] for idx in order]
+    allowed_pairs = None
+    if candidate_pairs is not None:
+        position = {str(prepared.file_id): idx for idx, prepared in enumerate(files)}
+        allowed_pairs = {
+            (position[a], position[b])
+            for a, b in candidate_pairs
+            if a in position and b in position and position[a] < position[b]
+        }
+
+    hashes = [prepared.fingerprint_hashes for prepared in files]
+    with FeatureArena.create(
+        hashes,
+        [[(idx, idx + k) for idx in range(len(file_hashes))] for file_hashes in hashes],
+    ) as arena:
+        scores, worker_cpu = score_in_arena(
+            arena, bounds, processes=processes, allowed_pairs=allowed_pairs, progress=progress
+        )
+    # the pool's CPU belongs to the step being measured, not to its thread
+    record(cpu_ms=worker_cpu * 1000)
+
+    return [
+        _token_comparison(files[index_a], files[index_b], shared_count, union_count)
+        for index_a, index_b, shared_count, union_count in scores
+    ]
+
+
 def compare_prepared_token_files(
-    prepared_files: List[TokenPreparedFile],
+    prepared_files: List[TokenFile],
     *,
     k: int = K_GRAM_SIZE,
+    processes: Optional[int] = None,
+    candidate_pairs: Optional[set[tuple[str, str]]] = None,
+    progress: Optional[ProgressCallback] = None,
+    evidence: bool = True,
 ) -> List[Dict[str, Any]]:
+    """
+    Score every same-language pair by fingerprint Jaccard, or only the
+    (file_a_id, file_b_id) pairs in `candidate_pairs` when it is given.
+
+    With `processes` > 1 (default `COMPARE_PROCESSES`) fingerprints are packed
+    into a shared-memory `FeatureArena` and pair ranges are scored by a
+    process pool. With evidence=False only scores are produced; pass the
+    comparisons that need evidence to `add_token_evidence` afterwards.
+    """
+    processes = COMPARE_PROCESSES if processes is None else processes
+    if can_use_process_pool(processes):
+        comparisons = _compare_token_files_in_arena(
+            prepared_files,
+            k=k,
+            processes=processes,
+            candidate_pairs=candidate_pairs,
+            progress=progress,
+        )
+        if evidence:
+            add_token_evidence(comparisons, prepared_files)
+        comparisons.sort(key=lambda item: item["fingerprint_score"], reverse=True)
+        return comparisons
+
     comparisons: List[Dict[str, Any]] = []
+    if candidate_pairs is not None:
+        total = len(candidate_pairs)
+    else:
+        total = same_language_pair_count([prepared.language for prepared in prepared_files])
 
+    # same scoring as the arena workers, over each file's distinct hashes
+    distinct: Dict[int, set[int]] = {}
     for file_a, file_b in combinations(prepared_files, 2):
         if file_a.language != file_b.language:
             continue
+        if candidate_pairs is not None and (str(file_a.file_id), str(file_b.file_id)) not in candidate_pairs:
+            continue
 
-        result = compute_jaccard_similarity(file_a.fingerprints, file_b.fingerprints)
-        shared_fingerprints = set(result["matching_fingerprints"])
-        evidence = []
-
-        for fingerprint in shared_fingerprints:
-            positions_a = [idx for idx, fp in enumerate(file_a.fingerprints) if fp == fingerprint][:3]
-            positions_b = [idx for idx, fp in enumerate(file_b.fingerprints) if fp == fingerprint][:3]
-            evidence.append(
-                {
-                    "fingerprint": fingerprint,
-                    "support_count": min(
-                        file_a.fingerprints.count(fingerprint),
-                        file_b.fingerprints.count(fingerprint),
-                    ),
-                    "locations_a": positions_a,
-                    "locations_b": positions_b,
-                }
-            )
-
-        comparisons.append(
-            {
-                "file_a_id": file_a.file_id,
-                "file_b_id": file_b.file_id,
-                "language": file_a.language,
-                "fingerprint_score": result["score"],
-                "overlap_count": len(shared_fingerprints),
-                "matching_fingerprints": sorted(shared_fingerprints),
-                "evidence": evidence,
-                "method": "token_fingerprint_jaccard",
-            }
-        )
+        for prepared in (file_a, file_b):
+            if id(prepared) not in distinct:
+                distinct[id(prepared)] = set(prepared.fingerprint_hashes)
+        shared_count, union_count = score_distinct(distinct[id(file_a)], distinct[id(file_b)])
+        comparisons.append(_token_comparison(file_a, file_b, shared_count, union_count))
+        if progress is not None:
+            progress(len(comparisons), total)
 
+    if evidence:
+        add_token_evidence(comparisons, prepared_files)
     comparisons.sort(key=lambda item: item["fingerprint_score"], reverse=True)
     return comparisons
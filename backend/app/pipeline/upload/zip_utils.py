@@ -1,5 +1,16 @@
+import hashlib
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import PurePosixPath
-from typing import Optional
+from typing import Iterator, Optional
+
+
+# Entries decompressed and hashed at once during upload; zlib and hashlib
+# release the GIL, so threads overlap on large entries.
+UPLOAD_READ_WORKERS = int(os.getenv("UPLOAD_READ_WORKERS", "4"))
 
 
 SUPPORTED_UPLOAD_EXTENSIONS = {
@@ -59,3 +70,85 @@ def group_zip_files(names: list[str]) -> dict[str, list[str]]:
         student = path.split("/")[0] if "/" in path else "root"
         groups.setdefault(student, []).append(path)
     return groups
+
+
+class ZipTooLarge(ValueError):
+    """The supported entries of an upload decompress to more than the limit."""
+
+    def __init__(self, total_bytes: int, limit: int):
+        super().__init__(f"ZIP contents are too large: {total_bytes} bytes uncompressed, limit is {limit} bytes.")
+        self.total_bytes = total_bytes
+        self.limit = limit
+
+
+def scan_zip(
+    z: zipfile.ZipFile,
+    *,
+    max_entry_bytes: Optional[int] = None,
+    max_total_bytes: Optional[int] = None,
+) -> tuple[dict[str, list[str]], list[dict[str, str]]]:
+    """
+    One pass over the central directory: supported entries grouped by
+    student folder (see group_zip_files), and the skipped ones with reasons.
+
+    Raises ZipTooLarge when the entries that will be decompressed (supported
+    and at most `max_entry_bytes`) add up to more than `max_total_bytes`.
+    The declared sizes are a real bound: zipfile stops reading an entry at
+    its declared size and fails the CRC check if there was more.
+    """
+    groups: dict[str, list[str]] = {}
+    skipped: list[dict[str, str]] = []
+    total_bytes = 0
+    for info in z.infolist():
+        path = info.filename
+        reason = zip_entry_skip_reason(path)
+        if reason:
+            if reason != "directory":
+                skipped.append({"path": path, "reason": reason})
+            continue
+        student = path.split("/")[0] if "/" in path else "root"
+        groups.setdefault(student, []).append(path)
+        if max_entry_bytes is None or info.file_size <= max_entry_bytes:
+            total_bytes += info.file_size
+    if max_total_bytes is not None and total_bytes > max_total_bytes:
+        raise ZipTooLarge(total_bytes, max_total_bytes)
+    return groups, skipped
+
+
+@dataclass
+class ZipEntry:
+    path: str
+    data: Optional[bytes]  # None when the entry is over the size limit
+    content_hash: Optional[str]
+
+
+def read_zip_entry(z: zipfile.ZipFile, path: str, max_bytes: int) -> ZipEntry:
+    # the declared size can lie, so stop decompressing one byte past the limit either way
+    if z.getinfo(path).file_size > max_bytes:
+        return ZipEntry(path, None, None)
+    with z.open(path) as handle:
+        data = handle.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        return ZipEntry(path, None, None)
+    return ZipEntry(path, data, hashlib.sha256(data).hexdigest())
+
+
+def read_zip_entries(
+    z: zipfile.ZipFile,
+    paths: list[str],
+    max_bytes: int,
+    workers: int = UPLOAD_READ_WORKERS,
+) -> Iterator[ZipEntry]:
+    """
+    Decompress and hash entries on a thread pool and yield them in `paths`
+    order. At most 2 * workers entries are held at once, however large the
+    archive is.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(read_zip_entry, z, path, max_bytes))
+            if len(pending) >= 2 * max(1, workers):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,251 @@
+# about scheduler.py file:
+# this file decides which queued runs may start.
+# runs.py only records a run as QUEUED; the scheduler starts it once the
+# dataset and its owner are below their concurrency caps.
+# small (interactive) runs are started ahead of large batch runs, and in
+# redis mode they go to their own celery queue so batch work cannot hold them up.
+# tasks.py calls schedule_runs again whenever a run ends, so the next run starts.
+# a cancelled run keeps its slot until its worker confirms it has stopped.
+# the api and every worker schedule, so on postgres each pass holds an advisory
+# lock from reading the active runs until its claims are committed.
+
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, List, Optional
+
+from sqlalchemy import and_, case, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.celery import INTERACTIVE_QUEUE, PREPARE_QUEUE, USE_REDIS
+from app.models.models import Collection, Dataset, File, Run, RunShard, Submission
+
+
+# Runs of one dataset / one collection owner that may be SCHEDULED or RUNNING
+# at the same time. 0 means no cap.
+MAX_ACTIVE_RUNS_PER_DATASET = int(os.getenv("MAX_ACTIVE_RUNS_PER_DATASET", "1"))
+MAX_ACTIVE_RUNS_PER_OWNER = int(os.getenv("MAX_ACTIVE_RUNS_PER_OWNER", "2"))
+# Datasets up to this many files are interactive runs and jump the queue.
+INTERACTIVE_RUN_MAX_FILES = int(os.getenv("INTERACTIVE_RUN_MAX_FILES", "500"))
+# An active run with no status write for this long has lost its worker and
+# may be force-resumed. Keep it above the longest step without progress.
+RUN_HEARTBEAT_TIMEOUT_SECONDS = int(os.getenv("RUN_HEARTBEAT_TIMEOUT_SECONDS", "600"))
+# A SCHEDULED run is waiting in the celery queue, where nothing beats for it;
+# it only counts as lost once it has waited this long since its dispatch.
+RUN_DISPATCH_TIMEOUT_SECONDS = int(os.getenv("RUN_DISPATCH_TIMEOUT_SECONDS", "21600"))
+
+# pg_advisory_xact_lock key serialising schedule_runs across processes
+SCHEDULER_LOCK_ID = 0x52554E53  # "RUNS"
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+ACTIVE_RUN_STATUSES = ("SCHEDULED", "RUNNING")
+FINISHED_RUN_STATUSES = ("DONE", "FAILED", "CANCELLED")
+
+
+@dataclass(frozen=True)
+class QueuedRun:
+    run_id: Any
+    dataset_id: Any
+    owner_id: Any
+    priority: int
+
+
+def run_priority(db: Session, dataset_id: Any, config: Optional[dict] = None) -> int:
+    """Interactive for small datasets; config_json["priority"] ("interactive"/"batch") overrides."""
+    requested = str((config or {}).get("priority", "")).lower()
+    if requested == "interactive":
+        return PRIORITY_INTERACTIVE
+    if requested == "batch":
+        return PRIORITY_BATCH
+
+    file_count = db.execute(
+        select(func.count(File.id))
+        .join(Submission, Submission.id == File.submission_id)
+        .where(Submission.dataset_id == dataset_id)
+    ).scalar_one()
+    return PRIORITY_INTERACTIVE if file_count <= INTERACTIVE_RUN_MAX_FILES else PRIORITY_BATCH
+
+
+def select_runs_to_start(
+    queued: Iterable[QueuedRun],
+    active: Iterable[tuple[Any, Any]],
+    *,
+    dataset_cap: int = MAX_ACTIVE_RUNS_PER_DATASET,
+    owner_cap: int = MAX_ACTIVE_RUNS_PER_OWNER,
+) -> List[QueuedRun]:
+    """
+    Pick the queued runs that fit under the caps, given the (dataset_id,
+    owner_id) of every active run. `queued` is walked in the order given
+    (priority, then age); a run that does not fit does not block the ones
+    behind it.
+    """
+    active = list(active)
+    per_dataset = Counter(dataset_id for dataset_id, _ in active)
+    per_owner = Counter(owner_id for _, owner_id in active)
+
+    selected: List[QueuedRun] = []
+    for run in queued:
+        if dataset_cap and per_dataset[run.dataset_id] >= dataset_cap:
+            continue
+        if owner_cap and per_owner[run.owner_id] >= owner_cap:
+            continue
+        per_dataset[run.dataset_id] += 1
+        per_owner[run.owner_id] += 1
+        selected.append(run)
+    return selected
+
+
+def heartbeat_is_stale(
+    heartbeat_at: Optional[datetime],
+    now: Optional[datetime] = None,
+    timeout_seconds: Optional[int] = None,
+) -> bool:
+    if heartbeat_at is None:
+        return True
+    if heartbeat_at.tzinfo is not None:
+        heartbeat_at = heartbeat_at.astimezone(timezone.utc).replace(tzinfo=None)
+    timeout = RUN_HEARTBEAT_TIMEOUT_SECONDS if timeout_seconds is None else timeout_seconds
+    return (now or datetime.utcnow()) - heartbeat_at > timedelta(seconds=timeout)
+
+
+def cancel_is_pending(status: str, finished_at: Optional[datetime], heartbeat_at: Optional[datetime]) -> bool:
+    """A cancelled run whose worker has not yet confirmed it stopped (and was not lost)."""
+    return status == "CANCELLED" and finished_at is None and not heartbeat_is_stale(heartbeat_at)
+
+
+def shards_in_flight(db: Session, run_id: Any, now: Optional[datetime] = None) -> int:
+    """Shards of the run picked up by a worker within the heartbeat timeout and not yet DONE."""
+    since = (now or datetime.utcnow()) - timedelta(seconds=RUN_HEARTBEAT_TIMEOUT_SECONDS)
+    return db.execute(
+        select(func.count(RunShard.id)).where(
+            RunShard.run_id == run_id,
+            RunShard.status != "DONE",
+            RunShard.started_at >= since,
+        )
+    ).scalar_one()
+
+
+def _run_owner_query(*columns):
+    return (
+        select(*columns)
+        .join(Dataset, Dataset.id == Run.dataset_id)
+        .join(Collection, Collection.id == Dataset.collection_id)
+    )
+
+
+def lock_scheduler(db: Session) -> None:
+    # held until the transaction ends; sqlite (tests, benchmarks) serialises writers itself
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(select(func.pg_advisory_xact_lock(SCHEDULER_LOCK_ID)))
+
+
+def schedule_runs(db: Session) -> List[str]:
+    """Start every queued run the caps allow; returns the ids that were started."""
+    # a new transaction, so the lock covers the whole read-then-claim below
+    db.commit()
+    lock_scheduler(db)
+    stopping = and_(
+        Run.status == "CANCELLED",
+        Run.finished_at.is_(None),
+        Run.heartbeat_at >= datetime.utcnow() - timedelta(seconds=RUN_HEARTBEAT_TIMEOUT_SECONDS),
+    )
+    active = db.execute(
+        _run_owner_query(Run.dataset_id, Collection.owner_id).where(
+            or_(Run.status.in_(ACTIVE_RUN_STATUSES), stopping)
+        )
+    ).all()
+    queued = [
+        QueuedRun(row.id, row.dataset_id, row.owner_id, row.priority)
+        for row in db.execute(
+            _run_owner_query(Run.id, Run.dataset_id, Collection.owner_id, Run.priority)
+            .where(Run.status == "QUEUED")
+            .order_by(Run.priority.asc(), Run.created_at.asc())
+        ).all()
+    ]
+
+    claimed: List[QueuedRun] = []
+    for run in select_runs_to_start(queued, [tuple(row) for row in active]):
+        # a run cancelled since it was read stays cancelled
+        result = db.execute(
+            update(Run)
+            .where(Run.id == run.run_id, Run.status == "QUEUED")
+            .values(status="SCHEDULED", heartbeat_at=datetime.utcnow())
+        )
+        if result.rowcount == 1:
+            claimed.append(run)
+    # releases the lock; the next scheduler counts these runs as active
+    db.commit()
+
+    started: List[str] = []
+    for run in claimed:
+        try:
+            dispatch_run(str(run.run_id), run.priority)
+        except Exception as exc:
+            # save startup error
+            db.execute(
+                update(Run)
+                .where(Run.id == run.run_id)
+                .values(
+                    status="FAILED",
+                    error_message=f"Failed to start pipeline: {exc}",
+                    finished_at=datetime.utcnow(),
+                )
+            )
+            db.commit()
+            continue
+        started.append(str(run.run_id))
+
+    if started:
+        # the dispatch timeout of a queued run counts from here
+        db.execute(
+            update(Run)
+            .where(Run.id.in_([run.run_id for run in claimed]), Run.status == "SCHEDULED")
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        db.commit()
+    return started
+
+
+def dispatch_run(run_id: str, priority: int = PRIORITY_BATCH) -> None:
+    from app.tasks import run_pipeline
+
+    # In container/prod, queue with Celery + Redis; a broker error is raised
+    # (schedule_runs fails the run) rather than running the pipeline in the api.
+    # For local dev without Redis, run directly in a background thread.
+    if USE_REDIS:
+        queue = INTERACTIVE_QUEUE if priority == PRIORITY_INTERACTIVE else PREPARE_QUEUE
+        run_pipeline.apply_async((run_id,), queue=queue)
+        return
+
+    threading.Thread(
+        target=run_pipeline.run,
+        args=(run_id,),
+        daemon=True,
+    ).start()
+
+
+def cancel_runs(db: Session, run_ids: Iterable[Any]) -> int:
+    """
+    Mark runs CANCELLED. Queued runs never start and are finished at once.
+    Scheduled and running ones notice at their next status write and stop;
+    their worker then sets finished_at (RunStatusWriter.confirm_cancel) and
+    schedules the next queued runs, so the slot is only freed once the
+    worker has actually stopped.
+    """
+    ids = list(run_ids)
+    if not ids:
+        return 0
+    result = db.execute(
+        update(Run)
+        .where(Run.id.in_(ids), Run.status.notin_(FINISHED_RUN_STATUSES))
+        .values(
+            status="CANCELLED",
+            finished_at=case((Run.status == "QUEUED", datetime.utcnow()), else_=None),
+        )
+    )
+    db.commit()
+    return result.rowcount
@@ -15,15 +15,19 @@ from typing import Optional, Dict, Any, List
 class RunCreate(BaseModel):
     dataset_id: UUID
     config_json: Dict[str, Any] = {}
+    supersede: bool = False  # cancel the dataset's unfinished runs first
 
 
 class RunOut(BaseModel):
     id: UUID
     dataset_id: UUID
-    status: str          # QUEUED | RUNNING | DONE | FAILED
+    status: str          # QUEUED | SCHEDULED | RUNNING | DONE | FAILED | CANCELLED
     stage: str           # INGEST | TOKENS | AST | REPORT
     progress_pct: int
+    priority: int = 1    # 0 interactive | 1 batch
     config_json: Dict[str, Any]
+    progress: Optional[Dict[str, Any]] = None  # done/total, rate, ETA of the current step
+    warning_count: int = 0
     error_message: Optional[str] = None
     created_at: datetime
     started_at: Optional[datetime] = None
@@ -47,6 +51,24 @@ class SimilarityResultOut(BaseModel):
         from_attributes = True
 
 
+class ScoreBinOut(BaseModel):
+    bin: int
+    lower: float
+    upper: float
+    pair_count: int      # pairs compared in this score range
+    stored_count: int    # of those, kept as results (score >= floor)
+
+    class Config:
+        from_attributes = True
+
+
+class ScoreHistogramOut(BaseModel):
+    floor: float         # lowest final score kept as a result
+    pairs_compared: int
+    pairs_stored: int
+    bins: List[ScoreBinOut]
+
+
 class MatchEvidenceOut(BaseModel):
     id: UUID
     run_id: UUID
@@ -61,3 +83,63 @@ class MatchEvidenceOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class FunctionMatchOut(BaseModel):
+    id: UUID
+    run_id: UUID
+    file_a_id: UUID
+    file_b_id: UUID
+    a_name: str
+    a_start: int
+    a_end: int
+    b_name: str
+    b_start: int
+    b_end: int
+    score: float
+    kind: str            # EXACT | NGRAM
+
+    class Config:
+        from_attributes = True
+
+
+class RunWarningOut(BaseModel):
+    id: UUID
+    run_id: UUID
+    seq: int
+    stage: str           # INGEST | TOKENS | AST
+    path: Optional[str] = None
+    reason: str
+    details: Optional[Dict[str, Any]] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class RunMetricOut(BaseModel):
+    id: UUID
+    run_id: UUID
+    stage: str           # INGEST | TOKENS | AST | REPORT
+    step: str            # prepare | compare | compare_shard | report
+    seq: Optional[int] = None  # shard number of compare_shard
+    wall_ms: float
+    cpu_ms: float        # includes finished comparison worker processes
+    files: int
+    pairs_considered: int
+    pairs_scored: int    # left after candidate filtering
+    pairs_persisted: int
+    rows_written: int
+    evidence_rows: int
+    bytes_written: int   # approximate payload size
+    db_queries: int = 0
+    db_ms: float = 0.0
+    peak_rss_mb: Optional[float] = None     # worker process, during this step
+    traced_peak_mb: Optional[float] = None  # tracemalloc, with config_json["memory"]
+    files_per_sec: Optional[float] = None
+    pairs_per_sec: Optional[float] = None
+    details: Optional[Dict[str, Any]] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -11,19 +11,74 @@
 import time
 import os
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Iterator, Optional
 
+from celery import chord
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.signals import task_postrun, task_prerun, worker_process_init, worker_process_shutdown, worker_ready
+from sqlalchemy import and_, case, delete, func, or_, select, update
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 
-from app.celery import celery_app
+from app.celery import USE_REDIS, celery_app
 from app.core.db import SessionLocal
-from app.models.models import CandidatePair, File, FileFingerprint, MatchEvidence, PairResult, Run, Submission
-from app.pipeline.ast.run_stage import compare_prepared_files, decode_file_content, prepare_ast_file
-from app.pipeline.token.run_stage import compare_prepared_token_files, prepare_token_file, serialize_fingerprints
+from app.core.monitoring import WORKER_BUSY, WORKER_PROCESSES, mark_worker_process_dead, time_parse
+from app.models.models import (
+    CandidatePair,
+    File,
+    FileAstFeature,
+    FileFingerprint,
+    FunctionMatch,
+    MatchEvidence,
+    PairResult,
+    Run,
+    RunScoreBin,
+    RunShard,
+    Submission,
+)
+from app.pipeline.arena import same_language_pair_count
+from app.pipeline.ast.parser import ParseBudgetExceeded
+from app.pipeline.ast.prefilter import resolve_cosine_floor
+from app.pipeline.ast.features import FEATURE_HANDOFF_VERSION
+from app.pipeline.ast.run_stage import (
+    ASTPreparedFile,
+    ParseBudget,
+    add_ast_evidence,
+    compare_prepared_files,
+    deserialize_ast_features,
+    find_prepared_clones,
+    gate_pairs_by_function_matches,
+    infer_language_from_path,
+    match_prepared_functions,
+    parse_budget_from_config,
+    prepare_ast_source,
+    serialize_ast_features,
+)
+from app.pipeline.histogram import add_bins, empty_bins, histogram_rows, resolve_result_floor, score_bin
+from app.pipeline.ingest import IngestedFile, RunRegistry, ingest_file
+from app.pipeline.memory import set_concurrent_tasks, track_memory
+from app.pipeline.metrics import measure_stage, record
+from app.pipeline.profiling import profile_run
+from app.pipeline.persist import bulk_insert
+from app.pipeline.shards import COMPARE_SHARD_FILES, CompareShard, plan_compare_shards
+from app.pipeline.status import STOPPED_RUN_STATUSES, RunCancelled, RunHeartbeat, RunStatusWriter
+from app.pipeline.token.run_stage import (
+    CompactTokenFile,
+    add_token_evidence,
+    compare_prepared_token_files,
+    deserialize_fingerprints,
+    fingerprint_digests,
+    fingerprint_hash_array,
+    prepare_token_source,
+    serialize_fingerprints,
+)
+from app.scheduler import schedule_runs
 from similarity.thresholds import K_GRAM_SIZE
 
 
-ANALYSIS_STAGE_DELAY_SECONDS = float(os.getenv("ANALYSIS_STAGE_DELAY_SECONDS", "1"))
+ANALYSIS_STAGE_DELAY_SECONDS = float(os.getenv("ANALYSIS_STAGE_DELAY_SECONDS", "0"))
+# files fetched per query while streaming a dataset
+FILE_STREAM_BATCH_SIZE = int(os.getenv("FILE_STREAM_BATCH_SIZE", "200"))
 
 
 def analysis_stage_delay() -> None:
@@ -36,74 +91,79 @@ def open_db() -> Session:
     return SessionLocal()
 
 
-def update_run(
-    db: Session,
-    run_id: str,
-    status: Optional[str] = None,
-    stage: Optional[str] = None,
-    progress_pct: Optional[int] = None,
-    error_message: Optional[str] = None,
-    started_at: Optional[datetime] = None,
-    finished_at: Optional[datetime] = None,
-) -> None:
-    # get run
-    run = db.query(Run).filter(Run.id == run_id).first()
-    if not run:
-        return
+# worker utilisation for /api/metrics (see core/monitoring.py)
+@worker_process_init.connect
+def track_worker_process(**_kwargs) -> None:
+    WORKER_PROCESSES.set(1)
 
-    # set fields
-    if status is not None:
-        run.status = status
-    if stage is not None:
-        run.stage = stage
-    if progress_pct is not None:
-        run.progress_pct = progress_pct
-    if error_message is not None:
-        run.error_message = error_message
-    if started_at is not None:
-        run.started_at = started_at
-    if finished_at is not None:
-        run.finished_at = finished_at
-
-    # save changes
-    db.commit()
 
+@worker_ready.connect
+def track_worker_threads(sender=None, **_kwargs) -> None:
+    # threads/solo pools run tasks in the main process and never fire worker_process_init
+    pool = getattr(sender, "pool", None)
+    if pool is not None and not isinstance(pool, PreforkPool):
+        WORKER_PROCESSES.set(pool.limit or 1)
+        set_concurrent_tasks(pool.limit or 1)
 
-def append_run_warning(db: Session, run_id: str, warning: dict) -> None:
-    run = db.query(Run).filter(Run.id == run_id).first()
-    if not run:
-        return
-    config = dict(run.config_json or {})
-    warnings = list(config.get("warnings", []))
-    warnings.append(warning)
-    config["warnings"] = warnings
-    run.config_json = config
-    db.commit()
+
+@worker_process_shutdown.connect
+def untrack_worker_process(**_kwargs) -> None:
+    mark_worker_process_dead(os.getpid())
 
 
-def get_run_files(db: Session, run_id: str) -> list[File]:
-    # find run
+@task_prerun.connect
+def track_task_start(task=None, **_kwargs) -> None:
+    WORKER_BUSY.labels(task.name).inc()
+
+
+@task_postrun.connect
+def track_task_end(task=None, **_kwargs) -> None:
+    WORKER_BUSY.labels(task.name).dec()
+
+
+def count_run_files(db: Session, run_id: str) -> int:
     run = db.query(Run).filter(Run.id == run_id).first()
     if not run:
-        return []
-
-    # get files in this run dataset
+        return 0
     return (
-        db.query(File)
+        db.query(func.count(File.id))
         .join(Submission, Submission.id == File.submission_id)
         .filter(Submission.dataset_id == run.dataset_id)
-        .all()
+        .scalar()
     )
 
 
-def get_pair_result_map(db: Session, run_id: str) -> dict[tuple[str, str], PairResult]:
-    rows = db.query(PairResult).filter(PairResult.run_id == run_id).all()
-    return {(str(row.file_a_id), str(row.file_b_id)): row for row in rows}
+def iter_run_file_batches(db: Session, run_id: str, batch_size: int = FILE_STREAM_BATCH_SIZE) -> Iterator[list[Row]]:
+    """
+    Stream (id, path, language, content) rows for the run's dataset, one
+    batch at a time.
 
+    Rows are fetched in keyset-paginated batches rather than through one open
+    cursor, so the caller can commit progress, warnings and prepared rows
+    between batches without invalidating the stream; only one batch of
+    content is held at a time.
+    """
+    run = db.query(Run).filter(Run.id == run_id).first()
+    if not run:
+        return
 
-def get_candidate_pair_keys(db: Session, run_id: str) -> set[tuple[str, str]]:
-    rows = db.query(CandidatePair).filter(CandidatePair.run_id == run_id).all()
-    return {(str(row.file_a_id), str(row.file_b_id)) for row in rows}
+    last_id = None
+    while True:
+        statement = (
+            select(File.id, File.path, File.language, File.content)
+            .join(Submission, Submission.id == File.submission_id)
+            .where(Submission.dataset_id == run.dataset_id)
+            .order_by(File.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            statement = statement.where(File.id > last_id)
+        rows = db.execute(statement).all()
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1].id
 
 
 def blended_final_score(fingerprint_score: float, ast_score: float) -> float:
@@ -112,272 +172,834 @@ def blended_final_score(fingerprint_score: float, ast_score: float) -> float:
     return round(fingerprint_score, 6)
 
 
-def run_token_stage(db: Session, run_id: str) -> None:
-    update_run(db, run_id, stage="TOKENS", progress_pct=30)
-    files = get_run_files(db, run_id)
-    prepared_files = []
-    fingerprint_rows: list[FileFingerprint] = []
-
-    for file_row in files:
-        prepared = prepare_token_file(
-            file_id=file_row.id,
-            path=file_row.path,
-            content=file_row.content,
-            language=file_row.language,
-            k=K_GRAM_SIZE,
+def load_ingested_files(db: Session, run_id: str, status: RunStatusWriter) -> RunRegistry:
+    # resume: the prepare pass already ran, so rebuild the registry without
+    # reading content; which files failed to decode is kept in the run's state
+    registry = RunRegistry(config=dict(status.config))
+    run = db.query(Run).filter(Run.id == run_id).first()
+    if run is None:
+        return registry
+    undecoded = set(status.state.get("undecoded_files", []))
+    rows = db.execute(
+        select(File.id, File.path, File.language)
+        .join(Submission, Submission.id == File.submission_id)
+        .where(Submission.dataset_id == run.dataset_id)
+        .order_by(File.id)
+    ).all()
+    registry.files.extend(
+        IngestedFile(
+            file_id=row.id,
+            path=row.path,
+            language=(row.language or "").strip().lower() or infer_language_from_path(row.path),
+            source_code=None,
+            decoded=str(row.id) not in undecoded,
         )
-        if prepared is None:
-            reason = "decode failure" if decode_file_content(file_row.content) is None else "unsupported or empty token input"
-            append_run_warning(
-                db,
-                run_id,
-                {
-                    "stage": "TOKENS",
-                    "path": file_row.path,
-                    "reason": reason,
-                },
+        for row in rows
+    )
+    return registry
+
+
+def prepare_token_row(
+    run_id: str, ingested: IngestedFile, registry: RunRegistry, status: RunStatusWriter
+) -> Optional[dict]:
+    prepared = prepare_token_source(
+        file_id=ingested.file_id,
+        path=ingested.path,
+        source_code=ingested.source_code,
+        language=ingested.language,
+        k=K_GRAM_SIZE,
+    )
+    if prepared is None:
+        status.warn(
+            {
+                "stage": "TOKENS",
+                "path": ingested.path,
+                "reason": "unsupported or empty token input",
+            }
+        )
+        return None
+
+    registry.token_files.append(prepared.compact())
+    return {
+        "run_id": run_id,
+        "file_id": ingested.file_id,
+        "k": K_GRAM_SIZE,
+        "w": K_GRAM_SIZE,
+        "algo_version": "token-jaccard-v1",
+        "fingerprint_blob": serialize_fingerprints(prepared.fingerprints),
+        "fingerprint_count": len(prepared.fingerprints),
+    }
+
+
+def prepare_ast_row(
+    run_id: str, ingested: IngestedFile, registry: RunRegistry, status: RunStatusWriter, budget: ParseBudget
+) -> Optional[dict]:
+    try:
+        with time_parse(ingested.language):
+            prepared = prepare_ast_source(
+                file_id=str(ingested.file_id),
+                path=ingested.path,
+                source_code=ingested.source_code,
+                language=ingested.language,
+                budget=budget,
             )
-            continue
+    except ParseBudgetExceeded as exc:
+        # degrade to token-only analysis for this file
+        status.warn(
+            {
+                "stage": "AST",
+                "path": ingested.path,
+                "reason": f"parse {exc}; file compared with token fingerprints only",
+                "kind": "parse_budget",
+                "budget": exc.budget,
+                "limit": exc.limit,
+                "observed": exc.observed,
+                "fallback": "TOKENS",
+            }
+        )
+        return None
+    if prepared is None:
+        status.warn(
+            {
+                "stage": "AST",
+                "path": ingested.path,
+                "reason": "unsupported language or AST preparation failure",
+            }
+        )
+        return None
 
-        prepared_files.append(prepared)
-        fingerprint_rows.append(
-            FileFingerprint(
-                run_id=run_id,
+    if not prepared.handoff.get("parse_ok", False):
+        status.warn(
+            {
+                "stage": "AST",
+                "path": ingested.path,
+                "reason": f"syntax issues detected ({prepared.handoff.get('error_count', 0)} parse error indicators)",
+            }
+        )
+    compact = prepared.compact()
+    registry.ast_files.append(compact)
+    return {
+        "run_id": run_id,
+        "file_id": compact.file_id,
+        "algo_version": FEATURE_HANDOFF_VERSION,
+        "feature_blob": serialize_ast_features(compact),
+        "token_count": len(compact.handoff.get("feature_tokens", [])),
+    }
+
+
+def prepare_run_files(db: Session, run_id: str, registry: RunRegistry, status: RunStatusWriter) -> None:
+    """
+    One pass over the dataset: every file is read and decoded once, its token
+    fingerprints and compact AST features are built from that source and
+    stored, and the source is dropped with its batch. Only file metadata and
+    the compact prepared files stay in the registry.
+    """
+    budget = parse_budget_from_config(registry.config)
+    undecoded: list[str] = []
+    status.begin_step("INGEST", "files", start_pct=0, end_pct=50, total=count_run_files(db, run_id))
+
+    for batch in iter_run_file_batches(db, run_id):
+        fingerprint_rows, feature_rows = [], []
+        for file_row in batch:
+            ingested = ingest_file(
                 file_id=file_row.id,
-                k=K_GRAM_SIZE,
-                w=K_GRAM_SIZE,
-                algo_version="token-jaccard-v1",
-                fingerprint_blob=serialize_fingerprints(prepared.fingerprints),
-                fingerprint_count=len(prepared.fingerprints),
+                path=file_row.path,
+                content=file_row.content,
+                language=file_row.language,
             )
-        )
-
-    if fingerprint_rows:
-        db.add_all(fingerprint_rows)
-        db.commit()
+            registry.files.append(ingested.without_source())
+            status.advance()
+            if not ingested.decoded:
+                undecoded.append(str(file_row.id))
+                status.warn(
+                    {
+                        "stage": "INGEST",
+                        "path": file_row.path,
+                        "reason": "decode failure",
+                    }
+                )
+                continue
+            fingerprint_row = prepare_token_row(run_id, ingested, registry, status)
+            if fingerprint_row is not None:
+                fingerprint_rows.append(fingerprint_row)
+            feature_row = prepare_ast_row(run_id, ingested, registry, status, budget)
+            if feature_row is not None:
+                feature_rows.append(feature_row)
+        bulk_insert(db, FileFingerprint, fingerprint_rows)
+        bulk_insert(db, FileAstFeature, feature_rows)
+
+    # written with the prepare checkpoint; a resumed run reads it back
+    status.set_state("undecoded_files", undecoded)
+
+
+def candidate_row(run_id: str, comparison: dict) -> dict:
+    return {
+        "run_id": run_id,
+        "file_a_id": comparison["file_a_id"],
+        "file_b_id": comparison["file_b_id"],
+        "overlap_count": comparison["overlap_count"],
+        "fingerprint_score": round(comparison["fingerprint_score"], 6),
+    }
+
+
+def compare_token_stage(registry: RunRegistry, status: RunStatusWriter) -> list[dict]:
+    # scored in memory; compare_ast_stage persists the pairs that clear the result floor
+    status.begin_step("TOKENS", "pairs", start_pct=55, end_pct=65)
+    comparisons = compare_prepared_token_files(
+        registry.token_files, k=K_GRAM_SIZE, progress=status.progress, evidence=False
+    )
+    record(
+        pairs_considered=same_language_pair_count([prepared.language for prepared in registry.token_files]),
+        pairs_scored=len(comparisons),
+    )
+    return comparisons
 
-    update_run(db, run_id, stage="TOKENS", progress_pct=50)
-    comparisons = compare_prepared_token_files(prepared_files, k=K_GRAM_SIZE)
-    pair_map = get_pair_result_map(db, run_id)
-    candidate_rows: list[CandidatePair] = []
-    evidence_rows: list[MatchEvidence] = []
 
+def token_evidence_rows(run_id: str, comparisons: list[dict]) -> Iterator[dict]:
+    # one row per matched location; generated lazily so bulk_insert batches them
     for comparison in comparisons:
-        file_a_id = comparison["file_a_id"]
-        file_b_id = comparison["file_b_id"]
-        pair_key = (str(file_a_id), str(file_b_id))
-        score = round(comparison["fingerprint_score"], 6)
-
-        candidate_rows.append(
-            CandidatePair(
-                run_id=run_id,
-                file_a_id=file_a_id,
-                file_b_id=file_b_id,
-                overlap_count=comparison["overlap_count"],
-                fingerprint_score=score,
-            )
-        )
-
-        existing = pair_map.get(pair_key)
-        if existing is None:
-            existing = PairResult(
-                run_id=run_id,
-                file_a_id=file_a_id,
-                file_b_id=file_b_id,
-                final_score=blended_final_score(score, 0.0),
-                fingerprint_score=score,
-                ast_score=0.0,
-            )
-            db.add(existing)
-            pair_map[pair_key] = existing
-        else:
-            existing.fingerprint_score = score
-            existing.final_score = blended_final_score(score, existing.ast_score)
-
         for evidence in comparison["evidence"]:
             for loc_a, loc_b in zip(evidence["locations_a"], evidence["locations_b"]):
-                evidence_rows.append(
-                    MatchEvidence(
-                        run_id=run_id,
-                        file_a_id=file_a_id,
-                        file_b_id=file_b_id,
-                        a_start=loc_a,
-                        a_end=loc_a + K_GRAM_SIZE,
-                        b_start=loc_b,
-                        b_end=loc_b + K_GRAM_SIZE,
-                        kind="TOKEN",
-                        weight=float(evidence["support_count"]),
-                    )
-                )
-
-    if candidate_rows:
-        db.add_all(candidate_rows)
-    if evidence_rows:
-        db.add_all(evidence_rows)
-    if candidate_rows or evidence_rows or comparisons:
-        db.commit()
-
-    analysis_stage_delay()
-
-
-def run_ast_stage(db: Session, run_id: str) -> None:
-    update_run(db, run_id, stage="AST", progress_pct=55)
+                yield {
+                    "run_id": run_id,
+                    "file_a_id": comparison["file_a_id"],
+                    "file_b_id": comparison["file_b_id"],
+                    "a_start": loc_a,
+                    "a_end": loc_a + K_GRAM_SIZE,
+                    "b_start": loc_b,
+                    "b_end": loc_b + K_GRAM_SIZE,
+                    "kind": "TOKEN",
+                    "weight": float(evidence["support_count"]),
+                }
+
+
+def ast_evidence_rows(run_id: str, clones: list[dict], comparisons: list[dict]) -> Iterator[dict]:
+    for clone in clones:
+        yield {
+            "run_id": run_id,
+            "file_a_id": clone["file_a_id"],
+            "file_b_id": clone["file_b_id"],
+            "a_start": clone["a_start"],
+            "a_end": clone["a_end"],
+            "b_start": clone["b_start"],
+            "b_end": clone["b_end"],
+            "kind": "CLONE",
+            "weight": clone["similarity"],
+        }
+    for comparison in comparisons:
+        for evidence in comparison["evidence"]:
+            for loc_a, loc_b in zip(evidence["locations_a"], evidence["locations_b"]):
+                yield {
+                    "run_id": run_id,
+                    "file_a_id": comparison["file_a_id"],
+                    "file_b_id": comparison["file_b_id"],
+                    "a_start": loc_a["start_byte"],
+                    "a_end": loc_a["end_byte"],
+                    "b_start": loc_b["start_byte"],
+                    "b_end": loc_b["end_byte"],
+                    "kind": "AST",
+                    "weight": float(evidence["support_count"]),
+                }
+
+
+def index_ast_stage(
+    db: Session, run_id: str, registry: RunRegistry, heartbeat: Optional[Callable[[], None]] = None
+) -> list[dict]:
+    # run-wide function index and clone search over the parsed files; neither
+    # reports progress, so the run's heartbeat is refreshed between them
+    heartbeat = heartbeat or (lambda: None)
+    prepared_files = registry.ast_files
+    function_matches = match_prepared_functions(prepared_files)
+    heartbeat()
+    bulk_insert(
+        db,
+        FunctionMatch,
+        (
+            {
+                "run_id": run_id,
+                "file_a_id": match["file_a_id"],
+                "file_b_id": match["file_b_id"],
+                "a_name": match["unit_a"]["name"],
+                "a_start": match["unit_a"]["start_byte"],
+                "a_end": match["unit_a"]["end_byte"],
+                "b_name": match["unit_b"]["name"],
+                "b_start": match["unit_b"]["start_byte"],
+                "b_end": match["unit_b"]["end_byte"],
+                "score": match["score"],
+                "kind": match["kind"],
+            }
+            for match in function_matches
+        ),
+        after_batch=heartbeat,
+    )
+    clones = find_prepared_clones(prepared_files)
+    heartbeat()
+    bulk_insert(db, MatchEvidence, ast_evidence_rows(run_id, clones, []), after_batch=heartbeat)
+    return function_matches
 
-    files = get_run_files(db, run_id)
-    prepared_files = []
-    for file_row in files:
-        prepared = prepare_ast_file(
-            file_id=str(file_row.id),
-            path=file_row.path,
-            content=file_row.content,
-            language=file_row.language,
-        )
-        if prepared is not None:
-            prepared_files.append(prepared)
-            if not prepared.handoff.get("parse_ok", False):
-                append_run_warning(
-                    db,
-                    run_id,
-                    {
-                        "stage": "AST",
-                        "path": file_row.path,
-                        "reason": f"syntax issues detected ({prepared.handoff.get('error_count', 0)} parse error indicators)",
-                    },
-                )
-        else:
-            reason = "decode failure" if decode_file_content(file_row.content) is None else "unsupported language or AST preparation failure"
-            append_run_warning(
-                db,
-                run_id,
-                {
-                    "stage": "AST",
-                    "path": file_row.path,
-                    "reason": reason,
-                },
-            )
 
-    candidate_pair_keys = get_candidate_pair_keys(db, run_id)
+def compare_ast_stage(
+    db: Session,
+    run_id: str,
+    registry: RunRegistry,
+    status: RunStatusWriter,
+    function_matches: list[dict],
+    token_comparisons: list[dict],
+) -> None:
+    # the function index and clone search are done; only pair scoring is left
+    registry.ast_files[:] = [prepared.without_index_features() for prepared in registry.ast_files]
+    prepared_files = registry.ast_files
+    config = registry.config
+    candidate_pair_keys = {(str(item["file_a_id"]), str(item["file_b_id"])) for item in token_comparisons} or None
+    if candidate_pair_keys is not None and config.get("function_gate"):
+        # skip whole-file comparison for pairs whose functions share nothing
+        candidate_pair_keys = gate_pairs_by_function_matches(prepared_files, candidate_pair_keys, function_matches)
+    status.begin_step("AST", "pairs", start_pct=65, end_pct=75)
     comparisons = compare_prepared_files(
         prepared_files,
         n=3,
-        candidate_pairs=candidate_pair_keys if candidate_pair_keys else None,
+        candidate_pairs=candidate_pair_keys,
+        cosine_floor=resolve_cosine_floor(config),
+        progress=status.progress,
+        evidence=False,
+    )
+    record(
+        pairs_considered=same_language_pair_count([prepared.language for prepared in prepared_files]),
+        pairs_scored=len(comparisons),
     )
     if not comparisons:
-        append_run_warning(
-            db,
-            run_id,
+        status.warn(
             {
                 "stage": "AST",
                 "reason": "No comparable AST file pairs were produced.",
-            },
+            }
         )
-    pair_map = get_pair_result_map(db, run_id)
-    evidence_rows: list[MatchEvidence] = []
-    for comparison in comparisons:
-        pair_key = (str(comparison["file_a_id"]), str(comparison["file_b_id"]))
-        ast_score = round(comparison["ast_score"], 6)
-        existing = pair_map.get(pair_key)
-        if existing is None:
-            existing = PairResult(
-                run_id=run_id,
-                file_a_id=comparison["file_a_id"],
-                file_b_id=comparison["file_b_id"],
-                fingerprint_score=0.0,
-                ast_score=0.0,
-            )
-            db.add(existing)
-            pair_map[pair_key] = existing
 
-        existing.ast_score = ast_score
-        existing.final_score = blended_final_score(existing.fingerprint_score, ast_score)
+    pair_counts, stored_counts = persist_pair_results(
+        db,
+        run_id,
+        (token_comparisons, registry.token_files),
+        (comparisons, prepared_files),
+        resolve_result_floor(config),
+        heartbeat=status.heartbeat,
+    )
+    prune_clone_evidence(db, run_id)
+    write_score_histogram(db, run_id, pair_counts, stored_counts)
+    status.update(progress_pct=75)
+
+
+def load_token_files(db: Session, run_id: str, file_ids: Optional[list] = None) -> list[CompactTokenFile]:
+    # rebuild compact token files from persisted fingerprints (resume, shards)
+    statement = (
+        select(File.id, File.path, File.language, FileFingerprint.fingerprint_blob)
+        .join(FileFingerprint, FileFingerprint.file_id == File.id)
+        .where(FileFingerprint.run_id == run_id)
+        .order_by(File.id)
+    )
+    if file_ids is not None:
+        statement = statement.where(File.id.in_(file_ids))
+    rows = db.execute(statement).all()
+    files = []
+    for row in rows:
+        fingerprints = deserialize_fingerprints(row.fingerprint_blob)
+        files.append(
+            CompactTokenFile(
+                file_id=row.id,
+                path=row.path,
+                language=(row.language or "").strip().lower() or infer_language_from_path(row.path),
+                fingerprint_hashes=fingerprint_hash_array(fingerprints),
+                fingerprint_digests=fingerprint_digests(fingerprints),
+            )
+        )
+    return files
 
-        for evidence in comparison["evidence"]:
-            for loc_a, loc_b in zip(evidence["locations_a"], evidence["locations_b"]):
-                evidence_rows.append(
-                    MatchEvidence(
-                        run_id=run_id,
-                        file_a_id=comparison["file_a_id"],
-                        file_b_id=comparison["file_b_id"],
-                        a_start=loc_a["start_byte"],
-                        a_end=loc_a["end_byte"],
-                        b_start=loc_b["start_byte"],
-                        b_end=loc_b["end_byte"],
-                        kind="AST",
-                        weight=float(evidence["support_count"]),
-                    )
-                )
 
-    if evidence_rows:
-        db.add_all(evidence_rows)
-    if evidence_rows or comparisons:
-        db.commit()
+def load_ast_files(db: Session, run_id: str, file_ids: Optional[list] = None) -> list[ASTPreparedFile]:
+    # rebuild compact AST files from persisted features (resume, shards)
+    statement = (
+        select(File.id, File.path, File.language, FileAstFeature.feature_blob)
+        .join(FileAstFeature, FileAstFeature.file_id == File.id)
+        .where(FileAstFeature.run_id == run_id)
+        .order_by(File.id)
+    )
+    if file_ids is not None:
+        statement = statement.where(File.id.in_(file_ids))
+    return [
+        deserialize_ast_features(
+            str(row.id),
+            row.path,
+            (row.language or "").strip().lower() or infer_language_from_path(row.path),
+            row.feature_blob,
+        )
+        for row in db.execute(statement).all()
+    ]
+
+
+def get_run_function_matches(db: Session, run_id: str) -> list[dict]:
+    rows = db.execute(
+        select(FunctionMatch.file_a_id, FunctionMatch.file_b_id).where(FunctionMatch.run_id == run_id)
+    ).all()
+    return [{"file_a_id": str(row.file_a_id), "file_b_id": str(row.file_b_id)} for row in rows]
+
+
+def reset_stage_outputs(db: Session, run_id: str, checkpoint: str) -> None:
+    """Remove whatever a step committed before it was interrupted, so it can run again."""
+    if checkpoint == "prepare":
+        db.execute(delete(FileFingerprint).where(FileFingerprint.run_id == run_id))
+        db.execute(delete(FileAstFeature).where(FileAstFeature.run_id == run_id))
+        db.execute(delete(FunctionMatch).where(FunctionMatch.run_id == run_id))
+        db.execute(delete(MatchEvidence).where(MatchEvidence.run_id == run_id, MatchEvidence.kind == "CLONE"))
+    elif checkpoint == "compare":
+        db.execute(delete(CandidatePair).where(CandidatePair.run_id == run_id))
+        db.execute(delete(PairResult).where(PairResult.run_id == run_id))
+        db.execute(delete(RunScoreBin).where(RunScoreBin.run_id == run_id))
+        db.execute(
+            delete(MatchEvidence).where(MatchEvidence.run_id == run_id, MatchEvidence.kind.in_(("TOKEN", "AST")))
+        )
+    db.commit()
 
-    update_run(db, run_id, stage="AST", progress_pct=75)
-    analysis_stage_delay()
 
+def run_step(db: Session, run_id: str, status: RunStatusWriter, checkpoint: str, step) -> None:
+    # skip a step whose outputs are already durable; otherwise clear partial output and run it
+    if status.completed(checkpoint):
+        return
+    status.raise_if_cancelled()
+    reset_stage_outputs(db, run_id, checkpoint)
+    step()
+    status.checkpoint(checkpoint)
+
+
+def finish_run(status: RunStatusWriter) -> None:
+    # build report
+    with measure_stage(status.db, status.run_id, "REPORT", "report"):
+        status.update(stage="REPORT", progress_pct=80)
+        status.update(progress_pct=95)
+
+    # finish run
+    status.update(
+        status="DONE",
+        stage="REPORT",
+        progress_pct=100,
+        finished_at=datetime.utcnow(),
+    )
 
-def get_existing_pairs(db: Session, run_id: str) -> set[tuple[str, str]]:
-    # load pair keys
-    pairs = db.query(PairResult).filter(PairResult.run_id == run_id).all()
-    return {(str(pair.file_a_id), str(pair.file_b_id)) for pair in pairs}
 
-def save_results(db: Session, rows: list[PairResult]) -> None:
-    # save new rows
-    if not rows:
+def dispatch_compare_shards(db: Session, run_id: str, registry: RunRegistry, status: RunStatusWriter) -> None:
+    """
+    Record the run's comparison shards and fan them out as a Celery chord;
+    `finalize_run` completes the run once every shard has been persisted.
+    """
+    if not status.completed("shards"):
+        shards = plan_compare_shards(
+            [(prepared.file_id, prepared.language) for prepared in registry.token_files],
+            COMPARE_SHARD_FILES,
+        )
+        db.execute(delete(RunShard).where(RunShard.run_id == run_id))
+        bulk_insert(
+            db,
+            RunShard,
+            (
+                {
+                    "run_id": run_id,
+                    "seq": seq,
+                    "language": shard.language,
+                    "row_file_ids": list(shard.row_file_ids),
+                    "col_file_ids": list(shard.col_file_ids),
+                    "status": "PENDING",
+                }
+                for seq, shard in enumerate(shards)
+            ),
+        )
+        status.checkpoint("shards")
+
+    # on resume only the shards that never finished are sent again
+    shard_states = db.execute(select(RunShard.seq, RunShard.status).where(RunShard.run_id == run_id)).all()
+    pending = sorted(seq for seq, shard_status in shard_states if shard_status != "DONE")
+    status.begin_step("AST", "shards", start_pct=55, end_pct=75, total=len(shard_states))
+    status.progress(len(shard_states) - len(pending))
+    status.flush()
+    if not pending:
+        prune_clone_evidence(db, run_id)
+        write_shard_histogram(db, run_id)
+        finish_run(status)
         return
-    db.add_all(rows)
-    db.commit()
 
+    chord(compare_shard.si(run_id, seq) for seq in pending)(
+        finalize_run.si(run_id).on_error(fail_run.s(run_id))
+    )
 
-@celery_app.task(name="run_pipeline")
-def run_pipeline(run_id: str) -> None:
+
+def get_function_matches_between(db: Session, run_id: str, file_ids: list[str]) -> list[dict]:
+    rows = db.execute(
+        select(FunctionMatch.file_a_id, FunctionMatch.file_b_id).where(
+            FunctionMatch.run_id == run_id,
+            FunctionMatch.file_a_id.in_(file_ids),
+            FunctionMatch.file_b_id.in_(file_ids),
+        )
+    ).all()
+    return [{"file_a_id": str(row.file_a_id), "file_b_id": str(row.file_b_id)} for row in rows]
+
+
+def persist_pair_results(
+    db: Session,
+    run_id: str,
+    token_scored: tuple[list[dict], list[CompactTokenFile]],
+    ast_scored: tuple[list[dict], list[ASTPreparedFile]],
+    floor: float,
+    heartbeat: Optional[Callable[[], None]] = None,
+) -> tuple[list[int], list[int]]:
     """
-    Run stages: INGEST -> TOKENS -> AST -> REPORT.
-    TOKENS is still a placeholder. AST now runs real parsing/comparison.
+    Merge token and AST scores per pair and insert the pairs whose final
+    score reaches `floor` (candidate pair, result and evidence rows); pairs
+    below it are only counted. Comparisons come with the prepared files they
+    were scored from, so evidence is only built for the stored pairs. Returns
+    per-bin (compared, stored) counts. Every pair belongs to exactly one run
+    or shard, so these are plain inserts. `heartbeat` is called after every
+    batch so a long write keeps the run live.
     """
-    db = open_db()
+    (token_comparisons, token_files), (ast_comparisons, ast_files) = token_scored, ast_scored
+    ast_scores = {
+        (str(item["file_a_id"]), str(item["file_b_id"])): round(item["ast_score"], 6) for item in ast_comparisons
+    }
+    pairs: dict[tuple[str, str], dict] = {}
+    for comparison in token_comparisons:
+        key = (str(comparison["file_a_id"]), str(comparison["file_b_id"]))
+        score = round(comparison["fingerprint_score"], 6)
+        ast_score = ast_scores.get(key, 0.0)
+        pairs[key] = {
+            "run_id": run_id,
+            "file_a_id": comparison["file_a_id"],
+            "file_b_id": comparison["file_b_id"],
+            "final_score": blended_final_score(score, ast_score),
+            "fingerprint_score": score,
+            "ast_score": ast_score,
+        }
+    for comparison in ast_comparisons:
+        key = (str(comparison["file_a_id"]), str(comparison["file_b_id"]))
+        if key not in pairs:
+            pairs[key] = {
+                "run_id": run_id,
+                "file_a_id": comparison["file_a_id"],
+                "file_b_id": comparison["file_b_id"],
+                "final_score": blended_final_score(0.0, ast_scores[key]),
+                "fingerprint_score": 0.0,
+                "ast_score": ast_scores[key],
+            }
+
+    pair_counts, stored_counts = empty_bins(), empty_bins()
+    stored: set[tuple[str, str]] = set()
+    for key, pair in pairs.items():
+        index = score_bin(pair["final_score"])
+        pair_counts[index] += 1
+        if pair["final_score"] >= floor:
+            stored_counts[index] += 1
+            stored.add(key)
+
+    def kept(comparisons: list[dict]) -> list[dict]:
+        return [item for item in comparisons if (str(item["file_a_id"]), str(item["file_b_id"])) in stored]
+
+    token_kept, ast_kept = kept(token_comparisons), kept(ast_comparisons)
+    add_token_evidence(token_kept, token_files)
+    add_ast_evidence(ast_kept, ast_files, n=3)
+    record(pairs_persisted=len(stored))
+    bulk_insert(
+        db, CandidatePair, (candidate_row(run_id, comparison) for comparison in token_kept), after_batch=heartbeat
+    )
+    bulk_insert(db, PairResult, (pairs[key] for key in stored), after_batch=heartbeat)
+    bulk_insert(db, MatchEvidence, token_evidence_rows(run_id, token_kept), after_batch=heartbeat)
+    bulk_insert(db, MatchEvidence, ast_evidence_rows(run_id, [], ast_kept), after_batch=heartbeat)
+    return pair_counts, stored_counts
 
-    try:
-        # start run
-        update_run(
-            db,
-            run_id,
-            status="RUNNING",
-            stage="INGEST",
-            progress_pct=0,
-            started_at=datetime.utcnow(),
+
+def prune_clone_evidence(db: Session, run_id: str) -> None:
+    """
+    Drop CLONE evidence of pairs that were not stored. The clone search runs
+    in the prepare step, before any pair is scored, and its rows are what shards
+    and resumed runs read, so they are pruned once every pair is persisted.
+    """
+    stored_pair = select(PairResult.id).where(
+        PairResult.run_id == run_id,
+        PairResult.file_a_id == MatchEvidence.file_a_id,
+        PairResult.file_b_id == MatchEvidence.file_b_id,
+    )
+    db.execute(
+        delete(MatchEvidence).where(
+            MatchEvidence.run_id == run_id,
+            MatchEvidence.kind == "CLONE",
+            ~stored_pair.exists(),
         )
+    )
+    db.commit()
 
-        # ingest files
-        update_run(db, run_id, stage="INGEST", progress_pct=10)
-        update_run(db, run_id, stage="INGEST", progress_pct=25)
 
-        # run placeholder stages
-        run_token_stage(db, run_id)
-        run_ast_stage(db, run_id)
+def write_score_histogram(db: Session, run_id: str, pair_counts: list[int], stored_counts: list[int]) -> None:
+    db.execute(delete(RunScoreBin).where(RunScoreBin.run_id == run_id))
+    db.commit()
+    bulk_insert(db, RunScoreBin, histogram_rows(run_id, pair_counts, stored_counts))
+
+
+def write_shard_histogram(db: Session, run_id: str) -> None:
+    # every shard is persisted; add up their per-bin counts
+    pair_counts, stored_counts = empty_bins(), empty_bins()
+    for (score_bins,) in db.execute(select(RunShard.score_bins).where(RunShard.run_id == run_id)).all():
+        if score_bins:
+            add_bins(pair_counts, score_bins["pairs"])
+            add_bins(stored_counts, score_bins["stored"])
+    write_score_histogram(db, run_id, pair_counts, stored_counts)
+
+
+def shard_pair_filter(model, shard: CompareShard):
+    rows, cols = list(shard.row_file_ids), list(shard.col_file_ids)
+    if shard.diagonal:
+        return and_(model.file_a_id.in_(rows), model.file_b_id.in_(rows))
+    return or_(
+        and_(model.file_a_id.in_(rows), model.file_b_id.in_(cols)),
+        and_(model.file_a_id.in_(cols), model.file_b_id.in_(rows)),
+    )
 
-        # build report
-        update_run(db, run_id, stage="REPORT", progress_pct=80)
-        update_run(db, run_id, stage="REPORT", progress_pct=95)
 
-        # finish run
-        update_run(
+def clear_shard_outputs(db: Session, run_id: str, shard: CompareShard) -> None:
+    for model in (CandidatePair, PairResult):
+        db.execute(delete(model).where(model.run_id == run_id, shard_pair_filter(model, shard)))
+    db.execute(
+        delete(MatchEvidence).where(
+            MatchEvidence.run_id == run_id,
+            MatchEvidence.kind.in_(("TOKEN", "AST")),
+            shard_pair_filter(MatchEvidence, shard),
+        )
+    )
+    db.commit()
+
+
+def score_shard(
+    db: Session, run_id: str, seq: int, shard: CompareShard, config: dict, heartbeat: RunHeartbeat
+) -> tuple[list[int], list[int]]:
+    """Score one shard's pairs and store them; `heartbeat` raises once the run has stopped."""
+    with (
+        profile_run(db, run_id, config, f"shard-{seq:04d}"),
+        track_memory(config),
+        measure_stage(db, run_id, "AST", "compare_shard", seq=seq) as metric,
+    ):
+        token_files = load_token_files(db, run_id, shard.file_ids)
+        ast_files = load_ast_files(db, run_id, shard.file_ids)
+        token_comparisons = compare_prepared_token_files(
+            token_files,
+            k=K_GRAM_SIZE,
+            candidate_pairs=shard.pair_keys(),
+            processes=1,
+            progress=heartbeat,
+            evidence=False,
+        )
+        candidate_pair_keys = {(str(item["file_a_id"]), str(item["file_b_id"])) for item in token_comparisons}
+        candidate_pair_keys = candidate_pair_keys or shard.pair_keys()
+        if config.get("function_gate"):
+            candidate_pair_keys = gate_pairs_by_function_matches(
+                ast_files,
+                candidate_pair_keys,
+                get_function_matches_between(db, run_id, shard.file_ids),
+            )
+        ast_comparisons = compare_prepared_files(
+            ast_files,
+            n=3,
+            candidate_pairs=candidate_pair_keys,
+            cosine_floor=resolve_cosine_floor(config),
+            processes=1,
+            progress=heartbeat,
+            evidence=False,
+        )
+        metric.files = len(shard.file_ids)
+        metric.details["token_pairs_scored"] = len(token_comparisons)
+        record(pairs_considered=len(shard.pair_keys()), pairs_scored=len(ast_comparisons))
+        heartbeat.beat()
+        pair_counts, stored_counts = persist_pair_results(
             db,
             run_id,
-            status="DONE",
-            stage="REPORT",
-            progress_pct=100,
+            (token_comparisons, token_files),
+            (ast_comparisons, ast_files),
+            resolve_result_floor(config),
+            heartbeat=heartbeat,
+        )
+    return pair_counts, stored_counts
+
+
+# acks_late: a shard whose worker dies is redelivered; clear_shard_outputs
+# makes the retry safe.
+@celery_app.task(name="compare_shard", acks_late=True, reject_on_worker_lost=True)
+def compare_shard(run_id: str, seq: int) -> None:
+    """Score and persist one block of the pair matrix (token and AST)."""
+    db = open_db()
+    try:
+        shard_row = db.query(RunShard).filter(RunShard.run_id == run_id, RunShard.seq == seq).first()
+        run = db.query(Run).filter(Run.id == run_id).first()
+        if shard_row is None or shard_row.status == "DONE" or run is None or run.status in STOPPED_RUN_STATUSES:
+            return
+        shard = CompareShard(shard_row.language, tuple(shard_row.row_file_ids), tuple(shard_row.col_file_ids))
+        config = dict(run.config_json or {})
+        # a force-resume leaves the run alone while its shards are started and beating
+        shard_row.started_at = datetime.utcnow()
+        db.commit()
+        heartbeat = RunHeartbeat(db, run_id)
+
+        try:
+            heartbeat.beat()
+            # a shard that died half-way may have committed some batches already
+            clear_shard_outputs(db, run_id, shard)
+            pair_counts, stored_counts = score_shard(db, run_id, seq, shard, config, heartbeat)
+        except RunCancelled:
+            # the run was cancelled or failed between chunks; leave the shard PENDING
+            db.rollback()
+            return
+
+        shard_row.status = "DONE"
+        shard_row.pair_count = sum(pair_counts)
+        shard_row.score_bins = {"pairs": pair_counts, "stored": stored_counts}
+        shard_row.finished_at = datetime.utcnow()
+        db.commit()
+        record_shard_progress(db, run_id)
+    finally:
+        db.close()
+
+
+def record_shard_progress(db: Session, run_id: str) -> None:
+    # shards finish concurrently; only ever move progress forward. Each
+    # finished shard also counts as a sign of life for the run.
+    done, total = db.execute(
+        select(
+            func.count(RunShard.id).filter(RunShard.status == "DONE"),
+            func.count(RunShard.id),
+        ).where(RunShard.run_id == run_id)
+    ).one()
+    progress_pct = 55 + (20 * done // total if total else 20)
+    db.execute(
+        update(Run)
+        .where(Run.id == run_id)
+        .values(
+            heartbeat_at=datetime.utcnow(),
+            progress_pct=case((Run.progress_pct < progress_pct, progress_pct), else_=Run.progress_pct),
+        )
+    )
+    db.commit()
+
+
+@celery_app.task(name="finalize_run")
+def finalize_run(run_id: str) -> None:
+    """Chord callback: every shard is persisted, so the run can be completed."""
+    db = open_db()
+    try:
+        status = RunStatusWriter(db, run_id)
+        if status.fields.get("status") in STOPPED_RUN_STATUSES:
+            # every shard has stopped, so a cancel is now complete
+            status.confirm_cancel()
+            return
+        prune_clone_evidence(db, run_id)
+        write_shard_histogram(db, run_id)
+        finish_run(status)
+    except RunCancelled:
+        db.rollback()
+        status.confirm_cancel()
+    finally:
+        schedule_runs(db)
+        db.close()
+
+
+@celery_app.task(name="fail_run")
+def fail_run(request, exc, traceback, run_id: str) -> None:
+    """Chord errback: a shard failed, so mark the run FAILED."""
+    db = open_db()
+    try:
+        status = RunStatusWriter(db, run_id)
+        status.update(
+            status="FAILED",
+            error_message=str(exc),
             finished_at=datetime.utcnow(),
         )
+    except RunCancelled:
+        status.confirm_cancel()
+    finally:
+        schedule_runs(db)
+        db.close()
+
+
+@celery_app.task(name="run_pipeline")
+def run_pipeline(run_id: str) -> None:
+    """
+    Run stages: INGEST -> TOKENS -> AST -> REPORT.
+    With COMPARE_SHARD_FILES set (and Redis workers available), pair
+    comparison is fanned out as shards and `finalize_run` does REPORT.
+    Steps listed in state_json["checkpoints"] (a resumed run) are skipped.
+    With config_json["profile"] the task is profiled (pipeline.profiling),
+    with config_json["memory"] its steps record tracemalloc allocation sites.
+    """
+    db = open_db()
+    status = RunStatusWriter(db, run_id)
+
+    try:
+        with profile_run(db, run_id, status.config, "pipeline"), track_memory(status.config):
+            # start run
+            status.update(
+                status="RUNNING",
+                stage="INGEST",
+                progress_pct=0,
+                started_at=status.fields.get("started_at") or datetime.utcnow(),
+            )
+            status.rewind()
+
+            # decode, fingerprint and parse every file in one pass; a resumed
+            # run reloads the stored fingerprints and AST features instead
+            function_matches = None
+            if status.completed("prepare"):
+                registry = load_ingested_files(db, run_id, status)
+                registry.token_files.extend(load_token_files(db, run_id))
+                registry.ast_files.extend(load_ast_files(db, run_id))
+            else:
+                registry = RunRegistry(config=dict(status.config))
+                with measure_stage(db, run_id, "INGEST", "prepare") as metric:
+                    status.raise_if_cancelled()
+                    reset_stage_outputs(db, run_id, "prepare")
+                    prepare_run_files(db, run_id, registry, status)
+                    function_matches = index_ast_stage(db, run_id, registry, status.heartbeat)
+                    metric.files = len(registry.files)
+                    metric.details.update(token_files=len(registry.token_files), ast_files=len(registry.ast_files))
+                status.checkpoint("prepare")
+
+            if COMPARE_SHARD_FILES > 0 and USE_REDIS:
+                # prepared here, compared across workers
+                dispatch_compare_shards(db, run_id, registry, status)
+                return
+
+            # pair results are written once both scores are known, so token and
+            # AST comparison (and their persistence) are the one "compare" step
+            if not status.completed("compare"):
+                if function_matches is None:
+                    function_matches = get_run_function_matches(db, run_id)
+                with measure_stage(db, run_id, "AST", "compare") as metric:
+                    run_step(
+                        db,
+                        run_id,
+                        status,
+                        "compare",
+                        lambda: compare_ast_stage(
+                            db, run_id, registry, status, function_matches, compare_token_stage(registry, status)
+                        ),
+                    )
+                    metric.files = len(registry.ast_files)
+                analysis_stage_delay()
+
+            finish_run(status)
+    except RunCancelled:
+        # cancelled through the API; confirming it frees the run's slot
+        db.rollback()
+        status.confirm_cancel()
     except Exception as exc:
         # mark run failed
-        update_run(
-            db,
-            run_id,
+        db.rollback()
+        status.update(
             status="FAILED",
             error_message=str(exc),
             finished_at=datetime.utcnow(),
         )
         raise
     finally:
+        # this run's slot is free (or still held by its shards); start what fits
+        schedule_runs(db)
         db.close()
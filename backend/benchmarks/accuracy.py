@@ -0,0 +1,285 @@
+"""
+Accuracy versus speed of approximate pair scoring.
+
+    python -m benchmarks.accuracy --language java --size 200 --engines function_gate,cosine_floor=0.99
+
+Every engine scores the same labelled cohort (benchmarks.cohort). The exact
+engine — token fingerprint Jaccard and AST n-gram Jaccard over every
+same-language pair, merged the way the pipeline merges them — is the ground
+truth. For each other engine the harness reports:
+
+- recall@t: share of the pairs the exact engine scores >= t that the engine
+  also scores >= t (plus the same share over the labelled plagiarised pairs)
+- precision@t: share of the pairs the engine scores >= t that the exact
+  engine also scores >= t. Skipping the AST score falls back to the token
+  score, so an approximation can raise scores as well as lower them
+- top-K overlap: share of the exact top-K pairs in the engine's top-K
+- error: distribution of |engine score - exact score| over every pair
+- speedup: exact comparison time / engine comparison time
+
+An engine spec is either a registered name (see `register_engine`) or a set
+of run config overrides joined with "+", e.g. "function_gate+cosine_floor=0.98".
+Those are replayed through the same candidate gating as the pipeline, so any
+new approximation exposed through config_json can be measured without
+touching this file. Other engines can be registered from a module passed
+with --plugin.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from benchmarks.cohort import Cohort, generate_cohort
+from similarity.thresholds import (
+    SIMILARITY_THRESHOLD_HIGH,
+    SIMILARITY_THRESHOLD_MIN,
+    SIMILARITY_THRESHOLD_SUSPICIOUS,
+)
+
+
+PairKey = tuple[str, str]
+DEFAULT_THRESHOLDS = (SIMILARITY_THRESHOLD_MIN, SIMILARITY_THRESHOLD_SUSPICIOUS, SIMILARITY_THRESHOLD_HIGH)
+DEFAULT_ENGINES = ("function_gate", "cosine_floor=0.98", "cosine_floor=0.99", "function_gate+cosine_floor=0.98")
+
+
+@dataclass
+class PreparedCohort:
+    """A cohort after the prepare and function-index steps, shared by every engine."""
+
+    cohort: Cohort
+    token_files: list
+    ast_files: list
+    function_matches: List[Dict[str, Any]] = field(default_factory=list)
+
+
+# an engine returns the final score of every pair it scored, keyed by
+# sorted (file id, file id); pairs it skipped count as 0
+Engine = Callable[[PreparedCohort], Dict[PairKey, float]]
+ENGINES: Dict[str, Engine] = {}
+
+
+def register_engine(name: str) -> Callable[[Engine], Engine]:
+    def decorator(engine: Engine) -> Engine:
+        ENGINES[name] = engine
+        return engine
+
+    return decorator
+
+
+def prepare_cohort(cohort: Cohort) -> PreparedCohort:
+    from app.pipeline.ast.run_stage import match_prepared_functions, prepare_ast_file
+    from app.pipeline.token.run_stage import prepare_token_file
+
+    token_files, ast_files = [], []
+    for item in cohort.files:
+        token_file = prepare_token_file(file_id=item.file_id, path=item.path, content=item.content, language=item.language)
+        if token_file is not None:
+            token_files.append(token_file.compact())
+        ast_file = prepare_ast_file(file_id=item.file_id, path=item.path, content=item.content, language=item.language)
+        if ast_file is not None:
+            ast_files.append(ast_file)
+    function_matches = match_prepared_functions(ast_files)
+    return PreparedCohort(
+        cohort=cohort,
+        token_files=token_files,
+        ast_files=[prepared.compact().without_index_features() for prepared in ast_files],
+        function_matches=function_matches,
+    )
+
+
+def pipeline_scores(prepared: PreparedCohort, config: Dict[str, Any]) -> Dict[PairKey, float]:
+    """Score pairs like compare_token_stage + compare_ast_stage for a run with `config`."""
+    from app.pipeline.ast.prefilter import resolve_cosine_floor
+    from app.pipeline.ast.run_stage import compare_prepared_files, gate_pairs_by_function_matches
+    from app.pipeline.token.run_stage import compare_prepared_token_files
+    from app.tasks import blended_final_score
+
+    token_comparisons = compare_prepared_token_files(prepared.token_files, evidence=False)
+    candidate_pair_keys = {(str(item["file_a_id"]), str(item["file_b_id"])) for item in token_comparisons} or None
+    if candidate_pair_keys is not None and config.get("function_gate"):
+        candidate_pair_keys = gate_pairs_by_function_matches(
+            prepared.ast_files, candidate_pair_keys, prepared.function_matches
+        )
+    ast_comparisons = compare_prepared_files(
+        prepared.ast_files,
+        n=3,
+        candidate_pairs=candidate_pair_keys,
+        cosine_floor=resolve_cosine_floor(config),
+        evidence=False,
+    )
+
+    token_scores = {pair_key(item): round(item["fingerprint_score"], 6) for item in token_comparisons}
+    ast_scores = {pair_key(item): round(item["ast_score"], 6) for item in ast_comparisons}
+    return {
+        key: blended_final_score(token_scores.get(key, 0.0), ast_scores.get(key, 0.0))
+        for key in token_scores.keys() | ast_scores.keys()
+    }
+
+
+def pair_key(comparison: Dict[str, Any]) -> PairKey:
+    return tuple(sorted((str(comparison["file_a_id"]), str(comparison["file_b_id"]))))
+
+
+def config_engine(config: Dict[str, Any]) -> Engine:
+    return lambda prepared: pipeline_scores(prepared, config)
+
+
+# explicit cosine_floor=0 so an AST_COSINE_FLOOR set in the environment cannot leak into the ground truth
+ENGINES["exact"] = config_engine({"cosine_floor": 0.0, "function_gate": False})
+
+
+def parse_engine_spec(spec: str) -> Engine:
+    if spec in ENGINES:
+        return ENGINES[spec]
+    config: Dict[str, Any] = {}
+    for part in spec.split("+"):
+        name, _, value = part.partition("=")
+        if not name:
+            raise ValueError(f"empty engine option in {spec!r}")
+        config[name] = json.loads(value) if value else True
+    return config_engine(config)
+
+
+def top_keys(scores: Dict[PairKey, float], k: int) -> set[PairKey]:
+    return {key for key, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]}
+
+
+def compare_scores(
+    exact: Dict[PairKey, float],
+    approximate: Dict[PairKey, float],
+    *,
+    thresholds: Sequence[float] = DEFAULT_THRESHOLDS,
+    top_k: int = 50,
+    labels: Optional[set[PairKey]] = None,
+) -> Dict[str, Any]:
+    """Accuracy of `approximate` against the `exact` scores of the same pairs."""
+    recall: Dict[str, Optional[float]] = {}
+    precision: Dict[str, Optional[float]] = {}
+    label_recall: Dict[str, Optional[float]] = {}
+    for threshold in thresholds:
+        relevant = {key for key, score in exact.items() if score >= threshold}
+        found = {key for key, score in approximate.items() if score >= threshold}
+        recall[f"{threshold:g}"] = round(len(relevant & found) / len(relevant), 4) if relevant else None
+        precision[f"{threshold:g}"] = round(len(relevant & found) / len(found), 4) if found else None
+        if labels:
+            label_recall[f"{threshold:g}"] = round(len(labels & found) / len(labels), 4)
+
+    k = min(top_k, len(exact))
+    overlap = round(len(top_keys(exact, k) & top_keys(approximate, k)) / k, 4) if k else None
+
+    errors = np.array([abs(approximate.get(key, 0.0) - score) for key, score in exact.items()], dtype=np.float64)
+    error = {"pairs": int(errors.size)}
+    if errors.size:
+        error.update(
+            {
+                "mean": round(float(errors.mean()), 6),
+                "p50": round(float(np.percentile(errors, 50)), 6),
+                "p95": round(float(np.percentile(errors, 95)), 6),
+                "max": round(float(errors.max()), 6),
+                "changed_share": round(float((errors > 1e-9).mean()), 4),
+            }
+        )
+    return {
+        "recall": recall,
+        "precision": precision,
+        "label_recall": label_recall,
+        "top_k": k,
+        "top_k_overlap": overlap,
+        "error": error,
+    }
+
+
+def evaluate(
+    prepared: PreparedCohort,
+    engines: Dict[str, Engine],
+    *,
+    thresholds: Sequence[float] = DEFAULT_THRESHOLDS,
+    top_k: int = 50,
+) -> List[Dict[str, Any]]:
+    """Run the exact engine and every engine in `engines`; one report row per engine."""
+    labels = prepared.cohort.label_keys()
+    timed: Dict[str, tuple[Dict[PairKey, float], float]] = {}
+    for name, engine in {"exact": ENGINES["exact"], **engines}.items():
+        started = time.perf_counter()
+        scores = engine(prepared)
+        timed[name] = (scores, time.perf_counter() - started)
+
+    exact_scores, exact_seconds = timed["exact"]
+    rows = []
+    for name, (scores, seconds) in timed.items():
+        rows.append(
+            {
+                "engine": name,
+                "seconds": round(seconds, 4),
+                "speedup": round(exact_seconds / seconds, 2) if seconds else None,
+                "pairs_scored": len(scores),
+                **compare_scores(exact_scores, scores, thresholds=thresholds, top_k=top_k, labels=labels),
+            }
+        )
+    return rows
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    thresholds = list(rows[0]["recall"]) if rows else []
+    header = (
+        ["engine", "seconds", "speedup"]
+        + [f"recall@{t}" for t in thresholds]
+        + [f"precision@{t}" for t in thresholds]
+        + [f"labels@{t}" for t in thresholds]
+        + ["top-K", "err mean", "err p95", "err max"]
+    )
+
+    def cell(value: Any) -> str:
+        return "-" if value is None else str(value)
+
+    lines = [header]
+    for row in rows:
+        lines.append(
+            [row["engine"], cell(row["seconds"]), cell(row["speedup"])]
+            + [cell(row["recall"][t]) for t in thresholds]
+            + [cell(row["precision"][t]) for t in thresholds]
+            + [cell(row["label_recall"].get(t)) for t in thresholds]
+            + [cell(row["top_k_overlap"])]
+            + [cell(row["error"].get(name)) for name in ("mean", "p95", "max")]
+        )
+    widths = [max(len(line[column]) for line in lines) for column in range(len(header))]
+    return "\n".join("  ".join(value.ljust(width) for value, width in zip(line, widths)) for line in lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--language", default="python")
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engines", default=",".join(DEFAULT_ENGINES))
+    parser.add_argument("--plugin", action="append", default=[], help="module that registers extra engines")
+    parser.add_argument("--thresholds", default=",".join(f"{value:g}" for value in DEFAULT_THRESHOLDS))
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--out", help="also write the rows as JSON here")
+    args = parser.parse_args(argv)
+
+    for module in args.plugin:
+        importlib.import_module(module)
+    engines = {spec: parse_engine_spec(spec) for spec in args.engines.split(",") if spec.strip() and spec != "exact"}
+    thresholds = [float(value) for value in args.thresholds.split(",") if value.strip()]
+
+    prepared = prepare_cohort(generate_cohort(args.language, args.size, seed=args.seed))
+    rows = evaluate(prepared, engines, thresholds=thresholds, top_k=args.top_k)
+    print(format_table(rows))
+    if args.out:
+        report = {"language": args.language, "files": args.size, "seed": args.seed, "rows": rows}
+        with open(args.out, "w", encoding="utf-8") as handle:
+            handle.write(json.dumps(report, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
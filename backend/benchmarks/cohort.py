@@ -0,0 +1,467 @@
+"""
+Synthetic student cohorts for benchmarks.
+
+Programs are generated as a small statement tree and rendered in every
+language the pipeline supports, so the same cohort shape can be timed per
+language. A share of each cohort is copied from another student and then
+disguised with the mutations students actually use: renaming, statement
+reordering, dead-code insertion and partial copying. The copied pairs are
+returned as labels, so a cohort doubles as ground truth for accuracy checks.
+"""
+
+from __future__ import annotations
+
+import random
+import re
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+
+LANGUAGES = ("python", "java", "c", "cpp", "javascript")
+COHORT_SIZES = (100, 1000, 5000)
+MUTATIONS = ("rename", "reorder", "dead_code", "partial_copy")
+
+EXTENSIONS = {"python": "py", "java": "java", "c": "c", "cpp": "cpp", "javascript": "js"}
+
+_NAME_PARTS = (
+    "total", "count", "value", "result", "index", "score", "limit", "step",
+    "acc", "best", "delta", "item", "temp", "size", "offset", "sum",
+)
+_FUNCTION_PARTS = (
+    "compute", "count", "find", "scale", "merge", "check", "build", "apply",
+    "sum", "score", "filter", "update", "reduce", "measure", "collect", "rank",
+)
+_OPERATORS = ("+", "-", "*")
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+
+
+# -- statement tree -----------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Assign:
+    target: str
+    expr: str
+    op: str = ""  # "+", "-" or "*" for an augmented assignment
+
+
+@dataclass(frozen=True)
+class If:
+    cond: str
+    body: Tuple["Stmt", ...]
+    orelse: Tuple["Stmt", ...] = ()
+
+
+@dataclass(frozen=True)
+class For:
+    var: str
+    bound: str
+    body: Tuple["Stmt", ...]
+
+
+@dataclass(frozen=True)
+class While:
+    cond: str
+    body: Tuple["Stmt", ...]
+
+
+@dataclass(frozen=True)
+class Return:
+    expr: str
+
+
+Stmt = Union[Assign, If, For, While, Return]
+
+
+@dataclass(frozen=True)
+class Function:
+    name: str
+    params: Tuple[str, ...]
+    body: Tuple[Stmt, ...]
+
+
+@dataclass(frozen=True)
+class Program:
+    functions: Tuple[Function, ...]
+
+
+@dataclass(frozen=True)
+class CohortFile:
+    file_id: str
+    path: str
+    language: str
+    content: bytes
+    student: str
+
+
+@dataclass(frozen=True)
+class PlagiarisedPair:
+    source_id: str
+    copy_id: str
+    mutations: Tuple[str, ...]
+
+
+@dataclass
+class Cohort:
+    language: str
+    seed: int
+    files: List[CohortFile] = field(default_factory=list)
+    plagiarised: List[PlagiarisedPair] = field(default_factory=list)
+
+    def label_keys(self) -> set[tuple[str, str]]:
+        # pair keys in the pipeline's (smaller id, larger id) order
+        return {tuple(sorted((pair.source_id, pair.copy_id))) for pair in self.plagiarised}
+
+
+# -- generation ---------------------------------------------------------------
+
+
+class _ProgramWriter:
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.callable: List[Tuple[str, int]] = []
+
+    def name(self, parts: Sequence[str]) -> str:
+        first, second = self.rng.sample(parts, 2)
+        return f"{first}_{second}"
+
+    def term(self, names: Sequence[str]) -> str:
+        if self.rng.random() < 0.7:
+            return self.rng.choice(names)
+        return str(self.rng.randint(1, 99))
+
+    def expr(self, names: Sequence[str]) -> str:
+        roll = self.rng.random()
+        if self.callable and roll < 0.12:
+            function, arity = self.rng.choice(self.callable)
+            return f"{function}({', '.join(self.term(names) for _ in range(arity))})"
+        text = self.term(names)
+        for _ in range(self.rng.randint(0, 3)):
+            text = f"{text} {self.rng.choice(_OPERATORS)} {self.term(names)}"
+            if self.rng.random() < 0.25:
+                text = f"({text})"
+        return text
+
+    def cond(self, names: Sequence[str]) -> str:
+        return f"{self.expr(names)} {self.rng.choice(('>', '<', '>=', '<=', '!=', '=='))} {self.term(names)}"
+
+    def block(self, names: List[str], depth: int, length: int) -> Tuple[Stmt, ...]:
+        stmts: List[Stmt] = []
+        for _ in range(length):
+            roll = self.rng.random()
+            if depth < 2 and roll < 0.15:
+                var = self.rng.choice(("i", "j", "k")[depth:])
+                body = self.block([*names, var], depth + 1, self.rng.randint(1, 4))
+                stmts.append(For(var, self.rng.choice(names), body))
+            elif depth < 2 and roll < 0.22:
+                target = self.rng.choice(names)
+                body = self.block(names, depth + 1, self.rng.randint(1, 3))
+                stmts.append(While(f"{target} > {self.rng.randint(0, 9)}", body + (Assign(target, "1", "-"),)))
+            elif depth < 2 and roll < 0.4:
+                orelse = self.block(names, depth + 1, self.rng.randint(1, 3)) if self.rng.random() < 0.5 else ()
+                stmts.append(If(self.cond(names), self.block(names, depth + 1, self.rng.randint(1, 3)), orelse))
+            elif roll < 0.6:
+                stmts.append(Assign(self.rng.choice(names), self.expr(names), self.rng.choice(_OPERATORS)))
+            else:
+                target = self.name(_NAME_PARTS) if self.rng.random() < 0.6 else self.rng.choice(names)
+                stmts.append(Assign(target, self.expr(names)))
+                if target not in names:
+                    names.append(target)
+        return tuple(stmts)
+
+    def function(self, name: str) -> Function:
+        params = tuple(self.rng.sample(("a", "b", "n", "x", "y", "m", "p", "q"), self.rng.randint(1, 4)))
+        names = list(params)
+        body = self.block(names, 0, self.rng.randint(3, 12))
+        function = Function(name, params, body + (Return(self.expr(names)),))
+        self.callable.append((name, len(params)))
+        return function
+
+    def program(self, min_functions: int = 2, max_functions: int = 7) -> Program:
+        self.callable = []
+        names: List[str] = []
+        count = self.rng.randint(min_functions, max_functions)
+        while len(names) < count:
+            candidate = self.name(_FUNCTION_PARTS)
+            if candidate not in names:
+                names.append(candidate)
+        return Program(tuple(self.function(name) for name in names))
+
+
+# -- mutations ----------------------------------------------------------------
+
+
+def _stmt_names(stmt: Stmt) -> set[str]:
+    if isinstance(stmt, Assign):
+        return {stmt.target, *_IDENTIFIER.findall(stmt.expr)}
+    if isinstance(stmt, Return):
+        return set(_IDENTIFIER.findall(stmt.expr))
+    if isinstance(stmt, If):
+        return set(_IDENTIFIER.findall(stmt.cond)).union(*(_stmt_names(item) for item in stmt.body + stmt.orelse))
+    if isinstance(stmt, While):
+        return set(_IDENTIFIER.findall(stmt.cond)).union(*(_stmt_names(item) for item in stmt.body))
+    return {stmt.var, stmt.bound}.union(*(_stmt_names(item) for item in stmt.body))
+
+
+def _rename_text(text: str, mapping: Dict[str, str]) -> str:
+    return _IDENTIFIER.sub(lambda match: mapping.get(match.group(0), match.group(0)), text)
+
+
+def _rename_stmt(stmt: Stmt, mapping: Dict[str, str]) -> Stmt:
+    if isinstance(stmt, Assign):
+        return Assign(mapping.get(stmt.target, stmt.target), _rename_text(stmt.expr, mapping), stmt.op)
+    if isinstance(stmt, Return):
+        return Return(_rename_text(stmt.expr, mapping))
+    if isinstance(stmt, If):
+        return If(
+            _rename_text(stmt.cond, mapping),
+            tuple(_rename_stmt(item, mapping) for item in stmt.body),
+            tuple(_rename_stmt(item, mapping) for item in stmt.orelse),
+        )
+    if isinstance(stmt, While):
+        return While(_rename_text(stmt.cond, mapping), tuple(_rename_stmt(item, mapping) for item in stmt.body))
+    return For(
+        mapping.get(stmt.var, stmt.var),
+        mapping.get(stmt.bound, stmt.bound),
+        tuple(_rename_stmt(item, mapping) for item in stmt.body),
+    )
+
+
+def rename(program: Program, rng: random.Random) -> Program:
+    """Consistently rename every function, parameter and local variable."""
+    functions_renamed = {function.name: f"{function.name}_{rng.randint(1, 99)}" for function in program.functions}
+    functions = []
+    for function in program.functions:
+        names = set(function.params).union(*(_stmt_names(stmt) for stmt in function.body))
+        mapping = {
+            name: f"{name}_{rng.choice(('v', 'tmp', 'my', 'new'))}{rng.randint(1, 99)}"
+            for name in sorted(names - set(functions_renamed))
+        }
+        mapping.update(functions_renamed)
+        functions.append(
+            Function(
+                functions_renamed[function.name],
+                tuple(mapping.get(param, param) for param in function.params),
+                tuple(_rename_stmt(stmt, mapping) for stmt in function.body),
+            )
+        )
+    return Program(tuple(functions))
+
+
+def reorder(program: Program, rng: random.Random) -> Program:
+    """Shuffle the function order and swap adjacent independent assignments."""
+    functions = []
+    for function in program.functions:
+        body = list(function.body)
+        for index in range(len(body) - 2):
+            first, second = body[index], body[index + 1]
+            if (
+                isinstance(first, Assign)
+                and isinstance(second, Assign)
+                and first.target not in _stmt_names(second)
+                and second.target not in _stmt_names(first)
+                and rng.random() < 0.7
+            ):
+                body[index], body[index + 1] = second, first
+        functions.append(replace(function, body=tuple(body)))
+    rng.shuffle(functions)
+    return Program(tuple(functions))
+
+
+def insert_dead_code(program: Program, rng: random.Random) -> Program:
+    """Add unreachable branches, unused assignments and one unused helper."""
+    functions = []
+    for function in program.functions:
+        body = list(function.body[:-1])
+        anchor = function.params[0]
+        for _ in range(rng.randint(1, 3)):
+            dead: Stmt
+            if rng.random() < 0.5:
+                dead = If(f"{anchor} != {anchor}", (Assign("unused_flag", f"{anchor} + 1"),))
+            else:
+                dead = Assign(f"unused_{rng.randint(1, 999)}", f"{anchor} * {rng.randint(2, 9)}")
+            body.insert(rng.randint(0, len(body)), dead)
+        functions.append(replace(function, body=tuple(body) + function.body[-1:]))
+    writer = _ProgramWriter(rng)
+    functions.insert(rng.randint(0, len(functions)), writer.function(f"helper_{rng.randint(1, 999)}"))
+    return Program(tuple(functions))
+
+
+def partial_copy(program: Program, rng: random.Random, own: Program) -> Program:
+    """Keep part of the copied functions and fill up with the student's own."""
+    keep = max(1, int(len(program.functions) * rng.uniform(0.4, 0.7)))
+    copied = rng.sample(program.functions, keep)
+    return Program(tuple(copied) + own.functions[: max(1, len(own.functions) - keep)])
+
+
+# -- rendering ----------------------------------------------------------------
+
+
+def _locals(function: Function) -> List[str]:
+    found: List[str] = []
+
+    def visit(stmts: Sequence[Stmt], loop_vars: set[str]) -> None:
+        for stmt in stmts:
+            if isinstance(stmt, Assign) and stmt.target not in function.params and stmt.target not in found:
+                if stmt.target not in loop_vars:
+                    found.append(stmt.target)
+            elif isinstance(stmt, If):
+                visit(stmt.body, loop_vars)
+                visit(stmt.orelse, loop_vars)
+            elif isinstance(stmt, While):
+                visit(stmt.body, loop_vars)
+            elif isinstance(stmt, For):
+                visit(stmt.body, loop_vars | {stmt.var})
+
+    visit(function.body, set())
+    return found
+
+
+def _render_python(program: Program) -> str:
+    def block(stmts: Sequence[Stmt], indent: int) -> List[str]:
+        pad = "    " * indent
+        lines: List[str] = []
+        for stmt in stmts:
+            if isinstance(stmt, Assign):
+                lines.append(f"{pad}{stmt.target} {stmt.op}= {stmt.expr}")
+            elif isinstance(stmt, Return):
+                lines.append(f"{pad}return {stmt.expr}")
+            elif isinstance(stmt, While):
+                lines.append(f"{pad}while {stmt.cond}:")
+                lines.extend(block(stmt.body, indent + 1))
+            elif isinstance(stmt, If):
+                lines.append(f"{pad}if {stmt.cond}:")
+                lines.extend(block(stmt.body, indent + 1))
+                if stmt.orelse:
+                    lines.append(f"{pad}else:")
+                    lines.extend(block(stmt.orelse, indent + 1))
+            else:
+                lines.append(f"{pad}for {stmt.var} in range({stmt.bound}):")
+                lines.extend(block(stmt.body, indent + 1))
+        return lines
+
+    parts = []
+    for function in program.functions:
+        lines = [f"def {function.name}({', '.join(function.params)}):"]
+        lines.extend(block(function.body, 1))
+        parts.append("\n".join(lines))
+    return "\n\n\n".join(parts) + "\n"
+
+
+def _render_braces(program: Program, language: str) -> str:
+    typed = language != "javascript"
+    declare = "int" if typed else "let"
+
+    def block(stmts: Sequence[Stmt], indent: int) -> List[str]:
+        pad = "    " * indent
+        lines: List[str] = []
+        for stmt in stmts:
+            if isinstance(stmt, Assign):
+                lines.append(f"{pad}{stmt.target} {stmt.op}= {stmt.expr};")
+            elif isinstance(stmt, Return):
+                lines.append(f"{pad}return {stmt.expr};")
+            elif isinstance(stmt, While):
+                lines.append(f"{pad}while ({stmt.cond}) {{")
+                lines.extend(block(stmt.body, indent + 1))
+                lines.append(f"{pad}}}")
+            elif isinstance(stmt, If):
+                lines.append(f"{pad}if ({stmt.cond}) {{")
+                lines.extend(block(stmt.body, indent + 1))
+                if stmt.orelse:
+                    lines.append(f"{pad}}} else {{")
+                    lines.extend(block(stmt.orelse, indent + 1))
+                lines.append(f"{pad}}}")
+            else:
+                lines.append(f"{pad}for ({declare} {stmt.var} = 0; {stmt.var} < {stmt.bound}; {stmt.var}++) {{")
+                lines.extend(block(stmt.body, indent + 1))
+                lines.append(f"{pad}}}")
+        return lines
+
+    indent = 1 if language == "java" else 0
+    pad = "    " * indent
+    parts = []
+    for function in program.functions:
+        if language == "java":
+            params = ", ".join(f"int {param}" for param in function.params)
+            header = f"{pad}static int {function.name}({params}) {{"
+        elif typed:
+            params = ", ".join(f"int {param}" for param in function.params)
+            header = f"{pad}int {function.name}({params}) {{"
+        else:
+            header = f"{pad}function {function.name}({', '.join(function.params)}) {{"
+        lines = [header]
+        local_names = _locals(function)
+        if local_names:
+            lines.append(f"{pad}    {declare} {', '.join(f'{name} = 0' for name in local_names)};")
+        lines.extend(block(function.body, indent + 1))
+        lines.append(f"{pad}}}")
+        parts.append("\n".join(lines))
+    body = "\n\n".join(parts)
+    if language == "java":
+        return f"public class Solution {{\n{body}\n}}\n"
+    if language == "cpp":
+        return f"#include <vector>\n\n{body}\n"
+    return body + "\n"
+
+
+def render(program: Program, language: str) -> str:
+    if language == "python":
+        return _render_python(program)
+    return _render_braces(program, language)
+
+
+# -- cohorts ------------------------------------------------------------------
+
+
+def generate_cohort(
+    language: str,
+    size: int,
+    *,
+    seed: int = 0,
+    copy_ratio: float = 0.3,
+    mutations: Optional[Sequence[str]] = None,
+) -> Cohort:
+    """
+    Build `size` single-file submissions in `language`. About `copy_ratio`
+    of them copy an original submission with one to three of `mutations`
+    applied (all four by default). The same arguments give the same cohort.
+    """
+    if language not in EXTENSIONS:
+        raise ValueError(f"unsupported language: {language}")
+    allowed = tuple(mutations or MUTATIONS)
+    rng = random.Random(f"{seed}-{language}-{size}")
+    writer = _ProgramWriter(rng)
+    cohort = Cohort(language=language, seed=seed)
+    originals: List[Tuple[str, Program]] = []
+
+    for index in range(size):
+        student = f"student_{index:05d}"
+        file_id = f"{language}-{index:05d}"
+        program = writer.program()
+        if originals and rng.random() < copy_ratio:
+            source_id, source = rng.choice(originals)
+            applied = tuple(sorted(rng.sample(allowed, rng.randint(1, min(3, len(allowed))))))
+            program = source
+            # partial copy first so the other mutations also touch the student's own code
+            if "partial_copy" in applied:
+                program = partial_copy(program, rng, writer.program())
+            if "reorder" in applied:
+                program = reorder(program, rng)
+            if "dead_code" in applied:
+                program = insert_dead_code(program, rng)
+            if "rename" in applied:
+                program = rename(program, rng)
+            cohort.plagiarised.append(PlagiarisedPair(source_id, file_id, applied))
+        else:
+            originals.append((file_id, program))
+
+        cohort.files.append(
+            CohortFile(
+                file_id=file_id,
+                path=f"{student}/main.{EXTENSIONS[language]}",
+                language=language,
+                content=render(program, language).encode("utf-8"),
+                student=student,
+            )
+        )
+    return cohort
@@ -0,0 +1,413 @@
+"""
+API load test for the results pages.
+
+    python -m benchmarks.loadtest --instructors 5,20,50 --duration 30
+
+Seeds a database with one finished synthetic run, starts a single uvicorn
+instance against it and replays what the frontend does, for each number of
+concurrent instructors in turn:
+
+- JobProgress: GET /api/runs/{id} every 2 seconds (--polls times)
+- AnalysisResults: /results and /results/histogram together
+- SideBySideComparison, for --pairs-per-visit pairs: the pair's /evidence
+  and both /api/files/{id} together, then a pause to read them
+- now and then (--pdf-share of visits) /export-pdf
+
+and reports p50/p95/p99 latency and throughput per endpoint as JSON.
+
+The database is a throwaway SQLite file unless --database-url is given
+(Postgres: the tables are created if missing). --base-url with --run-id
+skips seeding and the local server and loads an already running backend.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import combinations
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from benchmarks.cohort import generate_cohort
+from benchmarks.sqlite import configure_sqlite
+
+
+STATUS_POLL_SECONDS = 2.0  # JobProgress.tsx polling interval
+
+
+def configure_database(database_url: Optional[str], workdir: str) -> str:
+    # must run before anything under `app` is imported
+    if database_url and not database_url.startswith("sqlite"):
+        os.environ["DATABASE_URL"] = database_url
+        return database_url
+    path = database_url.split("///", 1)[1] if database_url else os.path.join(workdir, "loadtest.db")
+    configure_sqlite(path)
+    return f"sqlite:///{path}"
+
+
+# -- seeding ------------------------------------------------------------------
+
+
+def seed_synthetic_run(
+    *,
+    language: str,
+    files: int,
+    pairs: int,
+    evidence_per_pair: int,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Store a finished run with `pairs` pair results (each with
+    `evidence_per_pair` evidence rows) over a synthetic cohort, without
+    running the pipeline. Returns the ids the load test requests.
+    """
+    from app.core.db import Base, SessionLocal, engine
+    from app.models.models import File, MatchEvidence, PairResult, Run, RunScoreBin, Submission
+    from app.pipeline.histogram import empty_bins, histogram_rows, score_bin
+    from app.pipeline.persist import bulk_insert
+    from benchmarks.run import seed_run
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    cohort = generate_cohort(language, files, seed=seed)
+    db = SessionLocal()
+    try:
+        run_id = seed_run(db, cohort)
+        run = db.query(Run).filter(Run.id == uuid.UUID(run_id)).one()
+        file_rows = (
+            db.query(File.id, File.size_bytes)
+            .join(Submission, Submission.id == File.submission_id)
+            .filter(Submission.dataset_id == run.dataset_id)
+            .all()
+        )
+        sizes = {file_id: size for file_id, size in file_rows}
+        all_pairs = list(combinations(sorted(sizes, key=str), 2))
+        chosen = rng.sample(all_pairs, min(pairs, len(all_pairs)))
+
+        results = []
+        for file_a, file_b in chosen:
+            ast_score = round(rng.betavariate(2, 5), 6)
+            results.append(
+                {
+                    "id": uuid.uuid4(),
+                    "run_id": run.id,
+                    "file_a_id": file_a,
+                    "file_b_id": file_b,
+                    "final_score": ast_score,
+                    "fingerprint_score": round(min(1.0, ast_score + rng.random() * 0.2), 6),
+                    "ast_score": ast_score,
+                }
+            )
+        bulk_insert(db, PairResult, results)
+
+        def evidence_rows():
+            for result in results:
+                size_a, size_b = sizes[result["file_a_id"]], sizes[result["file_b_id"]]
+                for index in range(evidence_per_pair):
+                    a_start, b_start = rng.randrange(max(1, size_a - 40)), rng.randrange(max(1, size_b - 40))
+                    length = rng.randrange(8, 40)
+                    yield {
+                        "run_id": run.id,
+                        "file_a_id": result["file_a_id"],
+                        "file_b_id": result["file_b_id"],
+                        "a_start": a_start,
+                        "a_end": min(size_a, a_start + length),
+                        "b_start": b_start,
+                        "b_end": min(size_b, b_start + length),
+                        "kind": "AST" if index % 2 else "TOKEN",
+                        "weight": round(rng.random(), 4),
+                    }
+
+        bulk_insert(db, MatchEvidence, evidence_rows())
+        counts = empty_bins()
+        for result in results:
+            counts[score_bin(result["final_score"])] += 1
+        bulk_insert(db, RunScoreBin, histogram_rows(run.id, counts, counts))
+
+        run.status, run.stage, run.progress_pct = "DONE", "REPORT", 100
+        db.commit()
+        return {
+            "run_id": run_id,
+            "pairs": [(str(item["id"]), str(item["file_a_id"]), str(item["file_b_id"])) for item in results],
+        }
+    finally:
+        db.close()
+
+
+def load_run_targets(base_url: str, run_id: str) -> Dict[str, Any]:
+    """Pair ids for an existing run, read through the api like the results page does."""
+    client = Client(base_url)
+    status, body = client.get(f"/api/runs/{run_id}/results")
+    if status != 200:
+        raise SystemExit(f"GET /api/runs/{run_id}/results returned {status}")
+    rows = json.loads(body)
+    return {"run_id": run_id, "pairs": [(row["id"], row["file_a_id"], row["file_b_id"]) for row in rows]}
+
+
+# -- server -------------------------------------------------------------------
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url: str, port: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.loadtest", "--serve", "--database-url", database_url, "--port", str(port)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    client = Client(f"http://127.0.0.1:{port}")
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("api server exited during startup")
+        try:
+            if client.get("/api/health")[0] == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("api server did not start within 30s")
+
+
+def serve(database_url: str, port: int) -> None:
+    import uvicorn
+
+    configure_database(database_url, tempfile.gettempdir())
+    uvicorn.run("app.main:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+# -- load ---------------------------------------------------------------------
+
+
+class Client:
+    """One keep-alive connection per thread, like a browser tab."""
+
+    def __init__(self, base_url: str):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._local = threading.local()
+
+    def get(self, path: str) -> tuple[int, bytes]:
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                # the server closed an idle keep-alive connection
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+        raise AssertionError("unreachable")
+
+
+@dataclass
+class Recorder:
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def timed_get(self, client: Client, endpoint: str, path: str) -> None:
+        started = time.perf_counter()
+        try:
+            status, _ = client.get(path)
+        except OSError:
+            status = 0
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if status != 200:
+                self.errors[endpoint] += 1
+
+
+@dataclass
+class Workload:
+    run_id: str
+    pairs: List[tuple[str, str, str]]
+    polls: int = 3
+    pairs_per_visit: int = 3
+    think_seconds: float = 3.0
+    pdf_share: float = 0.1
+
+
+def instructor(client: Client, pool: ThreadPoolExecutor, recorder: Recorder, work: Workload, deadline: float, rng: random.Random) -> None:
+    """One instructor waiting on a run, reading the results and opening a few pairs, on repeat."""
+    run = f"/api/runs/{work.run_id}"
+
+    def pause(seconds: float) -> bool:
+        time.sleep(max(0.0, min(seconds, deadline - time.monotonic())))
+        return time.monotonic() < deadline
+
+    def together(*requests: tuple[str, str]) -> None:
+        for future in [pool.submit(recorder.timed_get, client, endpoint, path) for endpoint, path in requests]:
+            future.result()
+
+    while time.monotonic() < deadline:
+        for _ in range(work.polls):
+            recorder.timed_get(client, "run", run)
+            if not pause(STATUS_POLL_SECONDS):
+                return
+        together(("results", f"{run}/results"), ("histogram", f"{run}/results/histogram"))
+        for pair_id, file_a, file_b in rng.sample(work.pairs, min(work.pairs_per_visit, len(work.pairs))):
+            if not pause(rng.uniform(0.5, 1.5) * work.think_seconds):
+                return
+            together(
+                ("evidence", f"{run}/results/{pair_id}/evidence"),
+                ("file", f"/api/files/{file_a}"),
+                ("file", f"/api/files/{file_b}"),
+            )
+        if rng.random() < work.pdf_share:
+            recorder.timed_get(client, "export_pdf", f"{run}/export-pdf")
+        if not pause(rng.uniform(0.5, 1.5) * work.think_seconds):
+            return
+
+
+def summarize(recorder: Recorder, seconds: float) -> Dict[str, Any]:
+    def stats(values: List[float], errors: int) -> Dict[str, Any]:
+        latencies = np.array(values) * 1000
+        return {
+            "requests": len(values),
+            "errors": errors,
+            "per_sec": round(len(values) / seconds, 2),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+            "max_ms": round(float(latencies.max()), 1),
+        }
+
+    endpoints = {name: stats(values, recorder.errors[name]) for name, values in sorted(recorder.latencies.items()) if values}
+    everything = [value for values in recorder.latencies.values() for value in values]
+    return {
+        "endpoints": endpoints,
+        "total": stats(everything, sum(recorder.errors.values())) if everything else None,
+    }
+
+
+def run_level(base_url: str, work: Workload, instructors: int, duration: float, seed: int) -> Dict[str, Any]:
+    client, recorder = Client(base_url), Recorder()
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    # each instructor fans out to at most three parallel requests (evidence + two files)
+    with ThreadPoolExecutor(max_workers=instructors * 3) as pool, ThreadPoolExecutor(max_workers=instructors) as users:
+        futures = [
+            users.submit(instructor, client, pool, recorder, work, deadline, random.Random(seed * 7919 + index))
+            for index in range(instructors)
+        ]
+        for future in futures:
+            future.result()
+    return {"instructors": instructors, **summarize(recorder, time.perf_counter() - started)}
+
+
+def format_table(levels: List[Dict[str, Any]]) -> str:
+    lines = [["instructors", "endpoint", "requests", "errors", "per_sec", "p50_ms", "p95_ms", "p99_ms"]]
+    for level in levels:
+        rows = list(level["endpoints"].items()) + ([("total", level["total"])] if level["total"] else [])
+        for name, stats in rows:
+            lines.append([str(level["instructors"]), name] + [str(stats[key]) for key in lines[0][2:]])
+    widths = [max(len(line[column]) for line in lines) for column in range(len(lines[0]))]
+    return "\n".join("  ".join(value.ljust(width) for value, width in zip(line, widths)) for line in lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instructors", default="5,20", help="comma separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per level")
+    parser.add_argument("--database-url", help="seed this database instead of a throwaway SQLite file")
+    parser.add_argument("--base-url", help="load an already running backend (needs --run-id)")
+    parser.add_argument("--run-id")
+    parser.add_argument("--language", default="python")
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--pairs", type=int, default=5000)
+    parser.add_argument("--evidence-per-pair", type=int, default=20)
+    parser.add_argument("--polls", type=int, default=3, help="status polls before each results visit")
+    parser.add_argument("--pairs-per-visit", type=int, default=3)
+    parser.add_argument("--think", type=float, default=3.0, help="mean seconds spent reading a pair")
+    parser.add_argument("--pdf-share", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="also write the report as JSON here")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.database_url, args.port)
+        return 0
+
+    server = None
+    if args.base_url:
+        if not args.run_id:
+            parser.error("--base-url needs --run-id")
+        base_url, targets = args.base_url.rstrip("/"), load_run_targets(args.base_url.rstrip("/"), args.run_id)
+    else:
+        database_url = configure_database(args.database_url, tempfile.mkdtemp(prefix="plagiarism-load-"))
+        started = time.perf_counter()
+        targets = seed_synthetic_run(
+            language=args.language,
+            files=args.files,
+            pairs=args.pairs,
+            evidence_per_pair=args.evidence_per_pair,
+            seed=args.seed,
+        )
+        print(f"seeded {len(targets['pairs'])} pairs in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        port = free_port()
+        server = start_server(database_url, port)
+        base_url = f"http://127.0.0.1:{port}"
+
+    if not targets["pairs"]:
+        raise SystemExit("the run has no result pairs to open")
+    work = Workload(
+        run_id=targets["run_id"],
+        pairs=targets["pairs"],
+        polls=args.polls,
+        pairs_per_visit=args.pairs_per_visit,
+        think_seconds=args.think,
+        pdf_share=args.pdf_share,
+    )
+    levels = []
+    try:
+        for instructors in (int(value) for value in args.instructors.split(",") if value.strip()):
+            print(f"{instructors} instructors for {args.duration:g}s", file=sys.stderr)
+            levels.append(run_level(base_url, work, instructors, args.duration, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(format_table(levels))
+    if args.out:
+        report = {
+            "run_id": work.run_id,
+            "pairs": len(work.pairs),
+            "duration_seconds": args.duration,
+            "workload": {key: getattr(work, key) for key in ("polls", "pairs_per_visit", "think_seconds", "pdf_share")},
+            "levels": levels,
+        }
+        with open(args.out, "w", encoding="utf-8") as handle:
+            handle.write(json.dumps(report, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
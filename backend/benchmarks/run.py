@@ -0,0 +1,223 @@
+"""
+Pipeline throughput benchmarks.
+
+    python -m benchmarks.run --languages python,java --sizes 100,1000 --out bench.json
+
+For every language and cohort size a synthetic cohort (benchmarks.cohort)
+is timed through each stage on its own and through the full
+`run_pipeline` on a throwaway SQLite database. Results are printed (or
+written to --out) as JSON. Steps slower than benchmarks/budgets.json allows
+are listed under "budget_failures" and make the command exit with status 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from benchmarks.cohort import LANGUAGES, Cohort, generate_cohort
+from benchmarks.sqlite import configure_sqlite
+
+
+STEPS = ("prepare_tokens", "prepare_ast", "compare_tokens", "compare_ast", "pipeline")
+DEFAULT_BUDGETS = os.path.join(os.path.dirname(__file__), "budgets.json")
+
+
+def max_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+@contextmanager
+def measure(result: Dict[str, Any], trace_memory: bool) -> Iterator[None]:
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        result["seconds"] = round(time.perf_counter() - started, 4)
+        if trace_memory:
+            result["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            tracemalloc.stop()
+        result["max_rss_mb"] = max_rss_mb()
+        result["children_max_rss_mb"] = max_rss_mb(resource.RUSAGE_CHILDREN)
+
+
+def seed_run(db, cohort: Cohort) -> str:
+    """Store the cohort as one dataset and return a new run id."""
+    from app.models.models import Collection, Dataset, File, Run, Submission
+    from app.pipeline.persist import bulk_insert
+
+    collection = Collection(name="benchmark", owner_id=uuid.uuid4())
+    db.add(collection)
+    db.flush()
+    dataset = Dataset(collection_id=collection.id, name=f"{cohort.language}-{len(cohort.files)}")
+    db.add(dataset)
+    db.flush()
+    submissions = {item.student: uuid.uuid4() for item in cohort.files}
+    db.commit()
+    bulk_insert(
+        db,
+        Submission,
+        ({"id": submission_id, "dataset_id": dataset.id, "student_label": student} for student, submission_id in submissions.items()),
+    )
+    bulk_insert(
+        db,
+        File,
+        (
+            {
+                "submission_id": submissions[item.student],
+                "path": item.path,
+                "language": item.language,
+                "size_bytes": len(item.content),
+                "content_hash": item.file_id,
+                "storage_key": item.path,
+                "content": item.content,
+            }
+            for item in cohort.files
+        ),
+    )
+    run = Run(dataset_id=dataset.id, status="SCHEDULED", stage="INGEST", progress_pct=0, config_json={})
+    db.add(run)
+    db.commit()
+    return str(run.id)
+
+
+def bench_cohort(cohort: Cohort, steps: List[str], trace_memory: bool) -> List[Dict[str, Any]]:
+    from app.core.db import Base, SessionLocal, engine
+    from app.pipeline.ast.run_stage import compare_prepared_files, prepare_ast_file
+    from app.pipeline.token.run_stage import compare_prepared_token_files, prepare_token_file
+
+    results: List[Dict[str, Any]] = []
+    token_files: list = []
+    ast_files: list = []
+
+    def step(name: str, items: int, work: Callable[[], Any]) -> None:
+        if name not in steps:
+            return
+        result: Dict[str, Any] = {"language": cohort.language, "files": len(cohort.files), "step": name}
+        with measure(result, trace_memory):
+            work()
+        result["items"] = items
+        result["items_per_sec"] = round(items / result["seconds"], 1) if result["seconds"] else None
+        results.append(result)
+        print(f"{cohort.language:>10} {len(cohort.files):>6} {name:<15} {result['seconds']:>9.3f}s", file=sys.stderr)
+
+    def prepare_tokens() -> None:
+        for item in cohort.files:
+            prepared = prepare_token_file(file_id=item.file_id, path=item.path, content=item.content, language=item.language)
+            if prepared is not None:
+                token_files.append(prepared.compact())
+
+    def prepare_ast() -> None:
+        for item in cohort.files:
+            prepared = prepare_ast_file(file_id=item.file_id, path=item.path, content=item.content, language=item.language)
+            if prepared is not None:
+                ast_files.append(prepared.compact())
+
+    pair_count = len(cohort.files) * (len(cohort.files) - 1) // 2
+    needs_tokens = {"prepare_tokens", "compare_tokens"} & set(steps)
+    needs_ast = {"prepare_ast", "compare_ast"} & set(steps)
+    # compare steps need prepared files even when their prepare step is not reported
+    if needs_tokens:
+        step("prepare_tokens", len(cohort.files), prepare_tokens) if "prepare_tokens" in steps else prepare_tokens()
+    if needs_ast:
+        step("prepare_ast", len(cohort.files), prepare_ast) if "prepare_ast" in steps else prepare_ast()
+    # scored like the pipeline: evidence is only built later, for stored pairs
+    step("compare_tokens", pair_count, lambda: compare_prepared_token_files(token_files, evidence=False))
+    step("compare_ast", pair_count, lambda: compare_prepared_files(ast_files, n=3, evidence=False))
+    token_files.clear()
+    ast_files.clear()
+
+    if "pipeline" in steps:
+        from app.tasks import run_pipeline
+
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        db = SessionLocal()
+        try:
+            run_id = seed_run(db, cohort)
+        finally:
+            db.close()
+        step("pipeline", len(cohort.files), lambda: run_pipeline.run(run_id))
+    return results
+
+
+def load_budgets(path: Optional[str]) -> Dict[str, Any]:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def budget_failures(results: List[Dict[str, Any]], budgets: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Steps slower than their budget; budgets are {language: {size: {step: max_seconds}}}."""
+    failures = []
+    for result in results:
+        limit = budgets.get(result["language"], {}).get(str(result["files"]), {}).get(result["step"])
+        if limit is not None and result["seconds"] > limit:
+            failures.append({**result, "budget_seconds": limit})
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--languages", default=",".join(LANGUAGES))
+    parser.add_argument("--sizes", default="100", help="comma separated cohort sizes, e.g. 100,1000,5000")
+    parser.add_argument("--steps", default=",".join(STEPS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budgets", default=DEFAULT_BUDGETS, help="budget file; pass '' to skip the checks")
+    parser.add_argument("--trace-memory", action="store_true", help="record tracemalloc peaks (slows every step)")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="plagiarism-bench-")
+    configure_sqlite(os.path.join(workdir, "bench.db"))
+
+    steps = [name.strip() for name in args.steps.split(",") if name.strip()]
+    results: List[Dict[str, Any]] = []
+    for language in (name.strip() for name in args.languages.split(",") if name.strip()):
+        for size in (int(value) for value in args.sizes.split(",") if value.strip()):
+            cohort = generate_cohort(language, size, seed=args.seed)
+            results.extend(bench_cohort(cohort, steps, args.trace_memory))
+
+    failures = budget_failures(results, load_budgets(args.budgets))
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "results": results,
+        "budget_failures": failures,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+    else:
+        print(text)
+    for failure in failures:
+        print(
+            f"over budget: {failure['language']} {failure['files']} {failure['step']} "
+            f"{failure['seconds']}s > {failure['budget_seconds']}s",
+            file=sys.stderr,
+        )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Point the app at a local SQLite file so `run_pipeline` can be benchmarked
+without Postgres or Redis.
+
+Must be called before anything under `app` is imported: the engine is built
+from DATABASE_URL at import time.
+"""
+
+from __future__ import annotations
+
+import os
+import uuid
+
+
+def configure_sqlite(path: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["USE_REDIS"] = "0"
+    os.environ["ANALYSIS_STAGE_DELAY_SECONDS"] = "0"
+    install_sqlite_types()
+
+
+_installed = False
+
+
+def install_sqlite_types() -> None:
+    """Let the Postgres column types of the models run on SQLite (also used by the tests)."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    from sqlalchemy.dialects.postgresql import JSONB, UUID
+    from sqlalchemy.ext.compiler import compiles
+    from sqlalchemy.sql import sqltypes
+
+    # the models use Postgres JSONB; SQLite stores the same values as JSON
+    @compiles(JSONB, "sqlite")
+    def _compile_jsonb(_type, _compiler, **_kw):
+        return "JSON"
+
+    # a UUID column would get NUMERIC affinity, turning hex ids made only of
+    # digits (or digits around an "e") into numbers; CHAR keeps them text
+    @compiles(UUID, "sqlite")
+    def _compile_uuid(_type, _compiler, **_kw):
+        return "CHAR(32)"
+
+    # the pipeline passes run ids as strings, which Postgres casts itself
+    bind_processor = sqltypes.Uuid.bind_processor
+
+    def _uuid_bind_processor(self, dialect):
+        process = bind_processor(self, dialect)
+        if process is None:
+            return None
+        return lambda value: process(uuid.UUID(value) if isinstance(value, str) else value)
+
+    sqltypes.Uuid.bind_processor = _uuid_bind_processor
@@ -0,0 +1,6 @@
+# sourced by start.sh and worker.sh: every process that wrote to this
+# container's prometheus directory is gone, so start it empty
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
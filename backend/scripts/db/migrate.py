@@ -0,0 +1,35 @@
+# about migrate.py file:
+# brings the database schema up to date with the alembic migrations (backend/alembic).
+# start.sh runs it before the api starts.
+# databases made by create_tables.py before there were migrations have the
+# baseline tables but no alembic_version; they are stamped at the baseline first.
+
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from app.core.db import engine
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "..", "alembic.ini")
+BASELINE_REVISION = "6c1f0e2a9b41"
+
+
+def migrate(bind=engine) -> None:
+    config = Config(ALEMBIC_INI)
+    with bind.begin() as connection:
+        config.attributes["connection"] = connection
+        tables = set(inspect(connection).get_table_names())
+        if "alembic_version" not in tables and "runs" in tables:
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, "head")
+
+
+def main():
+    migrate()
+    print("Database schema is up to date.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,5 +3,6 @@ set -e
 
 export PYTHONPATH=/app:$PYTHONPATH
 cd /app
-python scripts/db/create_tables.py
+. ./metrics_dir.sh
+python scripts/db/migrate.py
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000
@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from benchmarks.sqlite import install_sqlite_types
+
+
+@pytest.fixture
+def session_factory():
+    """Sessions on a private in-memory SQLite database with every table created."""
+    install_sqlite_types()
+    from app.core.db import Base
+    import app.models.models  # noqa: F401  (registers the tables)
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def pipeline(session_factory, monkeypatch):
+    """Run Celery tasks in-process against the test database."""
+    from app import tasks
+    from app.celery import celery_app
+
+    # tasks open their own sessions
+    monkeypatch.setattr(tasks, "open_db", session_factory)
+    monkeypatch.setattr(tasks, "ANALYSIS_STAGE_DELAY_SECONDS", 0)
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    return session_factory
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    """Run ids the scheduler starts; nothing is actually run."""
+    from app import scheduler
+
+    started = []
+    monkeypatch.setattr(scheduler, "dispatch_run", lambda run_id, priority=scheduler.PRIORITY_BATCH: started.append(run_id))
+    return started
+
+
+@pytest.fixture
+def api(session_factory, dispatched):
+    from fastapi.testclient import TestClient
+
+    from app.core.db import get_db
+    from app.main import app
+
+    def override_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = override_db
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_db, None)
@@ -0,0 +1,69 @@
+from app.pipeline.ast.clones import EuclideanLSH, SubtreeVector, characteristic_vectors, vector_similarity
+from app.pipeline.ast.run_stage import find_prepared_clones, prepare_ast_file
+
+
+BASE = (
+    "def process(records):\n"
+    "    result = []\n"
+    "    for record in records:\n"
+    "        if record.active and record.score > 10:\n"
+    "            name = record.name.strip().lower()\n"
+    "            result.append((name, record.score * 2))\n"
+    "        else:\n"
+    "            result.append((None, 0))\n"
+    "    return result\n"
+)
+
+# renamed, one statement inserted
+NEAR_MISS = (
+    "def handle(rows):\n"
+    "    out = []\n"
+    "    for row in rows:\n"
+    "        if row.active and row.score > 10:\n"
+    "            label = row.name.strip().lower()\n"
+    "            print(label)\n"
+    "            out.append((label, row.score * 2))\n"
+    "        else:\n"
+    "            out.append((None, 0))\n"
+    "    return out\n"
+)
+
+UNRELATED = (
+    "class Matrix:\n"
+    "    def __init__(self, n):\n"
+    "        self.cells = [[0] * n for _ in range(n)]\n"
+    "    def trace(self):\n"
+    "        return sum(self.cells[i][i] for i in range(len(self.cells)))\n"
+)
+
+
+def test_characteristic_vectors_cover_statement_subtrees():
+    prepared = prepare_ast_file(file_id="a", path="a.py", content=BASE.encode("utf-8"))
+    vectors = characteristic_vectors(prepared.handoff, min_nodes=5)
+
+    assert vectors
+    assert all(vector.label.startswith("STMT_") for vector in vectors)
+    assert all(vector.size >= 5 for vector in vectors)
+    assert all(not label.startswith("IDENT_") for vector in vectors for label, _ in vector.counts)
+
+
+def test_lsh_signatures_are_reproducible_and_identical_vectors_collide():
+    vector = SubtreeVector(label="STMT_IF", start_byte=0, end_byte=10, size=6, counts=(("IDENT", 4), ("STMT_IF", 2)))
+    assert EuclideanLSH().signature(vector) == EuclideanLSH().signature(vector)
+    assert vector_similarity(vector, vector) == 1.0
+
+
+def test_near_miss_clone_is_found_and_mapped_to_byte_spans():
+    files = [
+        prepare_ast_file(file_id="a", path="a.py", content=BASE.encode("utf-8")),
+        prepare_ast_file(file_id="b", path="b.py", content=NEAR_MISS.encode("utf-8")),
+        prepare_ast_file(file_id="c", path="c.py", content=UNRELATED.encode("utf-8")),
+    ]
+
+    clones = find_prepared_clones(files)
+
+    assert clones
+    assert {(clone["file_a_id"], clone["file_b_id"]) for clone in clones} == {("a", "b")}
+    top = clones[0]
+    assert BASE.encode("utf-8")[top["a_start"] : top["a_end"]].startswith(b"def process")
+    assert NEAR_MISS.encode("utf-8")[top["b_start"] : top["b_end"]].startswith(b"def handle")
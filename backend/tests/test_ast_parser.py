@@ -1,6 +1,6 @@
 import pytest
 
-from app.pipeline.ast.parser import parse_and_collect
+from app.pipeline.ast.parser import ParseBudgetExceeded, parse_and_collect
 
 def assert_spans_valid(code: str, nodes):
     encoded_len = len(code.encode("utf-8"))
@@ -380,3 +380,36 @@ def test_feature_handoff_is_stable_across_renamed_python_submissions():
     )
 
     assert a["feature_handoff"]["feature_tokens"] == b["feature_handoff"]["feature_tokens"]
+
+def test_parse_budget_rejects_oversized_source():
+    code = "x = 1\n" * 100
+    with pytest.raises(ParseBudgetExceeded) as exc_info:
+        parse_and_collect(code, "python", max_source_bytes=64)
+    assert exc_info.value.budget == "bytes"
+    assert exc_info.value.observed == len(code.encode("utf-8"))
+
+def test_node_budget_reports_truncation_and_can_be_enforced():
+    code = "x = 1\n" * 50
+    result = parse_and_collect(code, "python", max_nodes=20)
+    assert result["truncated"] is True
+    assert result["node_count"] == 20
+    assert parse_and_collect(code, "python")["truncated"] is False
+
+    with pytest.raises(ParseBudgetExceeded) as exc_info:
+        parse_and_collect(code, "python", max_nodes=20, enforce_node_budget=True)
+    assert exc_info.value.budget == "nodes"
+
+def test_file_with_exactly_max_nodes_is_not_truncated():
+    code = "x = 1\n" * 5
+    node_count = parse_and_collect(code, "python")["node_count"]
+
+    result = parse_and_collect(code, "python", max_nodes=node_count, enforce_node_budget=True)
+    assert result["truncated"] is False
+    assert result["node_count"] == node_count
+    assert parse_and_collect(code, "python", max_nodes=node_count - 1)["truncated"] is True
+
+def test_parse_timeout_cancels_pathological_input():
+    code = "x = [" + ",".join(str(i) for i in range(200_000)) + "]\n"
+    with pytest.raises(ParseBudgetExceeded) as exc_info:
+        parse_and_collect(code, "python", timeout_micros=1)
+    assert exc_info.value.budget == "time"
@@ -0,0 +1,40 @@
+import numpy as np
+
+from app.pipeline.ast.prefilter import cosine_pairs_above, histogram_matrix, resolve_cosine_floor
+
+
+def test_histogram_matrix_rows_are_unit_length():
+    matrix = histogram_matrix([{"STMT_IF": 3, "STMT_FOR": 4}, {"STMT_RETURN": 2}, {}])
+    norms = np.linalg.norm(matrix, axis=1)
+    assert np.allclose(norms[:2], 1.0)
+    assert norms[2] == 0.0
+
+
+def test_cosine_pairs_above_matches_dense_computation_across_blocks():
+    rng = np.random.default_rng(7)
+    raw = rng.integers(0, 5, size=(9, 6)).astype(np.float64)
+    matrix = raw / np.linalg.norm(raw, axis=1, keepdims=True)
+
+    expected = {
+        (i, j)
+        for i in range(9)
+        for j in range(i + 1, 9)
+        if float(matrix[i] @ matrix[j]) >= 0.8
+    }
+    assert set(cosine_pairs_above(matrix, 0.8, block_rows=4)) == expected
+
+
+def test_identical_histograms_clear_a_floor_of_one():
+    histogram = {"STMT_IF": 3, "STMT_FOR": 7, "STMT_RETURN": 11, "CALL": 13}
+    matrix = histogram_matrix([histogram, dict(histogram), {"STMT_IF": 1}])
+    assert matrix.dtype == np.float64
+    assert cosine_pairs_above(matrix, 1.0) == [(0, 1)]
+
+
+def test_files_without_labelled_nodes_are_never_filtered_out():
+    matrix = histogram_matrix([{"STMT_IF": 1}, {}, {"STMT_FOR": 1}, {}])
+    assert sorted(cosine_pairs_above(matrix, 0.5, block_rows=2)) == [(0, 1), (0, 3), (1, 2), (1, 3), (2, 3)]
+
+
+def test_resolve_cosine_floor_prefers_run_config():
+    assert resolve_cosine_floor({"cosine_floor": 0.7}) == 0.7
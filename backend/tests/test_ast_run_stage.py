@@ -1,8 +1,17 @@
+import pytest
+
+from app.pipeline.ast.parser import ParseBudgetExceeded
 from app.pipeline.ast.run_stage import (
+    ParseBudget,
     compare_prepared_files,
     decode_file_content,
+    deserialize_ast_features,
+    gate_pairs_by_function_matches,
     infer_language_from_path,
+    match_prepared_functions,
+    parse_budget_from_config,
     prepare_ast_file,
+    serialize_ast_features,
 )
 
 
@@ -79,6 +88,15 @@ def test_compare_prepared_files_ranks_similar_python_files_higher():
     assert comparisons[0]["ast_score"] > comparisons[-1]["ast_score"]
     assert len(comparisons[0]["evidence"]) > 0
 
+    compact = [prepared.compact() for prepared in (file_a, file_b, file_c)]
+    assert compact[0].handoff["token_spans"][0] == {
+        key: file_a.handoff["token_spans"][0][key] for key in ("node_type", "start_byte", "end_byte")
+    }
+    for processes in (1, 2):
+        assert compare_prepared_files(compact, n=3, cosine_floor=0.1, processes=processes) == compare_prepared_files(
+            [file_a, file_b, file_c], n=3, cosine_floor=0.1, processes=processes
+        )
+
 
 def test_compare_prepared_files_can_limit_to_candidate_pairs():
     file_a = prepare_ast_file(
@@ -106,3 +124,118 @@ def test_compare_prepared_files_can_limit_to_candidate_pairs():
     assert len(comparisons) == 1
     assert comparisons[0]["file_a_id"] == "file-a"
     assert comparisons[0]["file_b_id"] == "file-b"
+
+
+def test_prepare_ast_file_raises_when_over_parse_budget():
+    content = b"x = 1\n" * 200
+
+    with pytest.raises(ParseBudgetExceeded) as exc_info:
+        prepare_ast_file(
+            file_id="big",
+            path="studentA/big.py",
+            content=content,
+            budget=ParseBudget(max_source_bytes=128),
+        )
+    assert exc_info.value.budget == "bytes"
+
+    with pytest.raises(ParseBudgetExceeded) as exc_info:
+        prepare_ast_file(
+            file_id="big",
+            path="studentA/big.py",
+            content=content,
+            budget=ParseBudget(max_nodes=50),
+        )
+    assert exc_info.value.budget == "nodes"
+
+
+def test_parse_budget_from_config_applies_run_overrides():
+    budget = parse_budget_from_config({"parse_budget": {"timeout_ms": 250, "max_nodes": 1000}})
+    assert budget.timeout_ms == 250
+    assert budget.max_nodes == 1000
+    assert budget.max_source_bytes == ParseBudget().max_source_bytes
+    assert parse_budget_from_config(None) == ParseBudget()
+
+
+def test_function_index_finds_function_copied_into_different_file():
+    shared_a = (
+        "def normalise(values):\n"
+        "    total = 0\n"
+        "    for value in values:\n"
+        "        total += value\n"
+        "    return [value / total for value in values]\n"
+    )
+    shared_b = shared_a.replace("values", "items").replace("total", "acc").replace("value", "v")
+    file_a = prepare_ast_file(
+        file_id="file-a",
+        path="studentA/stats.py",
+        content=(shared_a + "\nclass Report:\n    def render(self):\n        print('report')\n").encode("utf-8"),
+    )
+    file_b = prepare_ast_file(
+        file_id="file-b",
+        path="studentB/main.py",
+        content=("import sys\n\n" + shared_b + "\nwhile True:\n    break\n").encode("utf-8"),
+    )
+    file_c = prepare_ast_file(
+        file_id="file-c",
+        path="studentC/fact.py",
+        content=b"def factorial(n):\n    if n <= 1:\n        return 1\n    return n * factorial(n - 1)\n",
+    )
+
+    assert [unit.name for unit in file_a.functions] == ["normalise", "render"]
+    matches = match_prepared_functions([file_a, file_b, file_c])
+
+    assert len(matches) == 1
+    assert matches[0]["file_a_id"] == "file-a"
+    assert matches[0]["file_b_id"] == "file-b"
+    assert matches[0]["kind"] == "EXACT"
+    assert matches[0]["unit_b"]["name"] == "normalise"
+
+    gated = gate_pairs_by_function_matches(
+        [file_a, file_b, file_c],
+        {("file-a", "file-b"), ("file-a", "file-c"), ("file-b", "file-c")},
+        matches,
+    )
+    assert gated == {("file-a", "file-b")}
+
+
+def test_cosine_prefilter_skips_pairs_below_floor():
+    loop_heavy = prepare_ast_file(
+        file_id="loops",
+        path="studentA/loops.py",
+        content=b"for i in range(3):\n    for j in range(3):\n        while i < j:\n            i += 1\n",
+    )
+    loop_heavy_copy = prepare_ast_file(
+        file_id="loops-copy",
+        path="studentB/loops.py",
+        content=b"for a in range(9):\n    for b in range(9):\n        while a < b:\n            a += 2\n",
+    )
+    class_only = prepare_ast_file(
+        file_id="classes",
+        path="studentC/model.py",
+        content=b"class A:\n    x = 'a'\n\nclass B(A):\n    y = 'b'\n    z = None\n",
+    )
+    prepared = [loop_heavy, loop_heavy_copy, class_only]
+
+    assert len(compare_prepared_files(prepared, n=3)) == 3
+    comparisons = compare_prepared_files(prepared, n=3, cosine_floor=0.95)
+    assert [(item["file_a_id"], item["file_b_id"]) for item in comparisons] == [("loops", "loops-copy")]
+
+
+def test_stored_ast_features_compare_like_freshly_parsed_files():
+    sources = {
+        "file-a": b"def add(a, b):\n    total = a + 1\n    return total + b\n\nprint(add(1, 2))\n",
+        "file-b": b"def plus(x, y):\n    acc = x + 1\n    return acc + y\n\nprint(plus(3, 4))\n",
+    }
+    parsed = [
+        prepare_ast_file(file_id=file_id, path=f"{file_id}.py", content=content).compact()
+        for file_id, content in sources.items()
+    ]
+    stored = [
+        deserialize_ast_features(prepared.file_id, prepared.path, prepared.language, serialize_ast_features(prepared))
+        for prepared in parsed
+    ]
+
+    assert stored[0].handoff["parse_ok"] is True
+    assert [unit.name for unit in stored[0].functions] == ["add"]
+    assert stored[0].functions[0].ngram_hashes == frozenset()
+    assert compare_prepared_files(stored, n=3, processes=1) == compare_prepared_files(parsed, n=3, processes=1)
@@ -0,0 +1,40 @@
+from benchmarks.accuracy import ENGINES, compare_scores, parse_engine_spec, register_engine
+
+
+def test_identical_scores_are_a_perfect_match():
+    exact = {("a", "b"): 0.9, ("a", "c"): 0.5, ("b", "c"): 0.1}
+
+    report = compare_scores(exact, dict(exact), thresholds=[0.2, 0.7], top_k=2)
+
+    assert report["recall"] == {"0.2": 1.0, "0.7": 1.0}
+    assert report["precision"] == {"0.2": 1.0, "0.7": 1.0}
+    assert report["top_k_overlap"] == 1.0
+    assert report["error"]["max"] == 0.0
+
+
+def test_skipped_and_raised_pairs_show_up_in_recall_precision_and_error():
+    exact = {("a", "b"): 0.9, ("a", "c"): 0.5, ("b", "c"): 0.1}
+    # ("a", "c") was skipped (counts as 0); ("b", "c") fell back to a higher score
+    approximate = {("a", "b"): 0.9, ("b", "c"): 0.6}
+
+    report = compare_scores(exact, approximate, thresholds=[0.4], top_k=2, labels={("a", "c")})
+
+    assert report["recall"] == {"0.4": 0.5}
+    assert report["precision"] == {"0.4": 0.5}
+    assert report["label_recall"] == {"0.4": 0.0}
+    assert report["top_k_overlap"] == 0.5
+    assert report["error"]["max"] == 0.5
+    assert report["error"]["changed_share"] == round(2 / 3, 4)
+
+
+def test_engine_specs_resolve_registered_names_before_config_overrides():
+    @register_engine("constant")
+    def constant(prepared):
+        return {("a", "b"): 1.0}
+
+    try:
+        assert parse_engine_spec("constant") is constant
+        assert parse_engine_spec("exact") is ENGINES["exact"]
+        assert callable(parse_engine_spec("function_gate+cosine_floor=0.98"))
+    finally:
+        ENGINES.pop("constant")
@@ -0,0 +1,53 @@
+from statistics import mean
+
+from app.pipeline.ast.run_stage import prepare_ast_file
+from app.pipeline.token.run_stage import compare_prepared_token_files, prepare_token_file
+from benchmarks.cohort import LANGUAGES, generate_cohort
+from benchmarks.run import budget_failures
+
+
+def test_same_seed_generates_the_same_cohort():
+    first = generate_cohort("python", 20, seed=7)
+    second = generate_cohort("python", 20, seed=7)
+    other = generate_cohort("python", 20, seed=8)
+
+    assert [item.content for item in first.files] == [item.content for item in second.files]
+    assert first.label_keys() == second.label_keys()
+    assert [item.content for item in first.files] != [item.content for item in other.files]
+
+
+def test_every_language_parses():
+    for language in LANGUAGES:
+        cohort = generate_cohort(language, 8, seed=1)
+        for item in cohort.files:
+            prepared = prepare_ast_file(file_id=item.file_id, path=item.path, content=item.content, language=item.language)
+            assert prepared is not None and prepared.handoff["parse_ok"], (language, item.path)
+
+
+def test_plagiarised_pairs_score_above_unrelated_pairs():
+    cohort = generate_cohort("java", 30, seed=3)
+    prepared = [
+        prepare_token_file(file_id=item.file_id, path=item.path, content=item.content, language=item.language)
+        for item in cohort.files
+    ]
+    labels = cohort.label_keys()
+    copied, unrelated = [], []
+    for comparison in compare_prepared_token_files(prepared, processes=1):
+        key = tuple(sorted((comparison["file_a_id"], comparison["file_b_id"])))
+        (copied if key in labels else unrelated).append(comparison["fingerprint_score"])
+
+    assert copied and unrelated
+    assert mean(copied) > mean(unrelated) + 0.15
+
+
+def test_budget_failures_only_lists_steps_over_their_budget():
+    results = [
+        {"language": "python", "files": 100, "step": "compare_ast", "seconds": 12.0},
+        {"language": "python", "files": 100, "step": "prepare_ast", "seconds": 1.0},
+        {"language": "python", "files": 1000, "step": "compare_ast", "seconds": 900.0},
+    ]
+    budgets = {"python": {"100": {"compare_ast": 10.0, "prepare_ast": 5.0}}}
+
+    failures = budget_failures(results, budgets)
+
+    assert [(failure["step"], failure["budget_seconds"]) for failure in failures] == [("compare_ast", 10.0)]
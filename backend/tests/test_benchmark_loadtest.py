@@ -0,0 +1,18 @@
+from benchmarks.loadtest import Recorder, format_table, summarize
+
+
+def test_report_has_percentiles_and_throughput_per_endpoint():
+    recorder = Recorder()
+    recorder.latencies["file"].extend(index / 1000 for index in range(1, 101))
+    recorder.latencies["run"].extend([0.01, 0.03])
+    recorder.errors["run"] += 1
+
+    report = summarize(recorder, seconds=10.0)
+
+    assert report["endpoints"]["file"]["requests"] == 100
+    assert report["endpoints"]["file"]["per_sec"] == 10.0
+    assert report["endpoints"]["file"]["p50_ms"] == 50.5
+    assert report["endpoints"]["file"]["p99_ms"] == 99.0
+    assert report["endpoints"]["run"]["errors"] == 1
+    assert report["total"]["requests"] == 102
+    assert "total" in format_table([{"instructors": 5, **report}])
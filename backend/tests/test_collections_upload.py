@@ -1,4 +1,38 @@
-from app.pipeline.upload.zip_utils import group_zip_files, should_skip_zip_entry
+import hashlib
+import io
+import zipfile
+
+import pytest
+
+from app.api.routes import collections
+from app.models.models import Collection, Dataset, File, Submission
+from app.pipeline.upload.zip_utils import (
+    ZipTooLarge,
+    group_zip_files,
+    read_zip_entries,
+    scan_zip,
+    should_skip_zip_entry,
+)
+
+
+def zip_bytes(entries: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for path, data in entries.items():
+            archive.writestr(path, data)
+    return buffer.getvalue()
+
+
+def build_zip(entries: dict[str, bytes]) -> zipfile.ZipFile:
+    return zipfile.ZipFile(io.BytesIO(zip_bytes(entries)))
+
+
+def upload(api, entries: dict[str, bytes]):
+    collection_id = api.post("/api/collections/", json={"name": "cs101"}).json()["id"]
+    archive = zip_bytes(entries)
+    return collection_id, api.post(
+        f"/api/collections/{collection_id}/upload", files={"file": ("week1.zip", archive, "application/zip")}
+    )
 
 
 def test_should_skip_zip_entry_filters_macos_zip_metadata_and_non_source_files():
@@ -37,3 +71,95 @@ def test_group_zip_files_only_keeps_supported_source_entries():
         "Cpp415": ["Cpp415/main.cpp"],
         "Js415": ["Js415/app.js"],
     }
+
+
+def test_scan_zip_groups_and_reports_skips_in_one_pass():
+    z = build_zip({"alice/": b"", "alice/a.py": b"x = 1", "alice/notes.txt": b"hi", "main.c": b"int x;"})
+
+    groups, skipped = scan_zip(z)
+
+    assert groups == {"alice": ["alice/a.py"], "root": ["main.c"]}
+    assert skipped == [{"path": "alice/notes.txt", "reason": "unsupported file type"}]
+
+
+def test_scan_zip_limits_the_uncompressed_size_of_entries_that_will_be_read():
+    # highly compressible, like a zip bomb; the oversized entry is never decompressed
+    z = build_zip({"a/main.py": b"0" * 3000, "b/main.py": b"0" * 3000, "c/huge.py": b"0" * 50_000, "d/x.txt": b"0" * 50_000})
+
+    scan_zip(z, max_entry_bytes=10_000, max_total_bytes=6000)
+    with pytest.raises(ZipTooLarge) as error:
+        scan_zip(z, max_entry_bytes=10_000, max_total_bytes=5999)
+    assert error.value.total_bytes == 6000
+
+
+def test_read_zip_entries_keeps_order_and_drops_oversized_entries():
+    files = {f"s{index}/main.py": f"print({index})\n".encode() * (index + 1) for index in range(12)}
+    files["big/main.py"] = b"#" * 500
+    z = build_zip(files)
+
+    entries = list(read_zip_entries(z, list(files), max_bytes=400, workers=3))
+
+    assert [entry.path for entry in entries] == list(files)
+    assert entries[5].data == files["s5/main.py"]
+    assert entries[5].content_hash == hashlib.sha256(files["s5/main.py"]).hexdigest()
+    assert entries[-1].data is None and entries[-1].content_hash is None
+
+
+def test_upload_stores_a_dataset_with_one_submission_per_student_folder(api, db):
+    entries = {
+        f"student{index}/main.py": f"def f(x):\n    return x + {index}\n".encode() for index in range(5)
+    }
+    entries["student0/notes.txt"] = b"not code"
+
+    _, response = upload(api, entries)
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["stored_files"], body["skipped_files"]) == (5, 1)
+    assert body["language_counts"] == {"python": 5}
+    assert db.query(Dataset).filter_by(id=body["dataset_id"]).count() == 1
+    assert db.query(Submission).count() == 5
+    stored = {row.storage_key: row for row in db.query(File)}
+    assert set(stored) == {path for path in entries if path.endswith(".py")}
+    assert stored["student3/main.py"].path == "main.py"
+    assert stored["student3/main.py"].content_hash == hashlib.sha256(entries["student3/main.py"]).hexdigest()
+
+
+def test_failed_insert_leaves_no_upload_rows_behind(api, db, monkeypatch):
+    real_bulk_insert = collections.bulk_insert
+
+    def failing_bulk_insert(session, model, rows, **kwargs):
+        if model is not File:
+            return real_bulk_insert(session, model, rows, **kwargs)
+
+        def rows_then_error():
+            # the first batches reach the database before the failure
+            for index, row in enumerate(rows):
+                if index == 3:
+                    raise RuntimeError("insert failed")
+                yield row
+
+        return real_bulk_insert(session, model, rows_then_error(), **kwargs)
+
+    monkeypatch.setattr(collections, "bulk_insert", failing_bulk_insert)
+    monkeypatch.setattr(collections, "UPLOAD_INSERT_BATCH_SIZE", 1)
+    entries = {f"student{index}/main.py": b"x = 1\n" for index in range(6)}
+
+    collection_id, response = upload(api, entries)
+
+    assert response.status_code == 400
+    assert "insert failed" in response.json()["detail"]
+    assert [str(row.id) for row in db.query(Collection)] == [collection_id]
+    assert db.query(Dataset).count() == 0
+    assert db.query(Submission).count() == 0
+    assert db.query(File).count() == 0
+
+
+def test_upload_over_the_uncompressed_limit_is_rejected(api, db, monkeypatch):
+    monkeypatch.setattr(collections, "MAX_UNZIPPED_BYTES", 1000)
+
+    _, response = upload(api, {"a/main.py": b"0" * 600, "b/main.py": b"0" * 600})
+
+    assert response.status_code == 400
+    assert "limit is 1000 bytes" in response.json()["detail"]
+    assert db.query(Dataset).count() == 0
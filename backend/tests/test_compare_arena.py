@@ -0,0 +1,108 @@
+from app.pipeline.arena import FeatureArena, build_pair_ranges, language_buckets
+from app.pipeline.ast.run_stage import add_ast_evidence, compare_prepared_files, prepare_ast_file
+from app.pipeline.token.run_stage import add_token_evidence, compare_prepared_token_files, prepare_token_file
+
+
+SOURCES = {
+    "studentA/add.py": b"def add(a, b):\n    total = a + 1\n    if total > 0:\n        return total + b\n    return 0\n",
+    "studentB/add.py": b"def sum_values(x, y):\n    out = x + 999\n    if out > 0:\n        return out + y\n    return 0\n",
+    "studentC/fact.py": b"def factorial(n):\n    if n <= 1:\n        return 1\n    return n * factorial(n - 1)\n",
+    "studentD/add.js": b"function add(a, b) { const total = a + 1; return total + b; }\n",
+    "studentE/sum.js": b"function sum(x, y) { const out = x + 2; return out + y; }\n",
+}
+
+
+def _by_pair(comparisons, score_key):
+    return {
+        (item["file_a_id"], item["file_b_id"]): (round(item[score_key], 4), item["evidence"])
+        for item in comparisons
+    }
+
+
+def test_build_pair_ranges_covers_each_bucket_triangle_once():
+    tasks = build_pair_ranges([(0, 4), (4, 6)], pairs_per_task=2)
+    pairs = [(row, col) for task in tasks for row, start, end in task for col in range(start, end)]
+
+    assert sorted(pairs) == [(0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3), (4, 5)]
+    assert all(sum(end - start for _, start, end in task) <= 2 for task in tasks)
+
+
+def test_build_pair_ranges_respects_allowed_pairs():
+    tasks = build_pair_ranges([(0, 4)], allowed_pairs={(0, 2), (0, 3), (1, 3)})
+    pairs = [(row, col) for task in tasks for row, start, end in task for col in range(start, end)]
+    assert sorted(pairs) == [(0, 2), (0, 3), (1, 3)]
+
+
+def test_language_buckets_keep_original_order_within_language():
+    order, bounds = language_buckets(["python", "java", "python", "java"])
+    assert order == [1, 3, 0, 2]
+    assert bounds == [(0, 2), (2, 4)]
+
+
+def test_feature_arena_round_trips_hashes_and_spans():
+    with FeatureArena.create([[1, 2, 2**64 - 1], [], [7]], [[(0, 5), (1, 6), (2, 7)], [], [(10, 20)]]) as arena:
+        assert list(arena.offsets) == [0, 3, 3, 4]
+        assert list(arena.file_hashes(0)) == [1, 2, 2**64 - 1]
+        assert list(arena.file_hashes(1)) == []
+        assert arena.span(2, 0) == (10, 20)
+
+        attached = FeatureArena.attach(arena.layout)
+        assert list(attached.file_hashes(2)) == [7]
+        attached.close()
+
+
+def test_token_arena_comparison_matches_in_process_results():
+    prepared = [
+        prepare_token_file(file_id=path, path=path, content=content, k=3)
+        for path, content in SOURCES.items()
+    ]
+
+    serial = compare_prepared_token_files(prepared, k=3, processes=1)
+    parallel = compare_prepared_token_files(prepared, k=3, processes=2)
+
+    serial_pairs = _by_pair(serial, "fingerprint_score")
+    parallel_pairs = _by_pair(parallel, "fingerprint_score")
+    assert parallel_pairs.keys() == serial_pairs.keys()
+    for key, (score, evidence) in serial_pairs.items():
+        assert parallel_pairs[key][0] == score
+        sort_key = lambda item: item["fingerprint"]
+        assert sorted(parallel_pairs[key][1], key=sort_key) == sorted(evidence, key=sort_key)
+
+
+def test_ast_arena_comparison_matches_in_process_results():
+    prepared = [prepare_ast_file(file_id=path, path=path, content=content) for path, content in SOURCES.items()]
+    candidates = {("studentA/add.py", "studentB/add.py"), ("studentD/add.js", "studentE/sum.js")}
+
+    serial = compare_prepared_files(prepared, n=3, processes=1)
+    parallel = compare_prepared_files(prepared, n=3, processes=2)
+    assert _by_pair(parallel, "ast_score") == _by_pair(serial, "ast_score")
+
+    limited = compare_prepared_files(prepared, n=3, candidate_pairs=candidates, processes=2)
+    assert {(item["file_a_id"], item["file_b_id"]) for item in limited} == candidates
+
+
+def test_scores_only_comparisons_get_evidence_added_for_chosen_pairs():
+    token_files = [prepare_token_file(file_id=path, path=path, content=content, k=3) for path, content in SOURCES.items()]
+    ast_files = [prepare_ast_file(file_id=path, path=path, content=content) for path, content in SOURCES.items()]
+    chosen = ("studentA/add.py", "studentB/add.py")
+
+    for processes in (1, 2):
+        full = compare_prepared_token_files(token_files, k=3, processes=processes)
+        scores = compare_prepared_token_files(token_files, k=3, processes=processes, evidence=False)
+        assert all("evidence" not in item and "matching_fingerprints" not in item for item in scores)
+        assert {key: value[0] for key, value in _by_pair(full, "fingerprint_score").items()} == {
+            (item["file_a_id"], item["file_b_id"]): round(item["fingerprint_score"], 4) for item in scores
+        }
+        kept = [item for item in scores if (item["file_a_id"], item["file_b_id"]) == chosen]
+        add_token_evidence(kept, token_files)
+        expected = next(item for item in full if (item["file_a_id"], item["file_b_id"]) == chosen)
+        assert kept[0]["matching_fingerprints"] == expected["matching_fingerprints"]
+        sort_key = lambda item: item["fingerprint"]
+        assert sorted(kept[0]["evidence"], key=sort_key) == sorted(expected["evidence"], key=sort_key)
+
+        full = compare_prepared_files(ast_files, n=3, processes=processes)
+        scores = compare_prepared_files(ast_files, n=3, processes=processes, evidence=False)
+        assert all("evidence" not in item for item in scores)
+        kept = [item for item in scores if (item["file_a_id"], item["file_b_id"]) == chosen]
+        add_ast_evidence(kept, ast_files, n=3)
+        assert _by_pair(kept, "ast_score")[chosen] == _by_pair(full, "ast_score")[chosen]
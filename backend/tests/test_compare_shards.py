@@ -0,0 +1,25 @@
+from itertools import combinations
+
+from app.pipeline.shards import plan_compare_shards
+
+
+def test_shards_cover_every_same_language_pair_exactly_once():
+    files = [(f"py-{idx:02d}", "python") for idx in range(7)] + [("js-1", "javascript"), ("js-2", "javascript")]
+
+    shards = plan_compare_shards(files, 3)
+
+    covered = [pair for shard in shards for pair in shard.pair_keys()]
+    python_ids = sorted(file_id for file_id, language in files if language == "python")
+    expected = set(combinations(python_ids, 2)) | {("js-1", "js-2")}
+    assert len(covered) == len(set(covered))
+    assert set(covered) == expected
+    assert all(len(shard.file_ids) <= 6 for shard in shards)
+
+
+def test_single_file_languages_and_single_file_diagonal_blocks_are_skipped():
+    shards = plan_compare_shards([("a", "python"), ("b", "python"), ("c", "python"), ("d", "java")], 2)
+
+    assert [(shard.row_file_ids, shard.col_file_ids) for shard in shards] == [
+        (("a", "b"), ("a", "b")),
+        (("a", "b"), ("c",)),
+    ]
@@ -0,0 +1,27 @@
+from app.pipeline.histogram import add_bins, empty_bins, histogram_rows, resolve_result_floor, score_bin
+from similarity.thresholds import SIMILARITY_THRESHOLD_MIN
+
+
+def test_score_bins_cover_zero_to_one_inclusive():
+    assert score_bin(0.0, 20) == 0
+    assert score_bin(0.049, 20) == 0
+    assert score_bin(0.05, 20) == 1
+    assert score_bin(0.999, 20) == 19
+    assert score_bin(1.0, 20) == 19
+
+
+def test_result_floor_defaults_to_threshold_and_can_be_lowered_per_run():
+    assert resolve_result_floor({}) == SIMILARITY_THRESHOLD_MIN
+    assert resolve_result_floor(None) == SIMILARITY_THRESHOLD_MIN
+    assert resolve_result_floor({"result_floor": 0}) == 0.0
+
+
+def test_histogram_rows_sum_shard_counts_per_bin():
+    pairs = add_bins(add_bins(empty_bins(4), [3, 1, 0, 0]), [2, 0, 1, 1])
+    stored = add_bins(empty_bins(4), [0, 0, 1, 1])
+
+    rows = histogram_rows("run-1", pairs, stored)
+
+    assert [(row["lower"], row["upper"]) for row in rows] == [(0.0, 0.25), (0.25, 0.5), (0.5, 0.75), (0.75, 1.0)]
+    assert [row["pair_count"] for row in rows] == [5, 1, 1, 1]
+    assert [row["stored_count"] for row in rows] == [0, 0, 1, 1]
@@ -0,0 +1,72 @@
+import logging
+import os
+
+from app.pipeline.memory import (
+    BACKEND_ROOT,
+    StageMemory,
+    allocation_site,
+    resolve_memory_options,
+    set_concurrent_tasks,
+    track_memory,
+)
+from app.pipeline.metrics import StageMetric
+from app.pipeline.profiling import ProfileOptions, RunProfiler
+
+
+def allocate_blocks():
+    return [bytearray(64 * 1024) for _ in range(64)]
+
+
+def test_memory_options_come_from_run_config():
+    assert resolve_memory_options({}).trace is False
+    assert resolve_memory_options({"memory": True}).trace is True
+
+    options = resolve_memory_options({"memory": {"top": 3, "soft_limit_mb": 512}})
+
+    assert (options.trace, options.top, options.soft_limit_mb) == (True, 3, 512.0)
+
+
+def test_traced_step_records_peak_and_top_allocation_sites():
+    metric = StageMetric("INGEST", "prepare")
+    with track_memory({"memory": {"top": 3}}):
+        memory = StageMemory()
+        blocks = allocate_blocks()
+        memory.finish(metric, "run-1")
+
+    assert len(blocks) == 64
+    assert metric.peak_rss_mb > 0
+    assert metric.traced_peak_mb >= 4.0
+    assert len(metric.details["top_allocations"]) == 3
+    assert metric.details["top_allocations"][0]["site"].startswith("tests/test_memory.py:")
+
+
+def test_step_over_the_soft_limit_is_logged_and_flagged(caplog):
+    metric = StageMetric("INGEST", "prepare")
+    with track_memory({"memory": {"trace": False, "soft_limit_mb": 1}}), caplog.at_level(logging.WARNING):
+        StageMemory().finish(metric, "run-1")
+
+    assert metric.traced_peak_mb is None
+    assert metric.details["over_soft_limit_mb"] == 1.0
+    assert "INGEST/prepare" in caplog.text
+
+
+def test_shared_worker_process_skips_process_wide_measurements():
+    # a threads-pool worker running two tasks at once
+    set_concurrent_tasks(2)
+    try:
+        metric = StageMetric("INGEST", "prepare")
+        with track_memory({"memory": {"soft_limit_mb": 1}}):
+            StageMemory().finish(metric, "run-1")
+        profiler = RunProfiler(ProfileOptions())
+    finally:
+        set_concurrent_tasks(1)
+
+    assert metric.peak_rss_mb is None and metric.traced_peak_mb is None
+    assert metric.details == {"peak_rss_scope": "shared", "trace_skipped": "shared process"}
+    assert profiler.deterministic is False
+    assert RunProfiler(ProfileOptions()).deterministic is True
+
+
+def test_allocation_sites_are_shortened_to_the_package_path():
+    assert allocation_site(os.path.join(BACKEND_ROOT, "app", "tasks.py"), 12) == "app/tasks.py:12"
+    assert allocation_site("/usr/lib/python3.12/site-packages/sqlalchemy/orm/session.py", 3) == "sqlalchemy/orm/session.py:3"
@@ -0,0 +1,32 @@
+import uuid
+
+from app.models.models import RunMetric
+from app.pipeline.metrics import StageMetric, measure_stage, payload_bytes, record
+
+
+def test_payload_bytes_counts_blobs_text_and_ids():
+    row = {"run_id": uuid.uuid4(), "path": "a/é.py", "blob": b"\x00" * 10, "score": 0.5, "details": None}
+
+    assert payload_bytes(row) == 16 + len("a/é.py".encode("utf-8")) + 10 + 8
+
+
+def test_record_outside_a_measured_step_is_ignored_and_rows_carry_counters():
+    record(pairs_scored=5)
+
+    metric = StageMetric("AST", "compare_shard", seq=2, pairs_scored=3, details={"top_allocations": []})
+    row = metric.row("run-1")
+
+    assert row["run_id"] == "run-1"
+    assert row["pairs_scored"] == 3
+    assert row["seq"] == 2
+    assert row["details"] == {"top_allocations": []}
+    assert StageMetric("INGEST", "prepare").row("run-1")["details"] is None
+
+
+def test_step_cpu_adds_the_cpu_reported_by_its_comparison_pools(db):
+    run_id = uuid.uuid4()
+    with measure_stage(db, run_id, "TOKENS", "compare") as metric:
+        record(cpu_ms=250.0)
+
+    assert 250.0 <= metric.cpu_ms < 250.0 + metric.wall_ms + 50
+    assert db.query(RunMetric).filter_by(run_id=run_id).one().cpu_ms == metric.cpu_ms
@@ -0,0 +1,66 @@
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import create_engine, inspect, text
+
+from benchmarks.sqlite import install_sqlite_types
+from scripts.db.migrate import ALEMBIC_INI, BASELINE_REVISION, migrate
+
+
+@pytest.fixture
+def engine(tmp_path):
+    install_sqlite_types()
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield engine
+    engine.dispose()
+
+
+def schema_drift(engine):
+    from app.core.db import Base
+    import app.models.models  # noqa: F401
+
+    with engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={"compare_type": False})
+        return compare_metadata(context, Base.metadata)
+
+
+def current_revision(engine):
+    with engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def head_revision():
+    from alembic.script import ScriptDirectory
+
+    return ScriptDirectory.from_config(Config(ALEMBIC_INI)).get_current_head()
+
+
+def test_migrations_build_the_models_schema(engine):
+    migrate(engine)
+
+    assert schema_drift(engine) == []
+    assert current_revision(engine) == head_revision()
+
+
+def test_a_pre_migration_database_is_stamped_and_upgraded(engine):
+    from app.core.db import Base
+    import app.models.models  # noqa: F401
+
+    config = Config(ALEMBIC_INI)
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, BASELINE_REVISION)
+        connection.execute(text("DROP TABLE alembic_version"))
+        # create_all ran once run_metrics existed, before it had a seq column
+        Base.metadata.tables["run_metrics"].create(connection)
+        connection.execute(text("ALTER TABLE run_metrics DROP COLUMN seq"))
+
+    migrate(engine)
+
+    assert current_revision(engine) == head_revision()
+    assert schema_drift(engine) == []
+    assert "seq" in {column["name"] for column in inspect(engine).get_columns("run_metrics")}
+    assert {"priority", "state_json", "heartbeat_at"} <= {column["name"] for column in inspect(engine).get_columns("runs")}
+    assert "ix_runs_status_priority" in {index["name"] for index in inspect(engine).get_indexes("runs")}
@@ -0,0 +1,72 @@
+from prometheus_client import REGISTRY
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.core import monitoring
+from app.core.monitoring import observe_stage, time_parse
+from app.pipeline.metrics import StageMetric
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_finished_steps_feed_duration_pair_and_evidence_metrics():
+    before = (
+        sample("pipeline_stage_duration_seconds_count", stage="AST", step="compare"),
+        sample("pipeline_pair_comparisons_total", step="compare"),
+        sample("pipeline_evidence_rows_total", step="compare"),
+    )
+
+    observe_stage(StageMetric("AST", "compare", wall_ms=1500, pairs_scored=12, evidence_rows=40))
+
+    assert sample("pipeline_stage_duration_seconds_count", stage="AST", step="compare") == before[0] + 1
+    assert sample("pipeline_pair_comparisons_total", step="compare") == before[1] + 12
+    assert sample("pipeline_evidence_rows_total", step="compare") == before[2] + 40
+
+
+def test_parse_time_is_recorded_even_when_parsing_fails():
+    before = sample("pipeline_parse_seconds_count", language="java")
+
+    try:
+        with time_parse("java"):
+            raise ValueError("budget")
+    except ValueError:
+        pass
+
+    assert sample("pipeline_parse_seconds_count", language="java") == before + 1
+
+
+def write_samples(directory, filename, samples):
+    # what a process writes in multiprocess mode: one mmap file per process and kind
+    directory.mkdir(parents=True, exist_ok=True)
+    values = MmapedDict(str(directory / filename))
+    for (name, help_text, labels), value in samples.items():
+        key = mmap_key(name, name, [label for label, _ in labels], [label_value for _, label_value in labels], help_text)
+        values.write_value(key, value, 0.0)
+    values.close()
+
+
+def test_api_metrics_merges_every_container_directory(api, monkeypatch, tmp_path):
+    # the api's and a worker's main processes are both pid 1 in their containers
+    processes = ("celery_worker_processes", "Celery worker processes alive", ())
+    pairs = ("pipeline_pair_comparisons_total", "File pairs scored, after candidate filtering", (("step", "compare"),))
+    write_samples(tmp_path / "backend", "gauge_livesum_1.db", {processes: 0})
+    write_samples(tmp_path / "celery-worker", "gauge_livesum_1.db", {processes: 2})
+    write_samples(tmp_path / "celery-worker", "counter_1.db", {pairs: 10})
+    write_samples(tmp_path / "celery-shard-worker", "gauge_livesum_1.db", {processes: 3})
+    write_samples(tmp_path / "celery-shard-worker", "counter_1.db", {pairs: 5})
+    monkeypatch.setattr(monitoring, "PROMETHEUS_MULTIPROC_DIR", str(tmp_path / "backend"))
+    monkeypatch.setattr(monitoring, "PROMETHEUS_METRICS_ROOT", str(tmp_path))
+
+    response = api.get("/api/metrics")
+
+    assert response.status_code == 200
+    parsed = {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+    }
+    assert parsed[("celery_worker_processes", ())] == 5
+    assert parsed[("pipeline_pair_comparisons_total", (("step", "compare"),))] == 15
+    assert parsed[("plagiarism_runs", (("status", "QUEUED"),))] == 0
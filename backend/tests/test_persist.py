@@ -0,0 +1,44 @@
+import uuid
+
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from app.pipeline.persist import bulk_insert, chunked
+
+
+Base = declarative_base()
+
+
+class Row(Base):
+    __tablename__ = "rows"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    value = Column(Integer, nullable=False)
+
+
+def test_chunked_splits_generators_without_materialising_them():
+    assert [len(chunk) for chunk in chunked(({"n": i} for i in range(7)), 3)] == [3, 3, 1]
+    assert list(chunked([], 3)) == []
+
+
+def test_bulk_insert_applies_column_defaults_in_batches():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        written = bulk_insert(db, Row, ({"value": i} for i in range(5)), batch_size=2)
+        assert written == 5
+
+        rows = db.query(Row).order_by(Row.value).all()
+        assert [row.value for row in rows] == [0, 1, 2, 3, 4]
+        assert len({row.id for row in rows}) == 5
+
+
+def test_bulk_insert_without_commit_rolls_back_with_the_caller():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        assert bulk_insert(db, Row, ({"value": i} for i in range(5)), batch_size=2, commit=False) == 5
+        assert db.query(Row).count() == 5
+
+        db.rollback()
+        assert db.query(Row).count() == 0
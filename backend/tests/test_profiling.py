@@ -0,0 +1,62 @@
+import marshal
+import time
+
+from app.pipeline.profiling import (
+    ProfileOptions,
+    RunProfiler,
+    merge_collapsed,
+    merge_pstats,
+    resolve_profile_options,
+)
+
+
+def busy_profiled_work(seconds: float) -> int:
+    total, deadline = 0, time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        total += sum(range(200))
+    return total
+
+
+def test_profile_options_come_from_run_config():
+    assert resolve_profile_options({}) is None
+    assert resolve_profile_options({"profile": False}) is None
+    assert resolve_profile_options({"profile": True}).steps is None
+
+    options = resolve_profile_options({"profile": {"steps": ["compare"], "interval_ms": 2}})
+
+    assert options.steps == frozenset({"compare"})
+    assert options.interval_ms == 2.0
+
+
+def test_profiler_records_pstats_and_collapsed_stacks_only_while_enabled():
+    profiler = RunProfiler(ProfileOptions(steps=frozenset({"compare"}), interval_ms=1))
+    profiler.sampler.start()
+    busy_profiled_work(0.05)  # not enabled yet
+    profiler.enable()
+    busy_profiled_work(0.2)
+    profiler.disable()
+    profiler.sampler.stop()
+
+    stats = marshal.loads(profiler.pstats())
+    collapsed = profiler.sampler.collapsed().decode("utf-8").splitlines()
+
+    assert profiler.wants("compare") and not profiler.wants("prepare")
+    assert any(function == "busy_profiled_work" for (_, _, function) in stats)
+    assert any("busy_profiled_work" in line for line in collapsed)
+
+
+def test_profiles_of_several_tasks_merge_into_one():
+    first = RunProfiler(ProfileOptions())
+    first.enable()
+    busy_profiled_work(0.01)
+    first.disable()
+    second = RunProfiler(ProfileOptions())
+    second.enable()
+    busy_profiled_work(0.01)
+    second.disable()
+
+    merged = marshal.loads(merge_pstats([first.pstats(), second.pstats()]))
+    calls = [value[1] for (_, _, function), value in merged.items() if function == "busy_profiled_work"]
+
+    assert calls == [2]
+    assert merge_collapsed([b"a;b 2\na;c 1\n", b"a;b 3\n"]) == b"a;b 5\na;c 1\n"
@@ -0,0 +1,61 @@
+from sqlalchemy import create_engine, text
+
+from app.core.db import QueryStats, instrument_engine, normalize_statement, track_queries
+from app.pipeline.status import RunStatusWriter
+from benchmarks.cohort import generate_cohort
+from benchmarks.run import seed_run
+
+
+def test_statements_are_grouped_by_shape_not_by_values():
+    assert normalize_statement("SELECT * FROM runs WHERE id = %(id_1)s") == "SELECT * FROM runs WHERE id = ?"
+    assert normalize_statement("SELECT * FROM files WHERE id IN (?, ?, ?)") == "SELECT * FROM files WHERE id IN (?)"
+    assert normalize_statement("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)") == "INSERT INTO t (a, b) VALUES (?)"
+    assert normalize_statement("SELECT x::jsonb FROM t") == "SELECT x::jsonb FROM t"
+
+
+def test_repeated_statements_are_flagged_except_batched_inserts():
+    stats = QueryStats()
+    for _ in range(12):
+        stats.record("SELECT * FROM runs WHERE id = ?", 1.0)
+        stats.record("INSERT INTO t (a) VALUES (?)", 1.0)
+    stats.record("SELECT 1", 50.0)
+
+    assert stats.count == 25
+    assert stats.repeated(threshold=10) == [{"count": 12, "statement": "SELECT * FROM runs WHERE id = ?"}]
+    assert stats.slowest()[0] == {"ms": 50.0, "statement": "SELECT 1"}
+
+
+def test_engine_events_count_statements_inside_the_tracked_block_only():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        with track_queries() as stats:
+            for value in range(3):
+                conn.execute(text("SELECT :value"), {"value": value})
+        conn.execute(text("SELECT 2"))
+
+    assert stats.count == 3
+    assert stats.statements == {"SELECT ?": 3}
+    assert stats.total_ms > 0
+
+
+def test_throttled_status_writes_are_not_reported_as_repeated(db):
+    run_id = seed_run(db, generate_cohort("python", 2, seed=1))
+    instrument_engine(db.get_bind())
+    now = [0.0]
+    status = RunStatusWriter(db, run_id, flush_interval_ms=1000, clock=lambda: now[0])
+
+    with track_queries() as stats:
+        status.begin_step("AST", "pairs", start_pct=0, end_pct=100, total=20)
+        for done in range(1, 21):
+            now[0] += 1.5
+            status.progress(done)
+        for _ in range(12):
+            db.execute(text("UPDATE runs SET stage = stage WHERE id = :id"), {"id": run_id})
+
+    status_writes = sum(
+        count for shape, count in stats.statements.items() if shape.startswith("UPDATE runs SET progress_pct")
+    )
+    assert status_writes >= 20
+    assert [item["statement"] for item in stats.repeated()] == ["UPDATE runs SET stage = stage WHERE id = ?"]
@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app import tasks
+from app.models.models import File, PairResult, Run, RunMetric, RunShard, RunWarning, Submission
+from app.pipeline.ingest import ingest_file
+from app.pipeline.status import RunStatusWriter
+from app.scheduler import RUN_DISPATCH_TIMEOUT_SECONDS, RUN_HEARTBEAT_TIMEOUT_SECONDS
+from benchmarks.cohort import generate_cohort
+from benchmarks.run import seed_run
+
+
+def pair_scores(db, run_id):
+    rows = db.execute(select(PairResult).where(PairResult.run_id == run_id)).scalars()
+    return {(str(row.file_a_id), str(row.file_b_id)): row.final_score for row in rows}
+
+
+def set_run(db, run_id, **values):
+    db.execute(Run.__table__.update().where(Run.id == run_id).values(**values))
+    db.commit()
+
+
+def test_resume_skips_checkpointed_steps_without_decoding_or_parsing(pipeline, monkeypatch):
+    db = pipeline()
+    run_id = seed_run(db, generate_cohort("python", 8, seed=2))
+    tasks.run_pipeline.run(run_id)
+    db.expire_all()
+    first = pair_scores(db, run_id)
+    assert db.get(Run, run_id).state_json["checkpoints"] == ["prepare", "compare"]
+
+    # fail after prepare: compare runs again, everything before it is loaded
+    set_run(
+        db,
+        run_id,
+        status="FAILED",
+        state_json={**db.get(Run, run_id).state_json, "checkpoints": ["prepare"]},
+    )
+
+    def must_not_run(*_args, **_kwargs):
+        raise AssertionError("checkpointed step ran again")
+
+    for name in ("ingest_file", "prepare_token_source", "prepare_ast_source", "match_prepared_functions"):
+        monkeypatch.setattr(tasks, name, must_not_run)
+    tasks.run_pipeline.run(run_id)
+
+    db.expire_all()
+    assert db.get(Run, run_id).status == "DONE"
+    assert pair_scores(db, run_id) == first
+
+
+def test_each_file_is_decoded_once_and_decode_failures_survive_a_resume(pipeline, monkeypatch):
+    db = pipeline()
+    run_id = seed_run(db, generate_cohort("python", 6, seed=3))
+    dataset_id = db.get(Run, run_id).dataset_id
+    unreadable = db.execute(
+        select(File.id).join(Submission).where(Submission.dataset_id == dataset_id).order_by(File.id).limit(1)
+    ).scalar_one()
+    db.execute(File.__table__.update().where(File.id == unreadable).values(content=None))
+    db.commit()
+    decoded = []
+    monkeypatch.setattr(tasks, "ingest_file", lambda **row: decoded.append(row["file_id"]) or ingest_file(**row))
+
+    tasks.run_pipeline.run(run_id)
+
+    db.expire_all()
+    assert len(decoded) == len(set(decoded)) == 6
+    assert db.get(Run, run_id).state_json["undecoded_files"] == [str(unreadable)]
+    registry = tasks.load_ingested_files(db, run_id, RunStatusWriter(db, run_id))
+    assert [item.file_id for item in registry.files if not item.decoded] == [unreadable]
+    assert len(registry.decoded_files) == 5
+
+
+def test_metric_rows_are_named_after_checkpoints_and_replaced_on_resume(pipeline):
+    db = pipeline()
+    run_id = seed_run(db, generate_cohort("python", 6, seed=3))
+    tasks.run_pipeline.run(run_id)
+    set_run(
+        db,
+        run_id,
+        status="FAILED",
+        state_json={**db.get(Run, run_id).state_json, "checkpoints": ["prepare"]},
+    )
+
+    tasks.run_pipeline.run(run_id)
+
+    db.expire_all()
+    steps = db.execute(select(RunMetric.step).where(RunMetric.run_id == run_id)).scalars().all()
+    assert sorted(steps) == sorted(db.get(Run, run_id).state_json["checkpoints"] + ["report"])
+
+
+def test_resume_drops_warnings_raised_after_the_last_checkpoint(pipeline):
+    db = pipeline()
+    run_id = seed_run(db, generate_cohort("python", 8, seed=2))
+    set_run(db, run_id, status="FAILED", state_json={"checkpoint_warnings": 1})
+    for seq in range(3):
+        db.add(RunWarning(run_id=run_id, seq=seq, stage="TOKENS", reason=f"warning {seq}"))
+    db.commit()
+
+    tasks.run_pipeline.run(run_id)
+
+    reasons = db.execute(select(RunWarning.reason).where(RunWarning.run_id == run_id)).scalars().all()
+    assert reasons == ["warning 0"]
+
+
+def test_create_run_drops_pipeline_state_keys_from_the_config(api, db, dispatched):
+    run_id = seed_run(db, generate_cohort("python", 4, seed=1))
+    dataset_id = str(db.get(Run, run_id).dataset_id)
+    set_run(db, run_id, status="DONE")
+
+    response = api.post(
+        "/api/runs/",
+        json={"dataset_id": dataset_id, "config_json": {"result_floor": 0.2, "checkpoints": ["prepare", "compare"]}},
+    )
+
+    assert response.status_code == 201
+    assert response.json()["config_json"] == {"result_floor": 0.2}
+    db.expire_all()
+    assert db.get(Run, response.json()["id"]).state_json == {}
+    assert dispatched == [response.json()["id"]]
+
+
+@pytest.mark.parametrize(
+    ("status", "force", "heartbeat_age", "expected"),
+    [
+        ("FAILED", False, None, 200),
+        ("RUNNING", False, RUN_HEARTBEAT_TIMEOUT_SECONDS * 2, 409),
+        ("RUNNING", True, 5, 409),
+        ("RUNNING", True, RUN_HEARTBEAT_TIMEOUT_SECONDS * 2, 200),
+        # still waiting in the worker queue; nothing beats for it there
+        ("SCHEDULED", True, RUN_HEARTBEAT_TIMEOUT_SECONDS * 2, 409),
+        ("SCHEDULED", True, RUN_DISPATCH_TIMEOUT_SECONDS * 2, 200),
+        # cancelled, but its worker has not confirmed it stopped
+        ("CANCELLED", False, 5, 409),
+        ("CANCELLED", False, RUN_HEARTBEAT_TIMEOUT_SECONDS * 2, 200),
+        ("DONE", True, None, 409),
+    ],
+)
+def test_resume_endpoint_only_requeues_runs_without_a_live_worker(api, db, dispatched, status, force, heartbeat_age, expected):
+    run_id = seed_run(db, generate_cohort("python", 4, seed=1))
+    heartbeat = None if heartbeat_age is None else datetime.utcnow() - timedelta(seconds=heartbeat_age)
+    set_run(db, run_id, status=status, heartbeat_at=heartbeat)
+
+    response = api.post(f"/api/runs/{run_id}/resume", params={"force": force})
+
+    assert response.status_code == expected
+    db.expire_all()
+    if expected == 200:
+        assert dispatched == [run_id]
+        assert db.get(Run, run_id).status == "SCHEDULED"
+    else:
+        assert dispatched == []
+        assert db.get(Run, run_id).status == status
+
+
+def test_force_resume_is_refused_while_shards_are_running(api, db, dispatched):
+    run_id = seed_run(db, generate_cohort("python", 4, seed=1))
+    stale = datetime.utcnow() - timedelta(seconds=RUN_HEARTBEAT_TIMEOUT_SECONDS * 2)
+    set_run(db, run_id, status="RUNNING", heartbeat_at=stale)
+    db.add(RunShard(run_id=run_id, seq=0, language="python", row_file_ids=[], col_file_ids=[], status="PENDING"))
+    db.add(
+        RunShard(
+            run_id=run_id,
+            seq=1,
+            language="python",
+            row_file_ids=[],
+            col_file_ids=[],
+            status="PENDING",
+            started_at=datetime.utcnow() - timedelta(seconds=5),
+        )
+    )
+    db.commit()
+
+    assert api.post(f"/api/runs/{run_id}/resume", params={"force": True}).status_code == 409
+
+    # a shard started before the timeout is treated as lost with its worker
+    db.execute(RunShard.__table__.update().where(RunShard.run_id == run_id).values(started_at=stale))
+    db.commit()
+    assert api.post(f"/api/runs/{run_id}/resume", params={"force": True}).status_code == 200
+    assert dispatched == [run_id]
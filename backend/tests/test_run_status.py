@@ -0,0 +1,166 @@
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+from app.models.models import Collection, Dataset, Run, RunWarning
+from app.pipeline.status import RunCancelled, RunHeartbeat, RunStatusWriter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_run(db, **values):
+    collection = Collection(name="status", owner_id=uuid.uuid4())
+    db.add(collection)
+    db.flush()
+    dataset = Dataset(collection_id=collection.id, name="ds")
+    db.add(dataset)
+    db.flush()
+    run = Run(dataset_id=dataset.id, status="RUNNING", stage="INGEST", progress_pct=0, config_json={}, **values)
+    db.add(run)
+    db.commit()
+    return str(run.id)
+
+
+def stored(db, column, run_id):
+    return db.execute(select(column).where(Run.id == run_id)).scalar_one()
+
+
+def warning_rows(db, run_id):
+    rows = db.execute(
+        select(RunWarning.seq, RunWarning.reason).where(RunWarning.run_id == run_id).order_by(RunWarning.seq)
+    )
+    return [tuple(row) for row in rows]
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_progress_writes_are_throttled_and_coalesced(db, clock):
+    run_id = make_run(db)
+    status = RunStatusWriter(db, run_id, flush_interval_ms=1000, clock=clock)
+
+    status.begin_step("TOKENS", "files", start_pct=20, end_pct=40, total=10)
+    assert stored(db, Run.stage, run_id) == "TOKENS"
+    assert stored(db, Run.progress_pct, run_id) == 20
+
+    for done in range(1, 6):
+        clock.now += 0.1
+        status.progress(done)
+    assert stored(db, Run.progress_pct, run_id) == 20
+
+    clock.now = 1.5
+    status.progress(6)
+    assert stored(db, Run.progress_pct, run_id) == 32
+    assert stored(db, Run.state_json, run_id)["progress"]["done"] == 6
+    assert stored(db, Run.heartbeat_at, run_id) is not None
+
+
+def test_heartbeats_are_written_without_progress_but_throttled(db, clock):
+    run_id = make_run(db)
+    status = RunStatusWriter(db, run_id, flush_interval_ms=1000, clock=clock)
+    heartbeat = RunHeartbeat(db, run_id, flush_interval_ms=1000, clock=clock)
+
+    status.heartbeat()
+    first = stored(db, Run.heartbeat_at, run_id)
+    assert first is not None
+
+    clock.now = 0.5
+    status.heartbeat()
+    heartbeat(3, 10)
+    second = stored(db, Run.heartbeat_at, run_id)
+    assert second > first
+
+    clock.now = 0.9
+    heartbeat(4, 10)
+    assert stored(db, Run.heartbeat_at, run_id) == second
+
+
+def test_stage_and_status_changes_are_written_immediately(db, clock):
+    run_id = make_run(db)
+    status = RunStatusWriter(db, run_id, flush_interval_ms=1000, clock=clock)
+    status.update(progress_pct=10)
+
+    clock.now = 0.1
+    status.update(progress_pct=30, stage="AST")
+
+    assert stored(db, Run.stage, run_id) == "AST"
+    assert stored(db, Run.progress_pct, run_id) == 30
+
+    clock.now = 0.2
+    status.update(status="DONE")
+    assert stored(db, Run.status, run_id) == "DONE"
+
+
+def test_warnings_are_buffered_and_numbered_after_existing_ones(db, clock):
+    run_id = make_run(db)
+    db.add_all([RunWarning(run_id=run_id, seq=seq, stage="INGEST", reason=f"old {seq}") for seq in range(2)])
+    db.commit()
+    status = RunStatusWriter(db, run_id, flush_interval_ms=1000, clock=clock)
+    status.update(stage="TOKENS")
+
+    status.warn({"stage": "TOKENS", "path": "a.py", "reason": "new 2", "kind": "empty"})
+    status.warn({"reason": "new 3"})
+    assert len(warning_rows(db, run_id)) == 2
+
+    status.flush()
+    assert warning_rows(db, run_id) == [(0, "old 0"), (1, "old 1"), (2, "new 2"), (3, "new 3")]
+    new = db.execute(select(RunWarning).where(RunWarning.run_id == run_id, RunWarning.seq == 2)).scalar_one()
+    assert (new.stage, new.path, new.details) == ("TOKENS", "a.py", {"kind": "empty"})
+    assert status.warning_count == 4
+
+
+def test_muted_warnings_are_dropped(db, clock):
+    run_id = make_run(db)
+    status = RunStatusWriter(db, run_id, clock=clock)
+
+    with status.muted():
+        status.warn({"reason": "replayed"})
+    status.warn({"reason": "kept"})
+    status.flush()
+
+    assert warning_rows(db, run_id) == [(0, "kept")]
+
+
+def test_rewind_drops_warnings_after_the_last_checkpoint(db, clock):
+    run_id = make_run(db)
+    status = RunStatusWriter(db, run_id, clock=clock)
+    status.warn({"reason": "prepare"})
+    status.checkpoint("prepare")
+    status.warn({"reason": "compare 1"})
+    status.warn({"reason": "compare 2"})
+    status.flush()
+
+    resumed = RunStatusWriter(db, run_id, clock=clock)
+    assert resumed.completed("prepare") and not resumed.completed("compare")
+    resumed.rewind()
+    resumed.warn({"reason": "compare again"})
+    resumed.flush()
+
+    assert warning_rows(db, run_id) == [(0, "prepare"), (1, "compare again")]
+
+
+def test_a_cancelled_run_is_never_overwritten(db, clock):
+    run_id = make_run(db)
+    status = RunStatusWriter(db, run_id, flush_interval_ms=1000, clock=clock)
+    status.update(progress_pct=5)
+    db.execute(Run.__table__.update().where(Run.id == run_id).values(status="CANCELLED"))
+    db.commit()
+
+    status.warn({"reason": "lost with the cancel"})
+    with pytest.raises(RunCancelled):
+        status.update(stage="AST")
+    with pytest.raises(RunCancelled):
+        status.raise_if_cancelled()
+
+    assert stored(db, Run.status, run_id) == "CANCELLED"
+    assert stored(db, Run.stage, run_id) == "INGEST"
+    assert warning_rows(db, run_id) == []
@@ -0,0 +1,58 @@
+import uuid
+
+from sqlalchemy import select
+
+from app.api.routes.runs import risk_band_counts
+from app.models.models import PairResult, Run, RunWarning
+from app.pipeline.histogram import empty_bins, histogram_rows, score_bin
+from app.schemas.runs import ScoreBinOut, ScoreHistogramOut
+from benchmarks.cohort import generate_cohort
+from benchmarks.run import seed_run
+
+
+def add_warnings(db, run_id, stages):
+    db.add_all(
+        RunWarning(run_id=run_id, seq=seq, stage=stage, path=f"s{seq}/main.py", reason=f"warning {seq}")
+        for seq, stage in enumerate(stages)
+    )
+    db.commit()
+
+
+def test_warnings_endpoint_pages_in_order_and_filters_by_stage(api, db):
+    run_id = seed_run(db, generate_cohort("python", 4, seed=1))
+    add_warnings(db, run_id, ["INGEST", "TOKENS", "AST", "TOKENS", "AST"])
+
+    page = api.get(f"/api/runs/{run_id}/warnings", params={"offset": 1, "limit": 2}).json()
+    ast = api.get(f"/api/runs/{run_id}/warnings", params={"stage": "ast"}).json()
+
+    assert [(item["seq"], item["stage"], item["reason"]) for item in page] == [
+        (1, "TOKENS", "warning 1"),
+        (2, "AST", "warning 2"),
+    ]
+    assert [item["seq"] for item in ast] == [2, 4]
+    assert api.get(f"/api/runs/{run_id}").json()["warning_count"] == 5
+    assert api.get(f"/api/runs/{uuid.uuid4()}/warnings").status_code == 404
+    assert api.get(f"/api/runs/{run_id}/warnings", params={"limit": 0}).status_code == 422
+
+
+def test_warning_count_is_only_queried_where_asked_for():
+    assert "count(" not in str(select(Run)).lower()
+
+
+def test_report_risk_bands_count_every_compared_pair():
+    scores = [0.95, 0.7, 0.69, 0.4, 0.39, 0.1, 0.0]
+    pair_counts, stored_counts = empty_bins(), empty_bins()
+    for score in scores:
+        pair_counts[score_bin(score)] += 1
+    # only the high pairs were stored as results
+    stored = [PairResult(final_score=score) for score in scores if score >= 0.7]
+    histogram = ScoreHistogramOut(
+        floor=0.7,
+        pairs_compared=len(scores),
+        pairs_stored=len(stored),
+        bins=[ScoreBinOut(**row) for row in histogram_rows("run-1", pair_counts, stored_counts)],
+    )
+
+    assert risk_band_counts(histogram, stored) == {"HIGH": 2, "MEDIUM": 2, "LOW": 3}
+    # runs from before the histogram fall back to their stored pairs
+    assert risk_band_counts(histogram.model_copy(update={"bins": []}), stored) == {"HIGH": 2}
@@ -0,0 +1,169 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from app import scheduler
+from app.models.models import Run
+from app.pipeline.status import RunStatusWriter
+from app.scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    RUN_HEARTBEAT_TIMEOUT_SECONDS,
+    QueuedRun,
+    cancel_runs,
+    schedule_runs,
+    select_runs_to_start,
+)
+from app.tasks import run_pipeline
+from benchmarks.cohort import generate_cohort
+from benchmarks.run import seed_run
+
+
+def test_dataset_cap_holds_back_second_run_but_not_runs_behind_it():
+    queued = [
+        QueuedRun("r1", "ds-1", "owner-a", PRIORITY_INTERACTIVE),
+        QueuedRun("r2", "ds-1", "owner-a", PRIORITY_INTERACTIVE),
+        QueuedRun("r3", "ds-2", "owner-b", PRIORITY_BATCH),
+    ]
+
+    selected = select_runs_to_start(queued, [], dataset_cap=1, owner_cap=0)
+
+    assert [run.run_id for run in selected] == ["r1", "r3"]
+
+
+def test_owner_cap_counts_runs_already_active():
+    queued = [
+        QueuedRun("r1", "ds-2", "owner-a", PRIORITY_INTERACTIVE),
+        QueuedRun("r2", "ds-3", "owner-b", PRIORITY_BATCH),
+    ]
+
+    selected = select_runs_to_start(queued, [("ds-1", "owner-a")], dataset_cap=1, owner_cap=1)
+
+    assert [run.run_id for run in selected] == ["r2"]
+
+
+def test_zero_caps_start_everything():
+    queued = [QueuedRun(f"r{idx}", "ds-1", "owner-a", PRIORITY_BATCH) for idx in range(3)]
+
+    selected = select_runs_to_start(queued, [("ds-1", "owner-a")], dataset_cap=0, owner_cap=0)
+
+    assert len(selected) == 3
+
+
+def queue_run(db, dataset_id, **values):
+    run = Run(dataset_id=dataset_id, status="QUEUED", stage="INGEST", progress_pct=0, config_json={}, **values)
+    db.add(run)
+    db.commit()
+    return str(run.id)
+
+
+def statuses(db, *run_ids):
+    db.expire_all()
+    return [db.get(Run, run_id).status for run_id in run_ids]
+
+
+def test_schedule_runs_claims_only_what_the_caps_allow(db, dispatched):
+    active = seed_run(db, generate_cohort("python", 4, seed=1))
+    dataset_id = db.get(Run, active).dataset_id
+    waiting = queue_run(db, dataset_id)
+
+    assert schedule_runs(db) == []
+    assert statuses(db, active, waiting) == ["SCHEDULED", "QUEUED"]
+
+    # the active run ending frees the dataset's slot
+    db.execute(Run.__table__.update().where(Run.id == active).values(status="DONE"))
+    assert schedule_runs(db) == [waiting]
+    assert statuses(db, waiting) == ["SCHEDULED"]
+    assert dispatched == [waiting]
+
+
+def test_a_broker_error_fails_the_run_instead_of_running_it_in_the_api(db, monkeypatch):
+    run_id = seed_run(db, generate_cohort("python", 4, seed=1))
+    db.execute(Run.__table__.update().where(Run.id == run_id).values(status="QUEUED"))
+    db.commit()
+
+    def broker_down(*_args, **_kwargs):
+        raise ConnectionError("redis unreachable")
+
+    threads = []
+    monkeypatch.setattr(scheduler, "USE_REDIS", True)
+    monkeypatch.setattr(run_pipeline, "apply_async", broker_down)
+    monkeypatch.setattr(threading, "Thread", lambda *args, **kwargs: threads.append(kwargs))
+
+    assert schedule_runs(db) == []
+    assert threads == []
+    db.expire_all()
+    run = db.get(Run, run_id)
+    assert run.status == "FAILED"
+    assert "redis unreachable" in run.error_message
+
+
+def test_cancelled_runs_keep_their_slot_until_the_worker_confirms(db, dispatched):
+    running = seed_run(db, generate_cohort("python", 4, seed=1))
+    dataset_id = db.get(Run, running).dataset_id
+    db.execute(Run.__table__.update().where(Run.id == running).values(status="RUNNING", heartbeat_at=datetime.utcnow()))
+    queued = queue_run(db, dataset_id)
+    waiting = queue_run(db, dataset_id)
+    done = queue_run(db, dataset_id)
+    db.execute(Run.__table__.update().where(Run.id == done).values(status="DONE"))
+    db.commit()
+
+    assert cancel_runs(db, [running, waiting, done]) == 2
+    assert statuses(db, running, queued, waiting, done) == ["CANCELLED", "QUEUED", "CANCELLED", "DONE"]
+    # a queued run is finished straight away; the running one waits for its worker
+    assert db.get(Run, waiting).finished_at is not None
+    assert db.get(Run, running).finished_at is None
+    assert schedule_runs(db) == []
+
+    RunStatusWriter(db, running).confirm_cancel()
+    assert schedule_runs(db) == [queued]
+    assert db.get(Run, running).finished_at is not None
+    assert dispatched == [queued]
+    assert cancel_runs(db, []) == 0
+
+
+def test_a_cancelled_run_whose_worker_was_lost_frees_its_slot(db, dispatched):
+    lost = seed_run(db, generate_cohort("python", 4, seed=1))
+    stale = datetime.utcnow() - timedelta(seconds=RUN_HEARTBEAT_TIMEOUT_SECONDS * 2)
+    db.execute(Run.__table__.update().where(Run.id == lost).values(status="CANCELLED", heartbeat_at=stale))
+    queued = queue_run(db, db.get(Run, lost).dataset_id)
+
+    assert schedule_runs(db) == [queued]
+
+
+def test_cancel_endpoint(api, db, pipeline, dispatched):
+    run_id = seed_run(db, generate_cohort("python", 4, seed=1))
+
+    response = api.post(f"/api/runs/{run_id}/cancel")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "CANCELLED"
+    assert response.json()["finished_at"] is None
+    assert api.post(f"/api/runs/{run_id}/cancel").status_code == 409
+    assert api.post(f"/api/runs/{uuid.uuid4()}/cancel").status_code == 404
+
+    # the worker picks the scheduled run up, stops and confirms the cancel
+    run_pipeline.run(run_id)
+    assert api.get(f"/api/runs/{run_id}").json()["finished_at"] is not None
+
+
+def test_supersede_cancels_the_datasets_unfinished_runs_and_queues_the_new_one(api, db, dispatched):
+    running = seed_run(db, generate_cohort("python", 4, seed=1))
+    dataset_id = db.get(Run, running).dataset_id
+    db.execute(Run.__table__.update().where(Run.id == running).values(heartbeat_at=datetime.utcnow()))
+    queued = queue_run(db, dataset_id)
+
+    kept = api.post("/api/runs/", json={"dataset_id": str(dataset_id)})
+    assert kept.json()["status"] == "QUEUED"
+    assert statuses(db, running, queued) == ["SCHEDULED", "QUEUED"]
+
+    response = api.post("/api/runs/", json={"dataset_id": str(dataset_id), "supersede": True})
+
+    assert response.status_code == 201
+    # the superseded run still holds the dataset's slot until its worker stops
+    assert response.json()["status"] == "QUEUED"
+    assert statuses(db, running, queued, kept.json()["id"]) == ["CANCELLED"] * 3
+    assert dispatched == []
+
+    RunStatusWriter(db, running).confirm_cancel()
+    assert schedule_runs(db) == [response.json()["id"]]
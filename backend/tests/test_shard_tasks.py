@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app import tasks
+from app.models.models import MatchEvidence, PairResult, Run, RunScoreBin, RunShard
+from benchmarks.cohort import generate_cohort
+from benchmarks.run import seed_run
+
+
+def rerun(db, run_id):
+    # a second run over the same dataset, so both see the same file ids
+    run = Run(dataset_id=db.get(Run, run_id).dataset_id, status="SCHEDULED", stage="INGEST", config_json={})
+    db.add(run)
+    db.commit()
+    return str(run.id)
+
+
+def run_sharded(monkeypatch, run_id, shard_files=4):
+    monkeypatch.setattr(tasks, "COMPARE_SHARD_FILES", shard_files)
+    monkeypatch.setattr(tasks, "USE_REDIS", True)
+    tasks.run_pipeline.run(run_id)
+
+
+def run_results(db, run_id):
+    pairs = {
+        (str(row.file_a_id), str(row.file_b_id)): row.final_score
+        for row in db.execute(select(PairResult).where(PairResult.run_id == run_id)).scalars()
+    }
+    evidence = dict(
+        db.execute(
+            select(MatchEvidence.kind, func.count(MatchEvidence.id))
+            .where(MatchEvidence.run_id == run_id)
+            .group_by(MatchEvidence.kind)
+        ).all()
+    )
+    bins = [
+        (row.bin, row.pair_count, row.stored_count)
+        for row in db.execute(
+            select(RunScoreBin).where(RunScoreBin.run_id == run_id).order_by(RunScoreBin.bin)
+        ).scalars()
+    ]
+    return pairs, evidence, bins
+
+
+def test_sharded_run_matches_the_in_process_run(pipeline, monkeypatch):
+    db = pipeline()
+    in_process = seed_run(db, generate_cohort("python", 10, seed=4))
+    sharded = rerun(db, in_process)
+
+    tasks.run_pipeline.run(in_process)
+    run_sharded(monkeypatch, sharded)
+
+    db.expire_all()
+    assert db.get(Run, sharded).status == "DONE"
+    assert db.get(Run, sharded).progress_pct == 100
+    shard_states = db.execute(select(RunShard.status).where(RunShard.run_id == sharded)).scalars().all()
+    assert len(shard_states) > 1 and set(shard_states) == {"DONE"}
+    expected = run_results(db, in_process)
+    assert expected[0]
+    assert run_results(db, sharded) == expected
+
+
+def test_resumed_dispatch_only_sends_unfinished_shards(pipeline, monkeypatch):
+    db = pipeline()
+    run_id = seed_run(db, generate_cohort("python", 10, seed=4))
+    sent = []
+    monkeypatch.setattr(tasks, "chord", lambda header: (lambda callback: sent.append([sig.args for sig in header])))
+
+    run_sharded(monkeypatch, run_id)
+    first = sent[-1]
+    db.execute(RunShard.__table__.update().where(RunShard.run_id == run_id, RunShard.seq == 0).values(status="DONE"))
+    db.commit()
+    run_sharded(monkeypatch, run_id)
+
+    assert len(first) > 1
+    assert sent[-1] == [args for args in first if args[1] != 0]
+
+
+def test_shards_and_finalize_leave_a_failed_run_alone(pipeline, monkeypatch):
+    db = pipeline()
+    run_id = seed_run(db, generate_cohort("python", 10, seed=4))
+    monkeypatch.setattr(tasks, "chord", lambda header: (lambda callback: None))
+    run_sharded(monkeypatch, run_id)
+
+    tasks.fail_run.run(None, RuntimeError("shard 1 crashed"), None, run_id)
+    tasks.compare_shard.run(run_id, 0)
+    tasks.finalize_run.run(run_id)
+
+    db.expire_all()
+    run = db.get(Run, run_id)
+    assert run.status == "FAILED"
+    assert run.error_message == "shard 1 crashed"
+    assert db.execute(select(RunShard.status).where(RunShard.run_id == run_id, RunShard.seq == 0)).scalar_one() == "PENDING"
+    assert db.execute(select(func.count(PairResult.id)).where(PairResult.run_id == run_id)).scalar_one() == 0
+
+
+@pytest.mark.parametrize("shard_files", [0, 6])
+def test_clone_evidence_is_only_kept_for_stored_pairs(pipeline, monkeypatch, shard_files):
+    db = pipeline()
+    # 20 files give three clone pairs, one of them scoring below this floor
+    run_id = seed_run(db, generate_cohort("python", 20, seed=4))
+    db.execute(Run.__table__.update().where(Run.id == run_id).values(config_json={"result_floor": 0.35}))
+    db.commit()
+
+    run_sharded(monkeypatch, run_id, shard_files)
+
+    clone_pairs = set(
+        db.execute(
+            select(MatchEvidence.file_a_id, MatchEvidence.file_b_id).where(
+                MatchEvidence.run_id == run_id, MatchEvidence.kind == "CLONE"
+            )
+        ).all()
+    )
+    stored = set(db.execute(select(PairResult.file_a_id, PairResult.file_b_id).where(PairResult.run_id == run_id)).all())
+    assert len(clone_pairs) == 2
+    assert clone_pairs <= stored
+
+
+def test_shards_keep_the_run_heartbeat_fresh(pipeline, monkeypatch):
+    db = pipeline()
+    run_id = seed_run(db, generate_cohort("python", 10, seed=4))
+    monkeypatch.setattr(tasks, "chord", lambda header: (lambda callback: None))
+    run_sharded(monkeypatch, run_id)
+    stale = datetime.utcnow() - timedelta(hours=1)
+    db.execute(Run.__table__.update().where(Run.id == run_id).values(heartbeat_at=stale))
+    db.commit()
+
+    tasks.compare_shard.run(run_id, 0)
+
+    db.expire_all()
+    shard = db.execute(select(RunShard).where(RunShard.run_id == run_id, RunShard.seq == 0)).scalar_one()
+    assert shard.status == "DONE" and shard.started_at is not None
+    run = db.get(Run, run_id)
+    assert run.heartbeat_at.replace(tzinfo=None) > stale
+    assert 55 < run.progress_pct < 75
+
+
+def test_shard_stops_between_chunks_once_its_run_is_cancelled(pipeline, monkeypatch):
+    db = pipeline()
+    run_id = seed_run(db, generate_cohort("python", 10, seed=4))
+    monkeypatch.setattr(tasks, "chord", lambda header: (lambda callback: None))
+    run_sharded(monkeypatch, run_id)
+    scored = []
+
+    def cancel_after_first_pair(heartbeat, done, total):
+        scored.append(done)
+        db.execute(Run.__table__.update().where(Run.id == run_id).values(status="CANCELLED"))
+        db.commit()
+        heartbeat.beat()
+
+    monkeypatch.setattr(tasks.RunHeartbeat, "__call__", cancel_after_first_pair)
+
+    tasks.compare_shard.run(run_id, 0)
+
+    db.expire_all()
+    assert scored == [1]
+    assert db.execute(select(RunShard.status).where(RunShard.run_id == run_id, RunShard.seq == 0)).scalar_one() == "PENDING"
+    assert db.execute(select(func.count(PairResult.id)).where(PairResult.run_id == run_id)).scalar_one() == 0
@@ -1,6 +1,11 @@
+from app.pipeline.ast.run_stage import prepare_ast_file, prepare_ast_source
+from app.pipeline.ingest import ingest_file
 from app.pipeline.token.run_stage import (
     compare_prepared_token_files,
+    deserialize_fingerprints,
+    fingerprint_hash64,
     prepare_token_file,
+    prepare_token_source,
     serialize_fingerprints,
 )
 
@@ -80,9 +85,90 @@ def test_compare_prepared_token_files_ranks_similar_pair_higher():
     assert comparisons[0]["file_b_id"] == "file-b"
     assert comparisons[0]["fingerprint_score"] > comparisons[-1]["fingerprint_score"]
     assert len(comparisons[0]["evidence"]) > 0
+    # evidence names the full SHA-256 fingerprints, as in the prepared files
+    shared = set(file_a.fingerprints) & set(file_b.fingerprints)
+    assert comparisons[0]["matching_fingerprints"] == sorted(shared)
+    assert {item["fingerprint"] for item in comparisons[0]["evidence"]} == shared
 
 
 def test_serialize_fingerprints_returns_bytes():
     payload = serialize_fingerprints(["a", "b", "c"])
     assert isinstance(payload, bytes)
     assert b"[" in payload
+
+
+def test_stored_fingerprints_round_trip_for_resumed_runs():
+    prepared = prepare_token_file(file_id="f1", path="main.py", content=b"def add(a, b):\n    return a + b\n")
+
+    restored = deserialize_fingerprints(serialize_fingerprints(prepared.fingerprints))
+
+    assert restored == prepared.fingerprints
+
+
+def test_ingested_source_prepares_like_raw_content():
+    content = b"def add(a, b):\n    return a + b\n"
+    ingested = ingest_file(file_id="file-a", path="studentA/add.py", content=content)
+
+    assert ingested.decoded
+    assert ingested.language == "python"
+
+    from_source = prepare_token_source(
+        file_id=ingested.file_id,
+        path=ingested.path,
+        source_code=ingested.source_code,
+        language=ingested.language,
+        k=3,
+    )
+    from_content = prepare_token_file(file_id="file-a", path="studentA/add.py", content=content, k=3)
+    assert from_source == from_content
+
+    ast_from_source = prepare_ast_source(
+        file_id=ingested.file_id,
+        path=ingested.path,
+        source_code=ingested.source_code,
+        language=ingested.language,
+    )
+    ast_from_content = prepare_ast_file(file_id="file-a", path="studentA/add.py", content=content)
+    assert ast_from_source.handoff == ast_from_content.handoff
+
+
+def test_ingest_file_marks_missing_content_undecoded():
+    ingested = ingest_file(file_id="empty", path="studentA/blob.py", content=None)
+
+    assert not ingested.decoded
+    assert ingested.source_code is None
+
+
+def test_compact_token_file_keeps_only_comparison_inputs():
+    prepared = prepare_token_file(
+        file_id="file-a",
+        path="studentA/add.py",
+        content=b"def add(a, b):\n    return a + b\n",
+        k=3,
+    )
+    other = prepare_token_file(
+        file_id="file-b",
+        path="studentB/add.py",
+        content=b"def add(x, y):\n    return x + y\n",
+        k=3,
+    )
+
+    compact = prepared.compact()
+    assert not hasattr(compact, "source_code") and not hasattr(compact, "__dict__")
+    assert list(compact.fingerprint_hashes) == [fingerprint_hash64(fp) for fp in prepared.fingerprints]
+    assert [compact.fingerprint(pos) for pos in range(len(prepared.fingerprints))] == prepared.fingerprints
+    assert compare_prepared_token_files([compact, other.compact()], k=3) == compare_prepared_token_files(
+        [prepared, other], k=3
+    )
+
+
+def test_compare_prepared_token_files_reports_pair_progress():
+    files = [
+        prepare_token_file(file_id=f"file-{idx}", path=path, content=b"def add(a, b):\n    return a + b\n", k=3)
+        for idx, path in enumerate(["a/add.py", "b/add.py", "c/add.py", "d/add.js"])
+    ]
+    calls = []
+
+    compare_prepared_token_files(files, k=3, progress=lambda done, total: calls.append((done, total)))
+
+    assert calls == [(1, 3), (2, 3), (3, 3)]
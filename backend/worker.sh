@@ -0,0 +1,8 @@
+#!/bin/sh
+set -e
+
+# celery worker; arguments (queues, pool, concurrency) are passed through
+export PYTHONPATH=/app:$PYTHONPATH
+cd /app
+. ./metrics_dir.sh
+exec celery -A app.celery:celery_app worker --loglevel=info "$@"
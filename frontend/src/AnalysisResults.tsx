@@ -9,7 +9,13 @@
 // which the popstate listener catches and closes the comparison view correctly.
 // This prevents the back button from skipping past the results list to the dataset.
 import { useEffect, useState } from "react";
-import { getRunResults, getRunExportPdfUrl, type SimilarityResult } from "./api/runs";
+import {
+  getRunResults,
+  getRunHistogram,
+  getRunExportPdfUrl,
+  type ScoreHistogram,
+  type SimilarityResult,
+} from "./api/runs";
 import SideBySideComparison from "./SideBySideComparison";
 
 type NavItem = {
@@ -53,6 +59,7 @@ export default function AnalysisResults({
   onNavChange,
 }: Props) {
   const [resultRows, setResultRows] = useState<SimilarityResult[]>([]);
+  const [histogram, setHistogram] = useState<ScoreHistogram | null>(null);
   const [isLoading, setIsLoading] = useState(true);
   const [loadError, setLoadError] = useState<string | null>(null);
   const [sortBy, setSortBy] = useState<"similarity" | "file_a">("similarity");
@@ -62,8 +69,9 @@ export default function AnalysisResults({
     setIsLoading(true);
     setLoadError(null);
     try {
-      const rows = await getRunResults(runId);
+      const [rows, scoreHistogram] = await Promise.all([getRunResults(runId), getRunHistogram(runId)]);
       setResultRows(rows);
+      setHistogram(scoreHistogram);
     } catch (error) {
       console.error("load results", error);
       setLoadError("Failed to load results.");
@@ -154,11 +162,20 @@ export default function AnalysisResults({
         <div>
           <p className="section-kicker">Results</p>
           <h2>Analysis Results</h2>
-          <p className="page-subtitle">Review flagged file pairs.</p>
+          <p className="page-subtitle">
+            Review flagged file pairs.
+            {histogram && histogram.pairs_compared > histogram.pairs_stored
+              ? ` ${histogram.pairs_compared - histogram.pairs_stored} of ${histogram.pairs_compared} compared pairs scored below ${Math.round(histogram.floor * 100)}% and are not listed.`
+              : ""}
+          </p>
         </div>
       </div>
 
       <div className="stats-row results-summary-row">
+        <div className="stat-card">
+          <div className="stat-label">Compared</div>
+          <div className="stat-value">{histogram?.pairs_compared ?? resultRows.length}</div>
+        </div>
         <div className="stat-card">
           <div className="stat-label">Total</div>
           <div className="stat-value">{resultRows.length}</div>
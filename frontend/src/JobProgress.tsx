@@ -10,7 +10,7 @@
 // and provide feedback to the user until the analysis is complete or fails.
 // job progress is the UI component that manages and displays the analysis job status to the user.
 import { useState, useEffect, useRef } from "react";
-import { getRun, type Run } from "./api/runs";
+import { cancelRun, getRun, getRunWarnings, resumeRun, type Run, type RunWarning } from "./api/runs";
 
 interface Props {
   runId: string;
@@ -29,11 +29,8 @@ type PollTimerRef = {
   current: ReturnType<typeof setInterval> | null;
 };
 
-type RunWarning = {
-  stage?: string;
-  path?: string;
-  reason?: string;
-};
+const MAX_SHOWN_WARNINGS = 8;
+
 // helper to stop polling timer
 function stopTimer(timerRef: PollTimerRef) {
   // stop polling timer
@@ -46,6 +43,8 @@ function getRunTitle(run: Run): string {
   // title by run status
   if (run.status === "DONE") return "Analysis Complete";
   if (run.status === "FAILED") return "Analysis Failed";
+  if (run.status === "CANCELLED") return "Analysis Cancelled";
+  if (run.status === "QUEUED" || run.status === "SCHEDULED") return "Analysis Queued";
   return "Analysis In Progress";
 }
 // helper to format duration
@@ -86,6 +85,8 @@ function getAnalysisDuration(run: Run): string | null {
 export default function JobProgress({ runId, onComplete, onCancel }: Props) {
   const [runData, setRunData] = useState<Run | null>(null);
   const [loadError, setLoadError] = useState<string | null>(null);
+  const [warnings, setWarnings] = useState<RunWarning[]>([]);
+  const shownWarningsRef = useRef(0);
   const timerRef = useRef<ReturnType<typeof setInterval> | null>(null);
 
   const loadRunStatus = async () => {
@@ -93,7 +94,14 @@ export default function JobProgress({ runId, onComplete, onCancel }: Props) {
     try {
       const nextRun = await getRun(runId);
       setRunData(nextRun);
-      if (nextRun.status === "DONE" || nextRun.status === "FAILED") {
+      // only the first few warnings are shown; refetch while that page is not full
+      const wanted = Math.min(nextRun.warning_count ?? 0, MAX_SHOWN_WARNINGS);
+      if (wanted > shownWarningsRef.current) {
+        const page = await getRunWarnings(runId, 0, MAX_SHOWN_WARNINGS);
+        shownWarningsRef.current = page.length;
+        setWarnings(page);
+      }
+      if (nextRun.status === "DONE" || nextRun.status === "FAILED" || nextRun.status === "CANCELLED") {
         stopTimer(timerRef);
       }
     } catch (error) {
@@ -103,6 +111,29 @@ export default function JobProgress({ runId, onComplete, onCancel }: Props) {
     }
   };
 
+  const handleResume = async () => {
+    // requeue from the last checkpoint and poll again
+    try {
+      setRunData(await resumeRun(runId));
+      shownWarningsRef.current = 0;
+      stopTimer(timerRef);
+      timerRef.current = setInterval(loadRunStatus, 2000);
+    } catch (error) {
+      console.error("resume run", error);
+      setLoadError("Failed to resume run.");
+    }
+  };
+
+  const handleCancel = async () => {
+    // stop the job before leaving; the run stays resumable
+    try {
+      await cancelRun(runId);
+    } catch (error) {
+      console.error("cancel run", error);
+    }
+    onCancel();
+  };
+
   useEffect(() => {
     // start polling
     loadRunStatus();
@@ -129,12 +160,10 @@ export default function JobProgress({ runId, onComplete, onCancel }: Props) {
 
   const currentStageIdx = stages.findIndex((stage) => stage.key === runData.stage);
   const isDone = runData.status === "DONE";
-  const isFailed = runData.status === "FAILED";
+  const isFailed = runData.status === "FAILED" || runData.status === "CANCELLED";
   const fillClass = isDone ? "done" : isFailed ? "failed" : "";
   const analysisDuration = getAnalysisDuration(runData);
-  const warnings = Array.isArray(runData.config_json?.warnings)
-    ? (runData.config_json.warnings as RunWarning[])
-    : [];
+  const hiddenWarnings = Math.max(0, (runData.warning_count ?? 0) - warnings.length);
 
   return (
     <section className="flow-section progress-shell">
@@ -166,14 +195,17 @@ export default function JobProgress({ runId, onComplete, onCancel }: Props) {
           <div className="alert alert-warning">
             <strong>Analysis warnings</strong>
             <ul className="compact-list">
-              {warnings.slice(0, 8).map((warning, index) => (
-                <li key={`${warning.path ?? "run"}-${warning.reason ?? index}`}>
+              {warnings.map((warning) => (
+                <li key={warning.id}>
                   {warning.stage ? `${warning.stage}: ` : ""}
                   {warning.path ? `${warning.path} - ` : ""}
                   {warning.reason ?? "Warning recorded"}
                 </li>
               ))}
             </ul>
+            {hiddenWarnings > 0 && (
+              <p className="text-small text-muted">and {hiddenWarnings} more</p>
+            )}
           </div>
         )}
 
@@ -201,7 +233,12 @@ export default function JobProgress({ runId, onComplete, onCancel }: Props) {
           {isDone && !isFailed ? (
             <button className="btn btn-primary" onClick={onComplete}>View Results</button>
           ) : (
-            <button className="btn btn-secondary" onClick={onCancel}>{isFailed ? "Back to Dataset" : "Cancel"}</button>
+            <>
+              {isFailed && (
+                <button className="btn btn-primary" onClick={handleResume}>Resume</button>
+              )}
+              <button className="btn btn-secondary" onClick={isFailed ? onCancel : handleCancel}>{isFailed ? "Back to Dataset" : "Cancel"}</button>
+            </>
           )}
         </div>
       </div>
@@ -13,10 +13,12 @@ const API_BASE = "/api";
 export interface Run {
   id: string;
   dataset_id: string;
-  status: "QUEUED" | "RUNNING" | "DONE" | "FAILED";
+  status: "QUEUED" | "SCHEDULED" | "RUNNING" | "DONE" | "FAILED" | "CANCELLED";
   stage: "INGEST" | "TOKENS" | "AST" | "REPORT";
   progress_pct: number;
+  priority: number;
   config_json: Record<string, unknown>;
+  warning_count: number;
   error_message?: string;
   created_at: string;
   started_at?: string;
@@ -34,6 +36,32 @@ export interface SimilarityResult {
   risk: "HIGH" | "MEDIUM" | "LOW";
 }
 
+export interface ScoreBin {
+  bin: number;
+  lower: number;
+  upper: number;
+  pair_count: number;    // pairs compared in this score range
+  stored_count: number;  // of those, listed as results
+}
+
+export interface ScoreHistogram {
+  floor: number;         // pairs scoring below this are counted, not listed
+  pairs_compared: number;
+  pairs_stored: number;
+  bins: ScoreBin[];
+}
+
+export interface RunWarning {
+  id: string;
+  run_id: string;
+  seq: number;
+  stage: string;
+  path?: string | null;
+  reason: string;
+  details?: Record<string, unknown> | null;
+  created_at: string;
+}
+
 export interface MatchEvidence {
   id: string;
   run_id: string;
@@ -89,6 +117,21 @@ export async function getRun(runId: string): Promise<Run> {
   return requestJson<Run>(`${API_BASE}/runs/${runId}`);
 }
 
+export async function cancelRun(runId: string): Promise<Run> {
+  // stop a queued or running job
+  return requestJson<Run>(`${API_BASE}/runs/${runId}/cancel`, { method: "POST" });
+}
+
+export async function resumeRun(runId: string): Promise<Run> {
+  // restart a failed run from its last checkpoint
+  return requestJson<Run>(`${API_BASE}/runs/${runId}/resume`, { method: "POST" });
+}
+
+export async function getRunWarnings(runId: string, offset = 0, limit = 100): Promise<RunWarning[]> {
+  // fetch one page of run warnings
+  return requestJson<RunWarning[]>(`${API_BASE}/runs/${runId}/warnings?offset=${offset}&limit=${limit}`);
+}
+
 export async function getDatasetRunHistory(datasetId: string): Promise<Run[]> {
   // fetch all completed runs for a dataset
   return requestJson<Run[]>(`${API_BASE}/runs/dataset/${datasetId}/history`);
@@ -99,6 +142,10 @@ export async function getRunResults(runId: string): Promise<SimilarityResult[]>
   return requestJson<SimilarityResult[]>(`${API_BASE}/runs/${runId}/results`);
 }
 
+export async function getRunHistogram(runId: string): Promise<ScoreHistogram> {
+  return requestJson<ScoreHistogram>(`${API_BASE}/runs/${runId}/results/histogram`);
+}
+
 export function getRunExportPdfUrl(runId: string): string {
   return `${API_BASE}/runs/${runId}/export-pdf`;
 }